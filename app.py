@@ -9,7 +9,7 @@ from typing import Callable
 
 import streamlit as st
 
-from models.entities import Transaction
+from models.entities import Transaction, TransactionRecord
 from pages import advisor_chat, bill_upload, investment_recs, spending_insights
 from modules.analysis import compute_anomaly_report
 from utils import session as session_utils
@@ -19,7 +19,12 @@ from utils.session import (
     reset_session_state,
     switch_locale,
 )
-from utils.storage import clear_all_storage, load_from_storage
+from utils.storage import (
+    clear_all_storage,
+    iter_from_storage,
+    load_from_storage,
+    set_storage_namespace,
+)
 from utils.ui_components import responsive_width_kwargs
 from utils.design_system import inject_global_styles, render_hero_banner, COLORS, FONTS, SPACING, RADIUS
 
@@ -32,17 +37,12 @@ def restore_data_from_storage() -> None:
         return
 
     try:
-        transactions_payload = load_from_storage("transactions", []) or []
-        if transactions_payload:
-            transactions: list[Transaction] = []
-            for entry in transactions_payload:
-                if isinstance(entry, Transaction):
-                    transactions.append(entry)
-                elif isinstance(entry, dict):
-                    transactions.append(Transaction(**entry))
-            st.session_state["transactions"] = [
-                txn.model_dump(mode="json") for txn in transactions
-            ]
+        transactions: list[TransactionRecord] = []
+        for entry in iter_from_storage("transactions"):
+            if isinstance(entry, (Transaction, dict)):
+                transactions.append(TransactionRecord.from_any(entry))
+        if transactions:
+            session_utils.hydrate_transactions(transactions)
             logger.info("Restored %d transactions from storage", len(transactions))
 
         budget = load_from_storage("monthly_budget", 5000.0)
@@ -67,6 +67,7 @@ def restore_data_from_storage() -> None:
         st.session_state["data_restored"] = True
 
 
+set_storage_namespace(session_utils.resolve_user_namespace())
 restore_data_from_storage()
 
 st.set_page_config(
@@ -260,7 +261,7 @@ def _render_home() -> None:
         st.info(anomaly_message)
 
     # Calculate metrics
-    transactions = session_utils.get_transactions()
+    transactions = session_utils.get_transaction_records()
     monthly_budget = session_utils.get_monthly_budget()
     chat_history = st.session_state.get("chat_history", [])
 
@@ -400,28 +401,29 @@ PAGES: dict[str, Callable[[], None]] = {
 def _refresh_anomaly_state() -> None:
     """Recompute anomaly detection results only when transaction data changes."""
     i18n = get_i18n()
-    transactions = session_utils.get_transactions()
-    if not transactions:
+    source = st.session_state.get("transactions", [])
+    if not source:
         session_utils.update_anomaly_state(
             active=[],
             message=i18n.t("app.no_transaction_data"),
         )
         return
 
-    # Performance optimization: Only recompute if data changed
-    current_hash = hash(tuple((t.id, t.amount, t.date) for t in transactions))
-    last_hash = st.session_state.get("anomaly_last_hash")
-
-    if current_hash == last_hash:
-        # Data unchanged, skip expensive computation
+    # 账本版本号在每次写入时递增，比较版本即可判断是否变化，与账本大小无关
+    whitelist = session_utils.get_trusted_merchants()
+    ledger_key = session_utils.get_ledger_key()
+    if st.session_state.get("anomaly_last_key") == (ledger_key, whitelist):
         return
 
+    # 增量引擎已在写入账本时以 O(k) 更新了均值/方差，这里只做向量化打分
+    engine = session_utils.get_anomaly_engine()
     report = compute_anomaly_report(
-        transactions,
-        whitelist_merchants=session_utils.get_trusted_merchants(),
+        session_utils.get_ledger(),
+        whitelist_merchants=whitelist,
+        stats=engine.stats(exclude_merchants=whitelist),
     )
     session_utils.sync_anomaly_state(report)
-    st.session_state["anomaly_last_hash"] = current_hash
+    st.session_state["anomaly_last_key"] = (ledger_key, whitelist)
 
 
 def main() -> None:
@@ -486,7 +488,7 @@ def main() -> None:
 
         # ============ 智能导航引导 (紧凑版) ============
         st.markdown("---")
-        transactions = session_utils.get_transactions()
+        transactions = session_utils.get_transaction_records()
         has_transactions = len(transactions) > 0
         has_chat_history = len(st.session_state.get("chat_history", [])) > 0
         has_analysis = len(st.session_state.get("analysis_summary", [])) > 0
@@ -606,7 +608,13 @@ def main() -> None:
             ):
                 if st.session_state.get("confirm_clear", False):
                     clear_all_storage()
-                    protected_keys = {"selected_page", "locale", "data_restored"}
+                    protected_keys = {
+                        "selected_page",
+                        "locale",
+                        "data_restored",
+                        "user_id",
+                        "storage_namespace",
+                    }
                     for state_key in list(st.session_state.keys()):
                         if state_key not in protected_keys:
                             del st.session_state[state_key]
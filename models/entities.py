@@ -3,7 +3,8 @@
 from __future__ import annotations
 
 import datetime as dt
-from typing import List, Optional
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
@@ -56,6 +57,196 @@ class Transaction(BaseModel):
     )
 
 
+# 明细按 LineItem 字段顺序存为元组：(description, quantity, unit_price, amount, discount)
+_LineItemTuple = Tuple[str, float, float, float, Optional[float]]
+# 账本中的日期高度重复，共享同一个 date 对象即可
+_DATE_POOL: Dict[dt.date, dt.date] = {}
+
+
+def _intern_text(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_date(value: dt.date) -> dt.date:
+    return _DATE_POOL.setdefault(value, value)
+
+
+class TransactionRecord:
+    """
+    Compact, read-only counterpart of `Transaction` for large ledgers.
+
+    Uses ``__slots__``, interns merchant/category/currency/payment strings and
+    dates, and stores line items as tuples. Fields mirror `Transaction`
+    exactly, so :meth:`to_model` / :meth:`from_model` round-trip losslessly;
+    use the pydantic model at API boundaries and this record everywhere else.
+    """
+
+    __slots__ = (
+        "id",
+        "date",
+        "merchant",
+        "category",
+        "amount",
+        "currency",
+        "payment_method",
+        "raw_text",
+        "line_items",
+        "subtotal",
+        "total_discount",
+        "tax",
+        "receipt_number",
+        "receipt_time",
+    )
+
+    def __init__(
+        self,
+        id: str,  # pylint: disable=redefined-builtin
+        date: dt.date,
+        merchant: str,
+        category: str,
+        amount: float,
+        currency: str = "CNY",
+        payment_method: Optional[str] = None,
+        raw_text: Optional[str] = None,
+        line_items: Iterable[_LineItemTuple] = (),
+        subtotal: Optional[float] = None,
+        total_discount: Optional[float] = None,
+        tax: Optional[float] = None,
+        receipt_number: Optional[str] = None,
+        receipt_time: Optional[dt.datetime] = None,
+    ) -> None:
+        setter = object.__setattr__
+        setter(self, "id", id)
+        setter(self, "date", _intern_date(date))
+        setter(self, "merchant", _intern_text(merchant))
+        setter(self, "category", _intern_text(category))
+        setter(self, "amount", amount)
+        setter(self, "currency", _intern_text(currency))
+        setter(self, "payment_method", _intern_text(payment_method))
+        setter(self, "raw_text", raw_text)
+        setter(self, "line_items", tuple(line_items) or ())
+        setter(self, "subtotal", subtotal)
+        setter(self, "total_discount", total_discount)
+        setter(self, "tax", tax)
+        setter(self, "receipt_number", receipt_number)
+        setter(self, "receipt_time", receipt_time)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("TransactionRecord is read-only")
+
+    def __reduce__(self) -> tuple:
+        # 只读记录不能按默认方式逐个 setattr 还原，改为重新调用构造函数
+        return (self.__class__, tuple(getattr(self, name) for name in self.__slots__))
+
+    def __copy__(self) -> "TransactionRecord":
+        return self
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "TransactionRecord":
+        # 不可变对象，深拷贝直接共享
+        return self
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TransactionRecord):
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return (
+            f"TransactionRecord(id={self.id!r}, date={self.date!r}, "
+            f"merchant={self.merchant!r}, category={self.category!r}, "
+            f"amount={self.amount!r})"
+        )
+
+    @classmethod
+    def from_model(cls, txn: Transaction) -> "TransactionRecord":
+        return cls(
+            txn.id,
+            txn.date,
+            txn.merchant,
+            txn.category,
+            txn.amount,
+            txn.currency,
+            txn.payment_method,
+            txn.raw_text,
+            (
+                (li.description, li.quantity, li.unit_price, li.amount, li.discount)
+                for li in txn.line_items
+            ),
+            txn.subtotal,
+            txn.total_discount,
+            txn.tax,
+            txn.receipt_number,
+            txn.receipt_time,
+        )
+
+    @classmethod
+    def from_any(cls, entry: "Transaction | TransactionRecord | dict") -> "TransactionRecord":
+        """Convert a model, record or raw dict (validated via `Transaction`)."""
+        if isinstance(entry, TransactionRecord):
+            return entry
+        if not isinstance(entry, Transaction):
+            entry = Transaction(**entry)
+        return cls.from_model(entry)
+
+    def to_model(self) -> Transaction:
+        """Rebuild the pydantic model without re-validating (data already is)."""
+        return Transaction.model_construct(
+            id=self.id,
+            date=self.date,
+            merchant=self.merchant,
+            category=self.category,
+            amount=self.amount,
+            currency=self.currency,
+            payment_method=self.payment_method,
+            raw_text=self.raw_text,
+            line_items=[
+                LineItem.model_construct(
+                    description=d, quantity=q, unit_price=p, amount=a, discount=x
+                )
+                for d, q, p, a, x in self.line_items
+            ],
+            subtotal=self.subtotal,
+            total_discount=self.total_discount,
+            tax=self.tax,
+            receipt_number=self.receipt_number,
+            receipt_time=self.receipt_time,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready dict, identical to ``Transaction.model_dump(mode="json")``."""
+        return {
+            "id": self.id,
+            "date": self.date.isoformat(),
+            "merchant": self.merchant,
+            "category": self.category,
+            "amount": self.amount,
+            "currency": self.currency,
+            "payment_method": self.payment_method,
+            "raw_text": self.raw_text,
+            "line_items": [
+                {
+                    "description": d,
+                    "quantity": q,
+                    "unit_price": p,
+                    "amount": a,
+                    "discount": x,
+                }
+                for d, q, p, a, x in self.line_items
+            ],
+            "subtotal": self.subtotal,
+            "total_discount": self.total_discount,
+            "tax": self.tax,
+            "receipt_number": self.receipt_number,
+            "receipt_time": (
+                self.receipt_time.isoformat() if self.receipt_time else None
+            ),
+        }
+
+
 class SpendingInsight(BaseModel):
     """High-level summary of spending behaviour for the dashboard."""
 
@@ -5,18 +5,38 @@ from __future__ import annotations
 import json
 import logging
 import os
-from collections import defaultdict
-from typing import Dict, Iterable, List, Sequence, Set
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
 
 import numpy as np
 import pandas as pd
-from openai import OpenAI
 
 from models.entities import SpendingInsight, Transaction
+from modules.anomaly_engine import RunningStats
+from services.llm_clients import get_openai_client
+from services.llm_scheduler import create_chat_completion
 from utils.error_handling import safe_call
+from utils.ledger import Ledger, as_ledger
 
 logger = logging.getLogger(__name__)
 
+ANOMALY_MODES = ("global", "grouped")
+# 分组样本少于该数量时，中位数/MAD 不可靠，回退到全局模型
+ROBUST_MIN_GROUP_SIZE = 5
+# 正态分布下 MAD ≈ 0.6745σ，换算后鲁棒分数与 z-score 同尺度，可共用阈值
+MAD_TO_SIGMA = 0.6745
+# MAD 为0（半数以上金额相同，如房租）时改用平均绝对偏差，正态下 σ ≈ 1.2533·MeanAD
+MEAN_AD_TO_SIGMA = 1.2533
+# 尺度下限取两者较大值，完全相同的分组得分为0而不是被丢弃：
+# 相对下限，无量纲，为组内金额中位数的比例（0.01 即中位数的1%）
+ROBUST_SCALE_REL_FLOOR = 0.01
+# 绝对下限，单位为元（0.01 即1分钱），防止中位数接近0时尺度为0
+ROBUST_SCALE_ABS_FLOOR = 0.01
+ANOMALY_REASONS = {
+    "global": "高于平均值 {z:.1f}σ",
+    "merchant": "高于该商户常规水平 {z:.1f}σ",
+    "category": "高于该类别常规水平 {z:.1f}σ",
+}
+
 
 @safe_call(timeout=30, fallback=None, error_message="LLM建议生成失败")
 def _generate_personalized_actions_llm(
@@ -44,7 +64,7 @@ def _generate_personalized_actions_llm(
         logger.warning("OPENAI_API_KEY未配置，跳过LLM建议生成")
         return None
 
-    client = OpenAI(api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL"))
+    client = get_openai_client(api_key, os.getenv("OPENAI_BASE_URL"))
 
     # 根据语言选择提示词
     if locale == "en_US":
@@ -95,7 +115,8 @@ Requirements:
 """
 
     try:
-        response = client.chat.completions.create(
+        response = create_chat_completion(
+            client,
             model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
             temperature=0.3,  # 允许一定创造性
             messages=[
@@ -157,36 +178,24 @@ Requirements:
         return None
 
 
-def _to_dataframe(transactions: Sequence[Transaction]) -> pd.DataFrame:
-    """Convert transactions into a pandas DataFrame for numerical work."""
-    if not transactions:
-        return pd.DataFrame(columns=["date", "category", "amount"])
+def _to_dataframe(transactions: Ledger | Iterable[Transaction]) -> pd.DataFrame:
+    """Return the date-sorted columnar ledger as a DataFrame for numerical work."""
+    return as_ledger(transactions).to_frame()
 
-    data = [
-        {
-            "date": pd.to_datetime(txn.date),
-            "category": txn.category,
-            "amount": float(txn.amount),
-            "merchant": txn.merchant,
-            "id": txn.id,
-        }
-        for txn in transactions
-    ]
-    df = pd.DataFrame(data)
-    df.sort_values("date", inplace=True)
-    return df
 
-
-def calculate_category_totals(transactions: Iterable[Transaction]) -> Dict[str, float]:
+def calculate_category_totals(
+    transactions: Ledger | Iterable[Transaction],
+) -> Dict[str, float]:
     """Aggregate spending totals per category."""
-    totals: Dict[str, float] = defaultdict(float)
-    for txn in transactions:
-        totals[txn.category] += float(txn.amount)
-    return dict(totals)
+    df = _to_dataframe(transactions)
+    if df.empty:
+        return {}
+    totals = df.groupby("category", observed=True, sort=False)["amount"].sum()
+    return {str(category): float(amount) for category, amount in totals.items()}
 
 
 def calculate_spending_trend(
-    transactions: Iterable[Transaction],
+    transactions: Ledger | Iterable[Transaction],
     frequency: str = "M",
 ) -> pd.DataFrame:
     """
@@ -194,7 +203,6 @@ def calculate_spending_trend(
 
     Returns a DataFrame with columns ['period', 'amount'].
     """
-    transactions = list(transactions)
     df = _to_dataframe(transactions)
     if df.empty:
         return pd.DataFrame(columns=["period", "amount"])
@@ -205,64 +213,179 @@ def calculate_spending_trend(
     return resampled
 
 
+def _zscores(
+    amounts: pd.Series, stats: RunningStats | None = None
+) -> np.ndarray | None:
+    """
+    Population z-scores of ``amounts``; None when the spread is zero.
+
+    ``stats`` supplies precomputed mean/std (e.g. from the incremental engine)
+    and is ignored unless it describes exactly this sample size.
+    """
+    values = amounts.to_numpy(dtype="float64")
+    if values.size == 0:
+        return None
+    if stats is not None and stats.count == values.size:
+        mean, std = stats.mean, stats.std
+    else:
+        mean, std = values.mean(), values.std()
+    if std == 0:
+        return None
+    return (values - mean) / std
+
+
+def _robust_group_scores(
+    df: pd.DataFrame, group: str, min_size: int
+) -> np.ndarray:
+    """
+    Median/MAD scores of each amount within its ``group`` in one groupby pass.
+
+    A zero MAD falls back to the mean absolute deviation, and the scale is
+    floored relative to the median, so constant groups score 0 and a spike
+    inside one scores high. Rows whose group is smaller than ``min_size``
+    get NaN.
+    """
+    keys = df[group]
+    amounts = df["amount"]
+    grouped = amounts.groupby(keys, observed=True)
+    median = grouped.transform("median")
+    deviation = amounts - median
+    abs_deviation = deviation.abs().groupby(keys, observed=True)
+    sigma = abs_deviation.transform("median") / MAD_TO_SIGMA
+    sigma = sigma.where(sigma > 0, abs_deviation.transform("mean") * MEAN_AD_TO_SIGMA)
+    floor = np.maximum(median.abs() * ROBUST_SCALE_REL_FLOOR, ROBUST_SCALE_ABS_FLOOR)
+    sigma = np.maximum(sigma, floor)
+    size = grouped.transform("size")
+    scores = (deviation / sigma).where(size >= min_size)
+    return scores.to_numpy(dtype="float64")
+
+
+def _grouped_scores(
+    df: pd.DataFrame,
+    global_scores: np.ndarray | None,
+    min_size: int = ROBUST_MIN_GROUP_SIZE,
+) -> Tuple[np.ndarray | None, np.ndarray]:
+    """
+    Score each row with its merchant model, else category model, else global.
+
+    Returns the score vector and a parallel array naming the model used.
+    """
+    merchant_scores = _robust_group_scores(df, "merchant", min_size)
+    category_scores = _robust_group_scores(df, "category", min_size)
+    fallback = (
+        global_scores
+        if global_scores is not None
+        else np.full(len(df), np.nan, dtype="float64")
+    )
+    use_merchant = ~np.isnan(merchant_scores)
+    use_category = ~use_merchant & ~np.isnan(category_scores)
+    scores = np.where(
+        use_merchant,
+        merchant_scores,
+        np.where(use_category, category_scores, fallback),
+    )
+    models = np.select(
+        [use_merchant, use_category], ["merchant", "category"], default="global"
+    )
+    if np.isnan(scores).all():
+        return None, models
+    return np.nan_to_num(scores, nan=0.0), models
+
+
+def _resolve_anomaly_mode(mode: str | None) -> str:
+    mode = (mode or os.getenv("WEFINANCE_ANOMALY_MODE") or "global").strip().lower()
+    if mode not in ANOMALY_MODES:
+        logger.warning("Unknown anomaly mode %s, using global", mode)
+        return "global"
+    return mode
+
+
+def _emit_anomalies(
+    df: pd.DataFrame,
+    z_scores: np.ndarray,
+    mask: np.ndarray,
+    models: np.ndarray | None = None,
+) -> List[dict]:
+    """Convert the flagged rows into anomaly records column by column."""
+    flagged = df[mask]
+    flagged_z = z_scores[mask].tolist()
+    flagged_models = (
+        models[mask].tolist() if models is not None else ["global"] * len(flagged_z)
+    )
+    return [
+        {
+            "transaction_id": txn_id,
+            "date": txn_date,
+            "category": category,
+            "merchant": merchant,
+            "amount": amount,
+            "z_score": z_val,
+            "reason": ANOMALY_REASONS[model].format(z=abs(z_val)),
+            "model": model,
+            "status": "new",
+        }
+        for txn_id, txn_date, category, merchant, amount, z_val, model in zip(
+            flagged["id"].tolist(),
+            flagged["date"].dt.date.tolist(),
+            flagged["category"].astype(object).tolist(),
+            flagged["merchant"].astype(object).tolist(),
+            flagged["amount"].tolist(),
+            flagged_z,
+            flagged_models,
+        )
+    ]
+
+
 def _compute_zscore_anomalies(
-    transactions: Sequence[Transaction],
+    transactions: Ledger | Sequence[Transaction],
     threshold: float,
 ) -> List[dict]:
     """Internal helper computing z-score anomalies for a given threshold."""
     df = _to_dataframe(transactions)
-    if df.empty:
+    z_scores = _zscores(df["amount"])
+    if z_scores is None:
         return []
-
-    amounts = df["amount"]
-    mean = amounts.mean()
-    std = amounts.std(ddof=0)
-    if std == 0:
-        return []
-
-    df["z_score"] = (amounts - mean) / std
-    anomalies = df[np.abs(df["z_score"]) >= threshold]
-    results: List[dict] = []
-    for _, row in anomalies.iterrows():
-        z_val = float(row["z_score"])
-        results.append(
-            {
-                "transaction_id": row["id"],
-                "date": row["date"].date(),
-                "category": row["category"],
-                "merchant": row["merchant"],
-                "amount": float(row["amount"]),
-                "z_score": z_val,
-                "reason": f"高于平均值 {abs(z_val):.1f}σ",
-                "status": "new",
-            }
-        )
-    return results
+    return _emit_anomalies(df, z_scores, np.abs(z_scores) >= threshold)
 
 
 def compute_anomaly_report(
-    transactions: Iterable[Transaction],
+    transactions: Ledger | Iterable[Transaction],
     *,
     base_threshold: float = 2.5,
     whitelist_merchants: Iterable[str] | None = None,
+    stats: RunningStats | None = None,
+    mode: str | None = None,
 ) -> Dict[str, object]:
     """
     Generate anomaly detection results along with contextual metadata.
 
+    Z-scores are computed once; the base and adaptive thresholds are all
+    evaluated against the same vector. Pass ``stats`` (mean/variance of the
+    whitelist-filtered sample, see ``IncrementalAnomalyEngine.stats``) to skip
+    recomputing them.
+
+    ``mode="grouped"`` scores each transaction against robust median/MAD
+    statistics of its merchant, then its category, falling back to the global
+    z-score for sparse groups; each item's ``model`` names the one that
+    flagged it. Defaults to ``WEFINANCE_ANOMALY_MODE`` (global).
+
     Returns a dictionary containing:
     - items: List[dict] 异常记录
     - threshold_used: float 实际使用的阈值
     - adaptive: bool 是否动态调整过阈值
     - sample_size: int 用于检测的交易数
     - sensitivity: str 检测灵敏度（normal / reduced）
+    - mode: str 检测模式（global / grouped）
     - message: Optional[str] 提示文案
     """
-    transactions = list(transactions)
+    mode = _resolve_anomaly_mode(mode)
     merchant_whitelist: Set[str] = {
         m.strip() for m in whitelist_merchants or [] if m.strip()
     }
-    filtered = [txn for txn in transactions if txn.merchant not in merchant_whitelist]
-    sample_size = len(filtered)
+    df = _to_dataframe(transactions)
+    if merchant_whitelist:
+        df = df[~df["merchant"].isin(merchant_whitelist)]
+    sample_size = len(df)
 
     report: Dict[str, object] = {
         "items": [],
@@ -270,6 +393,7 @@ def compute_anomaly_report(
         "adaptive": False,
         "sample_size": sample_size,
         "sensitivity": "normal",
+        "mode": mode,
     }
 
     if sample_size < 3:
@@ -282,18 +406,26 @@ def compute_anomaly_report(
         report["sensitivity"] = "reduced"
         report["message"] = "spending.message_reduced_sensitivity"
 
-    anomalies = _compute_zscore_anomalies(filtered, applied_threshold)
-
-    if not anomalies and sample_size >= 10:
-        for candidate in (2.0, 1.5):
-            if candidate >= applied_threshold:
-                continue
-            candidate_anomalies = _compute_zscore_anomalies(filtered, candidate)
-            if candidate_anomalies:
-                anomalies = candidate_anomalies
-                applied_threshold = candidate
-                report["adaptive"] = True
-                break
+    anomalies: List[dict] = []
+    models: np.ndarray | None = None
+    z_scores = _zscores(df["amount"], stats)
+    if mode == "grouped":
+        z_scores, models = _grouped_scores(df, z_scores)
+    if z_scores is not None:
+        abs_z = np.abs(z_scores)
+        mask = abs_z >= applied_threshold
+        if not mask.any() and sample_size >= 10:
+            for candidate in (2.0, 1.5):
+                if candidate >= applied_threshold:
+                    continue
+                candidate_mask = abs_z >= candidate
+                if candidate_mask.any():
+                    mask = candidate_mask
+                    applied_threshold = candidate
+                    report["adaptive"] = True
+                    break
+        if mask.any():
+            anomalies = _emit_anomalies(df, z_scores, mask, models)
 
     if anomalies:
         for item in anomalies:
@@ -307,7 +439,7 @@ def compute_anomaly_report(
 
 
 def detect_anomalies(
-    transactions: Iterable[Transaction],
+    transactions: Ledger | Iterable[Transaction],
     *,
     threshold: float = 2.5,
     whitelist_merchants: Iterable[str] | None = None,
@@ -331,7 +463,9 @@ def _month_over_month_insight(
     monthly = df.copy()
     monthly["year_month"] = monthly["date"].dt.to_period("M")
     month_totals = (
-        monthly.groupby(["year_month", "category"])["amount"].sum().reset_index()
+        monthly.groupby(["year_month", "category"], observed=True)["amount"]
+        .sum()
+        .reset_index()
     )
     if month_totals["year_month"].nunique() < 2:
         return None
@@ -470,20 +604,17 @@ def _recent_average_insight(df: pd.DataFrame, days: int = 3) -> SpendingInsight
 
 
 def generate_insights(
-    transactions: Iterable[Transaction], locale: str = "zh_CN"
+    transactions: Ledger | Iterable[Transaction], locale: str = "zh_CN"
 ) -> List[SpendingInsight]:
     """Produce high-level talking points for the dashboard."""
-    transactions = list(transactions)
-    if not transactions:
-        return []
-
-    df = _to_dataframe(transactions)
+    ledger = as_ledger(transactions)
+    df = ledger.to_frame()
     if df.empty:
         return []
 
     insights: List[SpendingInsight] = []
 
-    totals = calculate_category_totals(transactions)
+    totals = calculate_category_totals(ledger)
     if totals:
         top_category = max(totals, key=totals.get)
         top_amount = totals[top_category]
@@ -0,0 +1,234 @@
+"""Incremental spending statistics for anomaly detection."""
+
+from __future__ import annotations
+
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple, Union
+
+from models.entities import Transaction, TransactionRecord
+
+# (amount, category, merchant)
+_Entry = Tuple[float, str, str]
+SUPPORTED_GROUPS = ("category", "merchant")
+
+
+class RunningStats:
+    """Welford running mean/variance supporting removal and group merges."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0) -> None:
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value: float) -> None:
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.count -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """Statistics of the union of two disjoint samples (Chan et al.)."""
+        count = self.count + other.count
+        if count == 0:
+            return RunningStats()
+        delta = other.mean - self.mean
+        mean = self.mean + delta * other.count / count
+        m2 = self.m2 + other.m2 + delta * delta * self.count * other.count / count
+        return RunningStats(count, mean, m2)
+
+    def subtract(self, other: "RunningStats") -> "RunningStats":
+        """Statistics after taking the sub-sample ``other`` out of this one."""
+        count = self.count - other.count
+        if count <= 0:
+            return RunningStats()
+        mean = (self.mean * self.count - other.mean * other.count) / count
+        delta = other.mean - mean
+        m2 = self.m2 - other.m2 - delta * delta * count * other.count / self.count
+        return RunningStats(count, mean, max(0.0, m2))
+
+    @property
+    def variance(self) -> float:
+        """Population variance (ddof=0), matching the z-score detector."""
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_list(self) -> List[float]:
+        return [self.count, self.mean, self.m2]
+
+    @classmethod
+    def from_list(cls, payload: Sequence[float]) -> "RunningStats":
+        count, mean, m2 = payload
+        return cls(int(count), float(mean), float(m2))
+
+
+_Record = Union[Transaction, TransactionRecord, dict]
+
+
+def _entry_of(record: _Record) -> _Entry:
+    if isinstance(record, (Transaction, TransactionRecord)):
+        return float(record.amount), record.category, record.merchant
+    return (
+        float(record.get("amount") or 0.0),
+        record.get("category") or "",
+        record.get("merchant") or "",
+    )
+
+
+class IncrementalAnomalyEngine:
+    """
+    Keep anomaly statistics in step with the ledger in O(k) per change.
+
+    Global statistics are always maintained; ``group_by`` adds per-category
+    and/or per-merchant statistics. Merchant statistics also let callers
+    exclude whitelisted merchants without rescanning the ledger.
+
+    Only the aggregates are kept (and persisted); removals take the removed
+    rows from the ledger itself rather than from a stored copy.
+    """
+
+    def __init__(self, group_by: Iterable[str] = ("merchant",)) -> None:
+        self.group_by = tuple(g for g in group_by if g in SUPPORTED_GROUPS)
+        self.global_stats = RunningStats()
+        self.groups: Dict[str, Dict[str, RunningStats]] = {
+            group: {} for group in self.group_by
+        }
+        # 金额合计，用于恢复时快速核对统计是否与账本一致
+        self.total = 0.0
+
+    def __len__(self) -> int:
+        return self.global_stats.count
+
+    def _apply(self, entry: _Entry, sign: int) -> None:
+        amount, category, merchant = entry
+        keys = {"category": category, "merchant": merchant}
+        if sign > 0:
+            self.global_stats.add(amount)
+        else:
+            self.global_stats.remove(amount)
+        self.total += sign * amount
+        for group, stats_map in self.groups.items():
+            key = keys[group]
+            stats = stats_map.setdefault(key, RunningStats())
+            if sign > 0:
+                stats.add(amount)
+            else:
+                stats.remove(amount)
+                if stats.count == 0:
+                    del stats_map[key]
+
+    def add(self, records: Iterable[_Record]) -> int:
+        """Fold newly appended transactions into the statistics."""
+        added = 0
+        for record in records:
+            self._apply(_entry_of(record), 1)
+            added += 1
+        return added
+
+    def remove(self, records: Iterable[_Record]) -> int:
+        """Take rows (as read from the ledger) back out of the statistics."""
+        removed = 0
+        for record in records:
+            self._apply(_entry_of(record), -1)
+            removed += 1
+        return removed
+
+    def replace(self, old: Iterable[_Record], new: Iterable[_Record]) -> int:
+        """
+        Move from ledger ``old`` to ledger ``new``, touching only changed rows.
+
+        Returns the number of entries added or removed.
+        """
+        before = Counter(_entry_of(record) for record in old)
+        after = Counter(_entry_of(record) for record in new)
+        changed = 0
+        for entry, count in (before - after).items():
+            for _ in range(count):
+                self._apply(entry, -1)
+            changed += count
+        for entry, count in (after - before).items():
+            for _ in range(count):
+                self._apply(entry, 1)
+            changed += count
+        return changed
+
+    def matches(self, records: Sequence[_Record]) -> bool:
+        """Cheap consistency check of restored statistics against the ledger."""
+        if self.global_stats.count != len(records):
+            return False
+        total = sum(_entry_of(record)[0] for record in records)
+        return math.isclose(self.total, total, rel_tol=1e-9, abs_tol=1e-6)
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[_Record], group_by: Iterable[str] = ("merchant",)
+    ) -> "IncrementalAnomalyEngine":
+        engine = cls(group_by)
+        engine.add(records)
+        return engine
+
+    def stats(self, exclude_merchants: Iterable[str] = ()) -> RunningStats | None:
+        """
+        Global statistics, optionally without the given merchants.
+
+        Returns None when exclusion is requested but merchant statistics are
+        not tracked, so callers fall back to a full computation.
+        """
+        excluded = [m for m in exclude_merchants if m]
+        if not excluded:
+            return RunningStats(*self.global_stats.to_list())
+        merchant_stats = self.groups.get("merchant")
+        if merchant_stats is None:
+            return None
+        result = self.global_stats
+        for merchant in set(excluded):
+            stats = merchant_stats.get(merchant)
+            if stats is not None:
+                result = result.subtract(stats)
+        return RunningStats(*result.to_list())
+
+    def group_stats(self, group: str, key: str) -> RunningStats | None:
+        return self.groups.get(group, {}).get(key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serialisable aggregates; size depends on the groups, not the ledger."""
+        return {
+            "group_by": list(self.group_by),
+            "global": self.global_stats.to_list(),
+            "total": self.total,
+            "groups": {
+                group: {key: stats.to_list() for key, stats in stats_map.items()}
+                for group, stats_map in self.groups.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any]) -> "IncrementalAnomalyEngine":
+        engine = cls(payload.get("group_by", ("merchant",)))
+        engine.global_stats = RunningStats.from_list(payload.get("global", (0, 0, 0)))
+        for group, stats_map in (payload.get("groups") or {}).items():
+            if group in engine.groups:
+                engine.groups[group] = {
+                    key: RunningStats.from_list(values)
+                    for key, values in stats_map.items()
+                }
+        # 旧版本快照没有合计（附带逐条成员），置为NaN使核对失败后重建
+        engine.total = float(payload.get("total", math.nan))
+        return engine
+
+
+__all__ = ["IncrementalAnomalyEngine", "RunningStats"]
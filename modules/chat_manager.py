@@ -13,7 +13,14 @@ from openai import OpenAI, OpenAIError
 
 from models.entities import Transaction
 from modules.analysis import calculate_category_totals
+from services.llm_clients import get_openai_client
+from services.llm_scheduler import (
+    PRIORITY_INTERACTIVE,
+    backoff_delay,
+    create_chat_completion,
+)
 from utils.i18n import I18n
+from utils.ledger import Ledger, as_ledger
 
 try:  # Optional LangChain integration
     from services.langchain_agent import LangChainFinanceAgent
@@ -38,11 +45,13 @@ class ChatManager:
         api_key: str | None = None,
         base_url: str | None = None,
         locale: str | None = None,
+        ledger: Ledger | None = None,
     ) -> None:
         self.history: List[dict] = history if history is not None else []
         self.transactions: List[Transaction] = self._normalize_transactions(
             transactions
         )
+        self._ledger: Optional[Ledger] = ledger
         self.monthly_budget = monthly_budget if monthly_budget is not None else 0.0
         self.model = model
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
@@ -68,9 +77,14 @@ class ChatManager:
                 normalized.append(Transaction(**txn))
         return normalized
 
-    def update_transactions(self, transactions: Iterable[Transaction | dict]) -> None:
+    def update_transactions(
+        self,
+        transactions: Iterable[Transaction | dict],
+        ledger: Ledger | None = None,
+    ) -> None:
         """Replace stored transactions, keeping conversions consistent."""
         self.transactions = self._normalize_transactions(transactions)
+        self._ledger = ledger
         self._lc_agent = None
 
     def set_monthly_budget(self, amount: float) -> None:
@@ -89,21 +103,13 @@ class ChatManager:
     # ------------------------------------------------------------------ #
     # Data-driven helpers
     # ------------------------------------------------------------------ #
+    def _get_ledger(self) -> Ledger:
+        if self._ledger is None:
+            self._ledger = as_ledger(self.transactions)
+        return self._ledger
+
     def _transactions_dataframe(self) -> pd.DataFrame:
-        if not self.transactions:
-            return pd.DataFrame(columns=["date", "category", "amount"])
-
-        records = [
-            {
-                "date": pd.to_datetime(txn.date),
-                "category": txn.category,
-                "amount": float(txn.amount),
-            }
-            for txn in self.transactions
-        ]
-        df = pd.DataFrame(records)
-        df.sort_values("date", inplace=True)
-        return df
+        return self._get_ledger().to_frame(["date", "category", "amount"])
 
     def _current_month_spent(self) -> float:
         df = self._transactions_dataframe()
@@ -118,7 +124,7 @@ class ChatManager:
         if not self.transactions:
             return self.i18n.t("common.no_data")
 
-        totals = calculate_category_totals(self.transactions)
+        totals = calculate_category_totals(self._get_ledger())
         top_categories = sorted(totals.items(), key=lambda item: item[1], reverse=True)[
             :3
         ]
@@ -131,7 +137,7 @@ class ChatManager:
 
     def _summary_fallback(self) -> str:
         """Compose a rule-based summary when LLM is unavailable."""
-        totals = calculate_category_totals(self.transactions)
+        totals = calculate_category_totals(self._get_ledger())
         if totals:
             top_category = max(totals, key=totals.get)
             top_amount = totals[top_category]
@@ -191,7 +197,7 @@ class ChatManager:
             )
 
         if has_spend_max_hint:
-            totals = calculate_category_totals(self.transactions)
+            totals = calculate_category_totals(self._get_ledger())
             if not totals:
                 return self.i18n.t("chat.heuristic_no_transactions")
             top_category = max(totals, key=totals.get)
@@ -229,7 +235,7 @@ class ChatManager:
                 raise RuntimeError(
                     self.i18n.t("errors.llm_fail", error="API key missing")
                 )
-            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            self._client = get_openai_client(self.api_key, self.base_url)
         return self._client
 
     def generate_response(self, user_prompt: str, stream: bool = False) -> str:
@@ -279,7 +285,9 @@ class ChatManager:
                 if stream:
                     # 流式模式：逐步返回
                     full_response = ""
-                    completion_stream = client.chat.completions.create(
+                    completion_stream = create_chat_completion(
+                        client,
+                        priority=PRIORITY_INTERACTIVE,
                         model=self.model,
                         temperature=0.2,
                         messages=messages,
@@ -297,7 +305,9 @@ class ChatManager:
                     return  # Generator完成
                 else:
                     # 非流式模式：一次性返回
-                    completion = client.chat.completions.create(
+                    completion = create_chat_completion(
+                        client,
+                        priority=PRIORITY_INTERACTIVE,
                         model=self.model,
                         temperature=0.2,
                         messages=messages,
@@ -308,11 +318,16 @@ class ChatManager:
                     self.add_message("assistant", content)
                     return content
 
-            except (OpenAIError, RuntimeError) as exc:
+            except OpenAIError as exc:
+                # 限流、5xx与连接错误已由调度器按退避重试过，其余错误重发也无济于事，直接降级
+                errors.append(str(exc))
+                logger.warning("LLM调用失败: %s", exc)
+                break
+            except RuntimeError as exc:
+                # 只有空回复才整轮重试
                 errors.append(str(exc))
-                logger.warning("LLM调用失败（第%s次）: %s", attempt + 1, exc)
-                time_wait = 0.5 * (attempt + 1)
-                time.sleep(time_wait)
+                logger.warning("LLM返回空回复（第%s次）", attempt + 1)
+                time.sleep(backoff_delay(attempt))
 
         summary = self._summary_fallback()
         if errors:
@@ -357,6 +372,7 @@ class ChatManager:
         if self._lc_agent is None:
             self._lc_agent = LangChainFinanceAgent(
                 self.transactions,
+                ledger=self._get_ledger(),
                 monthly_budget=self.monthly_budget,
                 model=self.model,
                 api_key=self.api_key,
@@ -12,7 +12,10 @@ from utils.session import (
     build_chat_cache_key,
     get_chat_history,
     get_i18n,
+    get_ledger,
+    get_ledger_key,
     get_monthly_budget,
+    get_transaction_records,
     get_transactions,
     set_chat_history,
 )
@@ -32,8 +35,7 @@ def render() -> None:
 
     _init_session_defaults()
     history: List[dict] = get_chat_history()
-    transactions_list = get_transactions()
-    transactions = st.session_state.get("transactions", [])
+    transactions_list = get_transaction_records()
 
     current_budget = get_monthly_budget()
 
@@ -86,13 +88,16 @@ def render() -> None:
 
 
     locale = st.session_state.get("locale", "zh_CN")
+    ledger = get_ledger()
+    transactions = get_transactions()
     chat_manager = ChatManager(
         history=history,
         transactions=transactions,
         monthly_budget=current_budget,
         locale=locale,
+        ledger=ledger,
     )
-    chat_manager.update_transactions(transactions)
+    chat_manager.update_transactions(transactions, ledger=ledger)
     chat_manager.set_monthly_budget(current_budget)
 
     if history:
@@ -120,7 +125,7 @@ def render() -> None:
     cache: dict = st.session_state["chat_cache"]
     cache_key = build_chat_cache_key(
         user_prompt,
-        transactions,
+        get_ledger_key(),
         current_budget,
         locale,
     )
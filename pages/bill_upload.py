@@ -13,11 +13,28 @@ from typing import Iterable, List
 import pandas as pd
 import streamlit as st
 
-from models.entities import OCRParseResult, Transaction
+from models.entities import OCRParseResult, Transaction, TransactionRecord
 from modules.analysis import generate_insights
 from services.ocr_service import MAX_FILE_SIZE_BYTES, OCRService
 from utils.error_handling import UserFacingError
-from utils.session import get_i18n, get_transactions, set_analysis_summary, set_transactions
+from utils.importers import (
+    detect_encoding,
+    frame_to_records,
+    frame_to_transactions,
+    hash_stream,
+    iter_csv_frames,
+    looks_like_excel,
+    normalize_transaction_frame,
+    read_excel_statement,
+    sniff_csv,
+)
+from utils.session import (
+    append_transactions,
+    get_i18n,
+    get_transaction_records,
+    set_analysis_summary,
+    set_transactions,
+)
 from utils.transactions import generate_transaction_id
 from utils.ui_components import (
     render_financial_health_card,
@@ -26,6 +43,8 @@ from utils.ui_components import (
 
 STRUCTURED_FILE_EXTENSIONS = {".csv", ".xlsx", ".xls"}
 MAX_FILE_SIZE_MB = MAX_FILE_SIZE_BYTES // (1024 * 1024)
+# 分块导入的大文件只展示最新的若干条，避免一次性渲染整张表
+STREAMED_PREVIEW_ROWS = 500
 
 
 def _is_structured_file(filename: str) -> bool:
@@ -35,139 +54,76 @@ def _is_structured_file(filename: str) -> bool:
     return suffix in STRUCTURED_FILE_EXTENSIONS
 
 
-def _parse_excel_file(file_bytes: bytes, i18n=None) -> List[Transaction]:
-    """Parse Excel file (.xlsx/.xls) into Transaction objects with smart column mapping."""
-    i18n = i18n or get_i18n()
+def _is_streamable_csv(uploaded_file, filename: str) -> bool:
+    """CSV 文件走分块导入；被命名为 .csv 的 Excel 文件仍走 Excel 解析。"""
 
-    # Column name mapping: Excel column → Transaction field
-    COLUMN_MAPPINGS = {
-        # Date fields
-        "date": "date",
-        "posting_date": "date",
-        "transaction_date": "date",
-        "clear_date": "date",
-        "document_create_date": "date",
-        # Merchant fields
-        "merchant": "merchant",
-        "name_customer": "merchant",
-        "customer_name": "merchant",
-        "vendor": "merchant",
-        "supplier": "merchant",
-        # Category field (less common, often needs manual input)
-        "category": "category",
-        "type": "category",
-        "transaction_type": "category",
-        # Amount fields
-        "amount": "amount",
-        "total_open_amount": "amount",
-        "total_amount": "amount",
-        "transaction_amount": "amount",
-        "value": "amount",
-        # Currency fields
-        "currency": "currency",
-        "invoice_currency": "currency",
-        "transaction_currency": "currency",
-    }
+    if Path(filename or "").suffix.lower() != ".csv":
+        return False
+    head = uploaded_file.read(8)
+    uploaded_file.seek(0)
+    return not looks_like_excel(head)
 
-    try:
-        file_hash = hashlib.sha256(file_bytes).hexdigest()
-        # Read Excel file using pandas
-        df = pd.read_excel(io.BytesIO(file_bytes))
 
-        if df.empty:
-            raise ValueError(i18n.t("bill_upload.manual_error_no_rows"))
+def _import_csv_stream(uploaded_file, filename: str, i18n) -> tuple[int, int, str]:
+    """
+    Stream a CSV export into the ledger chunk by chunk, showing progress.
 
-        # Map column names (case-insensitive)
-        column_map = {}
-        mapped_targets = set()  # Track which target fields are already mapped
-
-        for col in df.columns:
-            col_lower = str(col).strip().lower()
-            if col_lower in COLUMN_MAPPINGS:
-                target_field = COLUMN_MAPPINGS[col_lower]
-                # Only map if this target field hasn't been mapped yet
-                if target_field not in mapped_targets:
-                    column_map[col] = target_field
-                    mapped_targets.add(target_field)
-
-        # Check if we have minimum required fields
-        mapped_fields = set(column_map.values())
-        if "date" not in mapped_fields:
-            raise ValueError(
-                f"缺少日期列。Excel文件必须包含以下列之一: posting_date, date, transaction_date, clear_date"
-            )
-        if "merchant" not in mapped_fields:
-            raise ValueError(
-                f"缺少商户列。Excel文件必须包含以下列之一: merchant, name_customer, customer_name, vendor"
-            )
-        if "amount" not in mapped_fields:
-            raise ValueError(
-                f"缺少金额列。Excel文件必须包含以下列之一: amount, total_open_amount, total_amount"
+    Returns the number of imported transactions, the number of malformed lines
+    skipped and the detected layout label (empty for generic CSV). Each chunk
+    is appended as soon as it is parsed and only counts are kept here, so
+    chunks imported before a failure stay in the ledger.
+    """
+    file_hash = hash_stream(uploaded_file)
+    # 支付宝/微信/银行等固定格式按表头识别，直接解析，不经过任何模型调用
+    layout = sniff_csv(uploaded_file)
+    statement_format = layout[1]
+    progress = st.progress(
+        0.0, text=i18n.t("bill_upload.csv_import_progress", filename=filename, count=0)
+    )
+    imported = 0
+    skipped = 0
+    try:
+        for frame, fraction, skipped in iter_csv_frames(
+            uploaded_file, source_hash=file_hash, layout=layout
+        ):
+            if not frame.empty:
+                # 每块只追加新增记录，不复制整本账、不重算统计
+                records = frame_to_records(frame)
+                append_transactions(records)
+                imported += len(records)
+            progress.progress(
+                fraction,
+                text=i18n.t(
+                    "bill_upload.csv_import_progress",
+                    filename=filename,
+                    count=imported,
+                ),
             )
+    finally:
+        progress.empty()
+    return imported, skipped, statement_format.label if statement_format else ""
 
-        # Rename columns according to mapping
-        df_renamed = df.rename(columns=column_map)
-
-        transactions: List[Transaction] = []
-        for idx, row in enumerate(df_renamed.to_dict("records"), start=1):
-            # Skip rows with empty date
-            if pd.isna(row.get("date")) or not str(row.get("date", "")).strip():
-                continue
-
-            # Parse date field
-            date_val = row.get("date")
-            if isinstance(date_val, pd.Timestamp):
-                date_str = date_val.strftime("%Y-%m-%d")
-            elif hasattr(date_val, "isoformat"):
-                date_str = date_val.isoformat()
-            else:
-                date_str = str(date_val).strip()
-
-            # Skip if merchant is missing
-            merchant = str(row.get("merchant", "")).strip()
-            if not merchant:
-                continue
 
-            # Category is optional, use default if missing
-            category = str(row.get("category", "")).strip() or "其他"
+def _parse_excel_file(file_bytes: bytes, i18n=None) -> List[Transaction]:
+    """Parse Excel file (.xlsx/.xls) into Transaction objects with smart column mapping."""
+    i18n = i18n or get_i18n()
 
-            try:
-                amount = float(row.get("amount", 0))
-            except (TypeError, ValueError):
-                continue
-
-            # Skip zero or negative amounts
-            if amount <= 0:
-                continue
-
-            currency = str(row.get("currency", "CNY")).strip() or "CNY"
-            txn_id = generate_transaction_id(
-                merchant=merchant,
-                date_value=date_str,
-                amount=amount,
-                currency=currency,
-                source_hash=file_hash,
-                sequence=idx,
-            )
+    try:
+        file_hash = hashlib.sha256(file_bytes).hexdigest()
+        # Read Excel file using pandas; known statement layouts are mapped here
+        df, _ = read_excel_statement(file_bytes)
 
-            transactions.append(
-                Transaction(
-                    id=row.get("id", "").strip() or txn_id,
-                    date=date_str,
-                    merchant=merchant,
-                    category=category,
-                    amount=amount,
-                    currency=currency,
-                    payment_method=str(row.get("payment_method", "")).strip() or None,
-                )
-            )
+        if df.empty:
+            raise ValueError(i18n.t("bill_upload.manual_error_no_rows"))
 
-        if not transactions:
+        # 列映射、日期/金额解析、过滤与ID哈希全部按列完成，最后才构建模型
+        frame = normalize_transaction_frame(df, source_hash=file_hash)
+        if frame.empty:
             raise ValueError(
                 f"Excel文件中没有有效的交易记录。请确保数据行包含有效的日期、商户和金额。"
             )
 
-        return transactions
+        return frame_to_transactions(frame)
 
     except Exception as exc:
         raise ValueError(
@@ -214,7 +170,7 @@ def _parse_manual_input(raw_text: str, i18n=None) -> List[Transaction]:
         raise ValueError(i18n.t("bill_upload.manual_error_csv_header"))
 
     transactions: List[Transaction] = []
-    for row in reader:
+    for idx, row in enumerate(reader, start=1):
         if not row:
             continue
         currency = row.get("currency", "CNY").strip() or "CNY"
@@ -301,7 +257,8 @@ def _render_manual_entry(i18n) -> None:
         )
         if csv_file is not None:
             try:
-                text = csv_file.read().decode("utf-8")
+                encoding = detect_encoding(csv_file)
+                text = csv_file.read().decode(encoding)
                 transactions = _parse_manual_input(text, i18n)
             except Exception as exc:  # pylint: disable=broad-except
                 st.error(i18n.t("bill_upload.manual_csv_error", error=exc))
@@ -406,13 +363,16 @@ def _render_manual_entry(i18n) -> None:
 
 
 def _render_analysis(
-    transactions: Iterable[Transaction],
+    transactions: Iterable[Transaction | TransactionRecord],
     insights,
     serialized_results: List[dict],
     i18n,
 ) -> None:
     """Display analysis summary, insights, and raw text sections."""
-    table_rows = [txn.model_dump() for txn in transactions]
+    table_rows = [
+        txn.to_dict() if isinstance(txn, TransactionRecord) else txn.model_dump()
+        for txn in transactions
+    ]
     st.subheader(i18n.t("bill_upload.summary_header"))
     if table_rows:
         df = pd.DataFrame(table_rows)
@@ -443,7 +403,7 @@ def render() -> None:
     st.write(i18n.t("bill_upload.subtitle"))
 
     # 显示财务健康卡片（整合预算与支出）
-    transactions = get_transactions()
+    transactions = get_transaction_records()
     if transactions:
         render_financial_health_card(transactions)
 
@@ -463,6 +423,8 @@ def render() -> None:
     ocr_ready_files: list = []
     results: list[OCRParseResult | dict] = []
     total_transactions_detected = 0
+    streamed_total = 0
+    ledger_size_before = len(get_transaction_records())
 
     for uploaded_file in uploaded_files:
         filename = getattr(
@@ -483,6 +445,51 @@ def render() -> None:
             st.session_state["show_manual_entry"] = True
             continue
 
+        if _is_streamable_csv(uploaded_file, filename):
+            # CSV 分块解析并直接写入账本，不在内存中保留整份文本和全部交易
+            try:
+                imported, skipped_lines, layout_label = _import_csv_stream(
+                    uploaded_file, filename, i18n
+                )
+                if not imported:
+                    raise ValueError(i18n.t("bill_upload.manual_error_no_rows"))
+            except Exception as exc:  # pylint: disable=broad-except
+                st.error(
+                    i18n.t(
+                        "bill_upload.csv_import_error",
+                        filename=filename,
+                        error=str(exc),
+                    )
+                )
+                manual_mode = True
+                st.session_state["show_manual_entry"] = True
+            else:
+                streamed_total += imported
+                total_transactions_detected += imported
+                structured_results.append(
+                    OCRParseResult(
+                        filename=filename,
+                        text=f"CSV file: {filename}"
+                        + (f" ({layout_label})" if layout_label else ""),
+                    )
+                )
+                st.success(
+                    i18n.t(
+                        "bill_upload.csv_import_success",
+                        filename=filename,
+                        count=imported,
+                    )
+                )
+                if skipped_lines:
+                    st.warning(
+                        i18n.t(
+                            "bill_upload.csv_import_skipped",
+                            filename=filename,
+                            count=skipped_lines,
+                        )
+                    )
+            continue
+
         if _is_structured_file(filename):
             try:
                 file_bytes = uploaded_file.read()
@@ -591,63 +598,63 @@ def render() -> None:
             with st.status(
                 i18n.t("bill_upload.processing_status"), expanded=True
             ) as status:
-                for idx, uploaded_file in enumerate(ocr_ready_files, 1):
-                    filename = getattr(
-                        uploaded_file,
-                        "name",
-                        i18n.t("common.unnamed_file"),
+                # 一次性提交全部文件，页面级并发识别，结果仍按文件顺序返回
+                try:
+                    file_results = ocr_service.process_files(ocr_ready_files)
+                except UserFacingError:
+                    raise
+                except Exception as exc:  # pylint: disable=broad-except
+                    st.error(
+                        i18n.t(
+                            "bill_upload.file_process_error",
+                            filename=", ".join(
+                                getattr(item, "name", "") for item in ocr_ready_files
+                            ),
+                            error=str(exc),
+                        )
                     )
+                    manual_mode = True
+                    st.session_state["show_manual_entry"] = True
+                    file_results = []
+
+                results.extend(file_results)
+                for idx, file_result in enumerate(file_results, 1):
                     st.write(
                         f"📄 "
                         + i18n.t(
                             "bill_upload.processing_file",
                             current=idx,
                             total=total_files,
-                            filename=filename,
+                            filename=file_result.filename,
                         )
                     )
-                    try:
-                        file_results = ocr_service.process_files([uploaded_file])
-                        results.extend(file_results)
-                        if file_results and file_results[0].transactions:
-                            txn_list = file_results[0].transactions
-                            total_transactions_detected += len(txn_list)
-                            st.success(
+                    if file_result.transactions:
+                        txn_list = file_result.transactions
+                        total_transactions_detected += len(txn_list)
+                        st.success(
+                            i18n.t(
+                                "bill_upload.recognized_count",
+                                count=len(txn_list),
+                            )
+                        )
+                        for txn in txn_list[:3]:
+                            st.caption(
                                 i18n.t(
-                                    "bill_upload.recognized_count",
-                                    count=len(txn_list),
+                                    "bill_upload.transaction_preview",
+                                    date=txn.date,
+                                    merchant=txn.merchant,
+                                    amount=f"{txn.amount:.2f}",
                                 )
                             )
-                            for txn in txn_list[:3]:
-                                st.caption(
-                                    i18n.t(
-                                        "bill_upload.transaction_preview",
-                                        date=txn.date,
-                                        merchant=txn.merchant,
-                                        amount=f"{txn.amount:.2f}",
-                                    )
-                                )
-                            if len(txn_list) > 3:
-                                st.caption(
-                                    i18n.t(
-                                        "bill_upload.and_more",
-                                        count=len(txn_list) - 3,
-                                    )
+                        if len(txn_list) > 3:
+                            st.caption(
+                                i18n.t(
+                                    "bill_upload.and_more",
+                                    count=len(txn_list) - 3,
                                 )
-                        else:
-                            st.warning(i18n.t("bill_upload.no_transactions_in_file"))
-                            manual_mode = True
-                            st.session_state["show_manual_entry"] = True
-                    except UserFacingError:
-                        raise
-                    except Exception as exc:  # pylint: disable=broad-except
-                        st.error(
-                            i18n.t(
-                                "bill_upload.file_process_error",
-                                filename=filename,
-                                error=str(exc),
                             )
-                        )
+                    else:
+                        st.warning(i18n.t("bill_upload.no_transactions_in_file"))
                         manual_mode = True
                         st.session_state["show_manual_entry"] = True
                 processed_total = len(structured_results) + total_files
@@ -732,20 +739,28 @@ def render() -> None:
                 elif isinstance(item, dict):
                     transactions.append(Transaction(**item))
 
-    if transactions:
+    if transactions or streamed_total:
         # 追加到现有交易列表，而不是覆盖
-        existing_transactions = get_transactions()
-        all_transactions = list(existing_transactions) + list(transactions)
-        set_transactions(all_transactions)
+        if transactions:
+            append_transactions(transactions)
         st.session_state["ocr_raw_text"] = "\n\n".join(raw_texts)
         st.session_state["ocr_results"] = serialized_results
         st.session_state["uploaded_files_count"] = len(serialized_results)
-        insights = generate_insights(transactions)
+        imported: list[Transaction | TransactionRecord] = list(transactions)
+        if streamed_total:
+            # 分块导入的交易已直接写入账本，从本次上传前的位置取回用于洞察与预览
+            imported = list(get_transaction_records()[ledger_size_before:])
+        insights = generate_insights(imported)
         insight_payload = [ins.model_dump() for ins in insights]
         set_analysis_summary(insight_payload)
-        st.success(i18n.t("bill_upload.success", count=len(transactions)))
+        st.success(i18n.t("bill_upload.success", count=len(imported)))
         st.session_state["show_manual_entry"] = False
-        _render_analysis(transactions, insights, serialized_results, i18n)
+        _render_analysis(
+            imported[-STREAMED_PREVIEW_ROWS:] if streamed_total else imported,
+            insights,
+            serialized_results,
+            i18n,
+        )
     else:
         manual_mode = True
         st.session_state["show_manual_entry"] = True
@@ -76,16 +76,25 @@ FALLBACK_QUESTIONS: List[Dict[str, object]] = [
 ]
 
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(
+    show_spinner=False,
+    max_entries=session_utils.LEDGER_CACHE_MAX_ENTRIES,
+    ttl=session_utils.LEDGER_CACHE_TTL,
+)
 def _generate_cached_recommendation(
-    transactions_dump: Tuple[Tuple[Tuple[str, object], ...], ...],
+    ledger_key: str,
+    _transactions: List[Transaction],
     responses_tuple: Tuple[Tuple[str, int], ...],
     goal: str,
     locale: str,
 ) -> Dict[str, object]:
-    """Cacheable wrapper producing recommendation payload."""
+    """
+    Cacheable wrapper producing recommendation payload.
+
+    Cached on ``ledger_key``; ``_transactions`` is excluded from hashing.
+    """
     service = RecommendationService()
-    transactions = [Transaction(**dict(entry)) for entry in transactions_dump]
+    transactions = _transactions
     responses = dict(responses_tuple)
     result = service.generate(
         transactions=transactions,
@@ -159,7 +168,11 @@ def _collect_risk_answers(
     return answers, goal
 
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(
+    show_spinner=False,
+    max_entries=session_utils.LEDGER_CACHE_MAX_ENTRIES,
+    ttl=session_utils.LEDGER_CACHE_TTL,
+)
 def _generate_guidance_text(
     locale: str,
     monthly_avg: float,
@@ -168,16 +181,14 @@ def _generate_guidance_text(
 ) -> Tuple[str, str]:
     """生成引导文案（LLM动态生成）"""
     from utils.error_handling import safe_call
-    from openai import OpenAI
+    from services.llm_clients import get_openai_client
+    from services.llm_scheduler import PRIORITY_INTERACTIVE, create_chat_completion
     import os
     import json
 
     @safe_call(timeout=15, fallback=None, error_message="引导文案生成失败")
     def _call_llm():
-        client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            base_url=os.getenv("OPENAI_BASE_URL"),
-        )
+        client = get_openai_client()
 
         prompt = f"""你是一位专业的理财顾问，正在引导用户进行风险评估和投资规划。
 
@@ -226,7 +237,9 @@ Return JSON format:
 }}
 """
 
-        response = client.chat.completions.create(
+        response = create_chat_completion(
+            client,
+            priority=PRIORITY_INTERACTIVE,
             model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
             temperature=0.7,
             messages=[
@@ -461,7 +474,7 @@ def render() -> None:
                 service = RecommendationService()
 
                 # 先分析财务指标
-                metrics = service.analyze_transactions(transactions)
+                metrics = service.analyze_transactions(session_utils.get_ledger())
 
                 # 直接生成详细报告（跳过问卷流程）
                 detailed_report = service.generate_detailed_report(
@@ -546,7 +559,7 @@ def render() -> None:
             questions = FALLBACK_QUESTIONS
 
         # 计算财务指标用于生成引导文案
-        metrics = service.analyze_transactions(transactions)
+        metrics = service.analyze_transactions(session_utils.get_ledger())
         monthly_avg = float(metrics.get("monthly_average", 0.0) or 0.0)
         investable = float(metrics.get("investable_amount", 0.0) or 0.0)
 
@@ -561,17 +574,14 @@ def render() -> None:
         # 收集用户答案
         answers, goal = _collect_risk_answers(questions, risk_guidance, goal_guidance)
         responses_tuple = tuple(sorted(answers.items()))
-        transactions_dump = tuple(
-            tuple(sorted(tx.model_dump().items(), key=lambda item: item[0]))
-            for tx in transactions
-        )
 
         st.subheader(i18n.t("recommendation.step3"))
         if st.button(i18n.t("recommendation.button_generate"), type="secondary", key="advanced_generate"):
             try:
                 with st.spinner(i18n.t("common.loading_recommendation")):
                     results = _generate_cached_recommendation(
-                        transactions_dump,
+                        session_utils.get_ledger_key(),
+                        transactions,
                         responses_tuple,
                         goal,
                         locale,
@@ -8,7 +8,7 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from models.entities import SpendingInsight, Transaction
+from models.entities import SpendingInsight
 from modules.analysis import (
     calculate_category_totals,
     calculate_spending_trend,
@@ -16,30 +16,40 @@ from modules.analysis import (
     generate_insights,
 )
 from utils import session as session_utils
+from utils.ledger import Ledger
 from utils.ui_components import (
     render_financial_health_card,
     responsive_width_kwargs,
 )
 
 
-@st.cache_data(show_spinner=False)
+@st.cache_data(
+    show_spinner=False,
+    max_entries=session_utils.LEDGER_CACHE_MAX_ENTRIES,
+    ttl=session_utils.LEDGER_CACHE_TTL,
+)
 def _prepare_dashboard_data(
-    transactions_dump: Tuple[Tuple[Tuple[str, object], ...], ...],
+    ledger_key: str,
+    _ledger: Ledger,
     whitelist: Tuple[str, ...],
     base_threshold: float,
 ) -> dict:
-    """Pre-compute analytics outputs for the dashboard."""
-    transactions = [Transaction(**dict(entry)) for entry in transactions_dump]
+    """
+    Pre-compute analytics outputs for the dashboard.
+
+    Cached on ``ledger_key``; ``_ledger`` is excluded from hashing.
+    """
+    ledger = _ledger
 
-    category_totals = calculate_category_totals(transactions)
-    trend_daily = calculate_spending_trend(transactions, frequency="D")
-    trend_monthly = calculate_spending_trend(transactions, frequency="M")
+    category_totals = calculate_category_totals(ledger)
+    trend_daily = calculate_spending_trend(ledger, frequency="D")
+    trend_monthly = calculate_spending_trend(ledger, frequency="M")
     anomaly_report = compute_anomaly_report(
-        transactions,
+        ledger,
         base_threshold=base_threshold,
         whitelist_merchants=whitelist,
     )
-    insights = generate_insights(transactions)
+    insights = generate_insights(ledger)
 
     return {
         "category_totals": category_totals,
@@ -146,7 +156,7 @@ def render() -> None:
     st.title(i18n.t("spending.title"))
     st.write(i18n.t("spending.description"))
 
-    transactions = session_utils.get_transactions()
+    transactions = session_utils.get_transaction_records()
     if not transactions:
         st.warning(i18n.t("spending.require_upload"))
         return
@@ -157,12 +167,13 @@ def render() -> None:
     trusted_merchants = session_utils.get_trusted_merchants()
     _render_sidebar_controls(trusted_merchants, i18n)
 
-    serialized = tuple(
-        tuple(sorted(tx.model_dump().items(), key=lambda item: item[0]))
-        for tx in transactions
-    )
     whitelist_tuple = tuple(sorted(trusted_merchants))
-    results = _prepare_dashboard_data(serialized, whitelist_tuple, base_threshold=2.5)
+    results = _prepare_dashboard_data(
+        session_utils.get_ledger_key(),
+        session_utils.get_ledger(),
+        whitelist_tuple,
+        base_threshold=2.5,
+    )
 
     totals = results["category_totals"]
     trend_daily: pd.DataFrame = results["trend_daily"]
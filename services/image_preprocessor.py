@@ -0,0 +1,154 @@
+"""Image normalisation applied before sending bills to the vision model."""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+from typing import Tuple
+
+from PIL import Image, ImageChops, ImageOps, ImageStat, UnidentifiedImageError
+
+from utils.error_handling import UserFacingError
+
+logger = logging.getLogger(__name__)
+
+# gpt-4o 高清模式会把长边缩到2048再切块，更大的分辨率只会增加上传体积
+DEFAULT_MAX_EDGE = 2048
+JPEG_QUALITY = 85
+EXIF_ORIENTATION_TAG = 0x0112
+# 缩略图上平均色差低于该值视为黑白票据，转灰度几乎不损失信息
+GRAYSCALE_CHROMA_THRESHOLD = 12.0
+
+FORMAT_MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+
+def _t(key: str, fallback: str) -> str:
+    """Best-effort translation helper for environments without Streamlit."""
+    try:
+        from utils.session import get_i18n  # Imported lazily to avoid heavy deps
+
+        return get_i18n().t(key)
+    except Exception:  # pylint: disable=broad-except
+        return fallback
+
+
+def _resolve_max_edge() -> int:
+    raw = os.getenv("WEFINANCE_VISION_MAX_EDGE")
+    if not raw:
+        return DEFAULT_MAX_EDGE
+    try:
+        return max(256, int(raw))
+    except ValueError:
+        logger.warning("Invalid WEFINANCE_VISION_MAX_EDGE=%s, using default", raw)
+        return DEFAULT_MAX_EDGE
+
+
+def _is_effectively_grayscale(image: Image.Image) -> bool:
+    """Sample a thumbnail and check whether the colour channels barely differ."""
+    thumb = image.copy()
+    thumb.thumbnail((64, 64))
+    red, green, blue = thumb.convert("RGB").split()
+    # 逐像素取通道最大值与最小值之差，再求平均
+    high = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    low = ImageChops.darker(ImageChops.darker(red, green), blue)
+    chroma = ImageStat.Stat(ImageChops.subtract(high, low)).mean[0]
+    return chroma < GRAYSCALE_CHROMA_THRESHOLD
+
+
+def _flatten_alpha(image: Image.Image) -> Image.Image:
+    """JPEG has no alpha channel, so composite transparent images onto white."""
+    if image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    ):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    else:
+        image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image_for_vision(
+    image_bytes: bytes,
+    max_edge: int | None = None,
+) -> Tuple[bytes, str]:
+    """
+    Normalise an uploaded bill image into a bounded upload payload.
+
+    Applies EXIF orientation, caps the long edge at ``max_edge``, converts
+    near-monochrome receipts to grayscale and picks the smaller of JPEG/PNG.
+    The original bytes are kept when they are already the smallest valid
+    payload. Undecodable input is passed through unchanged; images beyond
+    Pillow's decompression-bomb limit raise `UserFacingError`.
+
+    Returns:
+        (payload_bytes, mime_type)
+    """
+    max_edge = max_edge or _resolve_max_edge()
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            source_format = (source.format or "").upper()
+            rotated = source.getexif().get(EXIF_ORIENTATION_TAG, 1) != 1
+            image = ImageOps.exif_transpose(source) if rotated else source.copy()
+    except Image.DecompressionBombError as exc:
+        # 像素数超出 Pillow 上限，原图同样无法上传，直接提示用户
+        logger.warning("图片像素数过大，拒绝处理: %s", exc)
+        raise UserFacingError(
+            _t("errors.image_too_large", "图片分辨率过大，无法识别。"),
+            suggestion=_t(
+                "errors.image_too_large_suggestion",
+                "请截图或缩小图片后重新上传。",
+            ),
+            original_error=exc,
+        ) from exc
+    except (UnidentifiedImageError, OSError) as exc:
+        logger.warning("图片预处理失败，按原图上传: %s", exc)
+        return image_bytes, "image/png"
+
+    original_mime = FORMAT_MIME_TYPES.get(source_format)
+    resized = max(image.size) > max_edge
+    if resized:
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    image = _flatten_alpha(image)
+    if _is_effectively_grayscale(image):
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    candidates = [(_encode(image, "JPEG"), "image/jpeg")]
+    if source_format == "PNG":
+        # 截图类账单文字锐利，PNG往往更小且没有压缩伪影
+        candidates.append((_encode(image, "PNG"), "image/png"))
+    if original_mime and not (resized or rotated):
+        candidates.append((image_bytes, original_mime))
+
+    payload, mime_type = min(candidates, key=lambda item: len(item[0]))
+    saved = len(image_bytes) - len(payload)
+    logger.info(
+        "图片预处理: %d → %d 字节（节省 %.0f%%，%s，%dx%d）",
+        len(image_bytes),
+        len(payload),
+        (saved / len(image_bytes) * 100) if image_bytes else 0.0,
+        mime_type,
+        image.width,
+        image.height,
+    )
+    return payload, mime_type
+
+
+__all__ = ["prepare_image_for_vision"]
@@ -13,6 +13,7 @@ from langchain_openai import ChatOpenAI
 
 from models.entities import Transaction
 from modules.analysis import calculate_category_totals
+from utils.ledger import Ledger, as_ledger
 
 load_dotenv()
 
@@ -24,12 +25,14 @@ class LangChainFinanceAgent:
         self,
         transactions: Iterable[Transaction | dict],
         *,
+        ledger: Ledger | None = None,
         monthly_budget: float = 0.0,
         model: str = "gpt-4o-mini",
         api_key: str | None = None,
         base_url: str | None = None,
     ) -> None:
         self.transactions = self._normalize_transactions(transactions)
+        self.ledger = ledger if ledger is not None else as_ledger(self.transactions)
         self.monthly_budget = monthly_budget
         self.model = model
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
@@ -55,19 +58,7 @@ class LangChainFinanceAgent:
         return normalized
 
     def _transactions_dataframe(self) -> pd.DataFrame:
-        if not self.transactions:
-            return pd.DataFrame(columns=["date", "category", "amount"])
-        data = [
-            {
-                "date": pd.to_datetime(txn.date),
-                "category": txn.category,
-                "amount": float(txn.amount),
-            }
-            for txn in self.transactions
-        ]
-        df = pd.DataFrame(data)
-        df.sort_values("date", inplace=True)
-        return df
+        return self.ledger.to_frame(["date", "category", "amount"])
 
     def _tool_query_budget(self, _: str) -> str:
         df = self._transactions_dataframe()
@@ -87,7 +78,7 @@ class LangChainFinanceAgent:
         )
 
     def _tool_query_spending(self, _: str) -> str:
-        totals = calculate_category_totals(self.transactions)
+        totals = calculate_category_totals(self.ledger)
         if not totals:
             return "No spending data recorded yet."
         lines = [
@@ -102,7 +93,7 @@ class LangChainFinanceAgent:
         category = category.strip()
         if not category:
             return "Please provide a category to query."
-        totals = calculate_category_totals(self.transactions)
+        totals = calculate_category_totals(self.ledger)
         amount = totals.get(category)
         if amount is None:
             return f"No spending records found for category '{category}'."
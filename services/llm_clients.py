@@ -0,0 +1,124 @@
+"""Process-wide OpenAI clients sharing pooled keep-alive HTTP connections."""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from openai import DefaultHttpxClient, OpenAI
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 20
+# 空闲连接保留时长（秒），在此期间复用连接可省去TCP/TLS握手
+KEEPALIVE_EXPIRY = 60.0
+
+_ClientKey = Tuple[Optional[str], Optional[str]]
+
+_clients: Dict[_ClientKey, OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def _resolve_max_connections() -> int:
+    raw = os.getenv("WEFINANCE_OPENAI_MAX_CONNECTIONS")
+    if not raw:
+        return DEFAULT_MAX_CONNECTIONS
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning("Invalid WEFINANCE_OPENAI_MAX_CONNECTIONS=%s, using default", raw)
+        return DEFAULT_MAX_CONNECTIONS
+    if value < 1:
+        logger.warning("Invalid WEFINANCE_OPENAI_MAX_CONNECTIONS=%s, using default", raw)
+        return DEFAULT_MAX_CONNECTIONS
+    return value
+
+
+def _connection_limits() -> Optional[Any]:
+    """
+    Pool limits built with the HTTP library the installed SDK runs on.
+
+    The SDK's default client subclasses that library's ``Client`` (httpx in
+    openai 1.x, httpx2 in later releases), so its ``Limits`` type is looked
+    up from there rather than imported directly. None means SDK defaults.
+    """
+    try:
+        base = next(
+            cls for cls in DefaultHttpxClient.__mro__[1:] if cls.__name__ == "Client"
+        )
+        http_module = importlib.import_module(base.__module__.split(".")[0])
+        limits_type = getattr(http_module, "Limits")
+        max_connections = _resolve_max_connections()
+        return limits_type(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.warning(
+            "Cannot configure OpenAI connection pool, using SDK defaults: %s", exc
+        )
+        return None
+
+
+def _http_client(factory: Any) -> Any:
+    # SDK 默认客户端本身即带连接池与 keep-alive，仅在可用时覆盖池大小
+    limits = _connection_limits()
+    return factory(limits=limits) if limits is not None else factory()
+
+
+def _client_key(api_key: Optional[str], base_url: Optional[str]) -> _ClientKey:
+    return (
+        api_key or os.getenv("OPENAI_API_KEY"),
+        base_url or os.getenv("OPENAI_BASE_URL"),
+    )
+
+
+def get_openai_client(
+    api_key: Optional[str] = None, base_url: Optional[str] = None
+) -> OpenAI:
+    """
+    Return the shared synchronous client for ``(api_key, base_url)``.
+
+    Missing arguments fall back to ``OPENAI_API_KEY`` / ``OPENAI_BASE_URL``.
+    The client is thread-safe, so every service and worker thread reuses the
+    same connection pool.
+    """
+    key = _client_key(api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=key[0],
+                base_url=key[1],
+                # SDK 内置重试关闭，限流与重试统一交给 services.llm_scheduler
+                max_retries=0,
+                http_client=_http_client(DefaultHttpxClient),
+            )
+            _clients[key] = client
+            logger.info("Created shared OpenAI client for %s", key[1] or "default endpoint")
+        return client
+
+
+def close_clients() -> None:
+    """Close the shared synchronous clients (tests / shutdown hooks)."""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as exc:  # pragma: no cover - best effort
+            logger.debug("Failed to close OpenAI client: %s", exc)
+
+
+__all__ = [
+    "close_clients",
+    "get_openai_client",
+]
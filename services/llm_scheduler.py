@@ -0,0 +1,358 @@
+"""Client-side rate limiting and retry scheduling for chat completion calls."""
+
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from utils.error_handling import (
+    DEFAULT_REQUEST_TIMEOUT,
+    DeadlineExceeded,
+    remaining_time,
+    request_timeout,
+)
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越先获得配额；同一模型有更高优先级的请求排队时，低优先级请求让行
+PRIORITY_INTERACTIVE = 0  # 对话、页面引导等用户正在等待的请求
+PRIORITY_STANDARD = 1  # 账单识别、结构化、建议生成
+PRIORITY_BACKGROUND = 2  # 长篇报告等可延后的请求
+_PRIORITY_LEVELS = 3
+
+# 默认值取 OpenAI Tier 2 档位的公开限额（每分钟请求数, 每分钟令牌数）。
+# 客户端限流只负责平滑突发，真实上限更低时由 429 + Retry-After 统一退避；
+# 账号档位不同或使用兼容网关时通过 WEFINANCE_LLM_RATE_LIMITS 按模型覆盖
+DEFAULT_RPM = 5000
+DEFAULT_TPM = 450_000
+DEFAULT_RATE_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-4o": (5000, 450_000),
+    "gpt-4o-mini": (5000, 2_000_000),
+}
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+# 未指定 max_tokens 时为回复预留的令牌数
+DEFAULT_COMPLETION_TOKENS = 1000
+# 单张图片按高清模式的大致令牌数计入
+IMAGE_TOKENS = 1000
+_WAIT_SLICE = 0.25
+
+
+def _resolve_rate_limits() -> Dict[str, Tuple[int, int]]:
+    """
+    Parse ``WEFINANCE_LLM_RATE_LIMITS`` such as ``gpt-4o=500/30000,*=60/20000``.
+
+    Each entry is ``model=RPM/TPM``; ``*`` sets the fallback for other models.
+    """
+    limits = dict(DEFAULT_RATE_LIMITS)
+    raw = os.getenv("WEFINANCE_LLM_RATE_LIMITS")
+    if not raw:
+        return limits
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            model, budget = entry.split("=", 1)
+            rpm, tpm = (int(part) for part in budget.split("/", 1))
+            if rpm < 1 or tpm < 1:
+                raise ValueError(entry)
+        except ValueError:
+            logger.warning("Invalid WEFINANCE_LLM_RATE_LIMITS entry %s, ignoring", entry)
+            continue
+        limits[model.strip()] = (rpm, tpm)
+    return limits
+
+
+def _text_tokens(text: str) -> int:
+    # 粗略估算：中文等非ASCII字符约1个令牌，ASCII约4个字符1个令牌
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii) // 4 + 1
+
+
+def estimate_tokens(
+    messages: Iterable[Dict[str, Any]], max_tokens: Optional[int] = None
+) -> int:
+    """Upper-bound token cost of a chat request (prompt plus reserved reply)."""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += _text_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    total += IMAGE_TOKENS
+                else:
+                    total += _text_tokens(str(part.get("text", "")))
+        total += 4  # 每条消息的格式开销
+    return total + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """Per-minute budget refilled continuously; starts full."""
+
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # 超过桶容量的请求按满桶放行，避免永远等待
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _ModelBudget:
+    __slots__ = ("requests", "tokens", "blocked_until", "waiting")
+
+    def __init__(self, rpm: int, tpm: int) -> None:
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.waiting: List[int] = [0] * _PRIORITY_LEVELS
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Read ``retry-after-ms`` / ``Retry-After`` from an API error response."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    raw_ms = headers.get("retry-after-ms")
+    if raw_ms:
+        try:
+            return max(0.0, float(raw_ms) / 1000.0)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Delay before retry ``attempt`` (0-based).
+
+    Honours a server-supplied ``retry_after`` plus a little jitter; otherwise
+    uses full-jitter exponential backoff so concurrent callers spread out.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0, max(0.1, retry_after * 0.1))
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2**attempt)))
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, APITimeoutError):
+        # 超时由截止时间负责，重试只会超出调用方的预算
+        return False
+    return isinstance(exc, (RateLimitError, InternalServerError, APIConnectionError))
+
+
+def _usage_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+class LLMScheduler:
+    """
+    Process-wide RPM/TPM budgets per model with priority admission.
+
+    Callers reserve an estimated token cost before each request and settle
+    it against the reported usage afterwards. A 429 pauses the whole model
+    for the server's ``Retry-After`` so every caller backs off together.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None) -> None:
+        self.limits = limits if limits is not None else _resolve_rate_limits()
+        self._budgets: Dict[str, _ModelBudget] = {}
+        self._cond = threading.Condition()
+        self.stats = {"requests": 0, "waited_seconds": 0.0, "retries": 0, "rate_limited": 0}
+
+    def _budget(self, model: str) -> _ModelBudget:
+        budget = self._budgets.get(model)
+        if budget is None:
+            rpm, tpm = self.limits.get(model) or self.limits.get("*", (DEFAULT_RPM, DEFAULT_TPM))
+            budget = _ModelBudget(rpm, tpm)
+            self._budgets[model] = budget
+        return budget
+
+    def _try_reserve(self, budget: _ModelBudget, priority: int, tokens: int) -> float:
+        """Reserve capacity if possible (lock held); otherwise return seconds to wait."""
+        if any(budget.waiting[level] for level in range(priority)):
+            return _WAIT_SLICE
+        now = time.monotonic()
+        wait = max(
+            budget.blocked_until - now,
+            budget.requests.wait_time(1, now),
+            budget.tokens.wait_time(tokens, now),
+        )
+        if wait > 0:
+            return wait
+        budget.requests.take(1)
+        budget.tokens.take(tokens)
+        self.stats["requests"] += 1
+        return 0.0
+
+    @staticmethod
+    def _check_wait(model: str, wait: float) -> None:
+        remaining = remaining_time()
+        if remaining is not None and wait > remaining:
+            raise DeadlineExceeded(f"rate limit wait for {model} exceeds deadline")
+
+    def acquire(self, model: str, tokens: int, priority: int = PRIORITY_STANDARD) -> None:
+        """Block until ``model`` has budget for one request of ``tokens``."""
+        started = time.monotonic()
+        with self._cond:
+            budget = self._budget(model)
+            budget.waiting[priority] += 1
+            try:
+                while True:
+                    wait = self._try_reserve(budget, priority, tokens)
+                    if wait <= 0:
+                        break
+                    self._check_wait(model, wait)
+                    self._cond.wait(min(wait, _WAIT_SLICE))
+            finally:
+                budget.waiting[priority] -= 1
+                self.stats["waited_seconds"] += time.monotonic() - started
+                self._cond.notify_all()
+
+    def settle(self, model: str, reserved: int, used: Optional[int]) -> None:
+        """Correct the token bucket once the actual usage is known."""
+        if used is None:
+            return
+        with self._cond:
+            budget = self._budget(model)
+            if used < reserved:
+                budget.tokens.give_back(reserved - used)
+            else:
+                budget.tokens.take(used - reserved)
+            self._cond.notify_all()
+
+    def _retry_delay(self, model: str, exc: BaseException, attempt: int) -> float:
+        """Backoff for a failed attempt; a 429 also pauses the model for everyone."""
+        retry_after = retry_after_seconds(exc)
+        delay = backoff_delay(attempt, retry_after)
+        with self._cond:
+            self.stats["retries"] += 1
+            if isinstance(exc, RateLimitError):
+                self.stats["rate_limited"] += 1
+                budget = self._budget(model)
+                budget.blocked_until = max(budget.blocked_until, time.monotonic() + delay)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            raise exc
+        logger.warning(
+            "LLM request to %s failed (%s), retrying in %.1fs",
+            model,
+            exc.__class__.__name__,
+            delay,
+        )
+        return delay
+
+    def create_chat_completion(
+        self,
+        client: OpenAI,
+        *,
+        priority: int = PRIORITY_STANDARD,
+        timeout: float = DEFAULT_REQUEST_TIMEOUT,
+        **kwargs: Any,
+    ) -> Any:
+        """``client.chat.completions.create(**kwargs)`` under the model's budget."""
+        model = kwargs["model"]
+        tokens = estimate_tokens(kwargs.get("messages", ()), kwargs.get("max_tokens"))
+        for attempt in range(MAX_RETRIES + 1):
+            self.acquire(model, tokens, priority)
+            try:
+                response = client.chat.completions.create(
+                    timeout=request_timeout(timeout), **kwargs
+                )
+            except Exception as exc:
+                # 失败的请求不计令牌，归还预留额度，避免 429 风暴中重复扣减
+                self.settle(model, tokens, 0)
+                if attempt >= MAX_RETRIES or not _is_retryable(exc):
+                    raise
+                time.sleep(self._retry_delay(model, exc, attempt))
+                continue
+            self.settle(model, tokens, _usage_tokens(response))
+            return response
+        raise AssertionError("unreachable")  # pragma: no cover
+
+
+_default_scheduler: Optional[LLMScheduler] = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Return the process-wide scheduler shared by all sessions."""
+    global _default_scheduler  # pylint: disable=global-statement
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler()
+        return _default_scheduler
+
+
+def create_chat_completion(
+    client: OpenAI,
+    *,
+    priority: int = PRIORITY_STANDARD,
+    timeout: float = DEFAULT_REQUEST_TIMEOUT,
+    **kwargs: Any,
+) -> Any:
+    """Rate-limited, retrying ``chat.completions.create`` on the shared scheduler."""
+    return get_scheduler().create_chat_completion(
+        client, priority=priority, timeout=timeout, **kwargs
+    )
+
+
+__all__ = [
+    "LLMScheduler",
+    "PRIORITY_BACKGROUND",
+    "PRIORITY_INTERACTIVE",
+    "PRIORITY_STANDARD",
+    "TokenBucket",
+    "backoff_delay",
+    "create_chat_completion",
+    "estimate_tokens",
+    "get_scheduler",
+    "retry_after_seconds",
+]
@@ -0,0 +1,162 @@
+"""Content-addressed, size-bounded disk cache for Vision OCR results."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.storage import STORAGE_FILE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+
+
+def _resolve_cache_dir() -> Path:
+    """Place the cache next to the storage file unless overridden."""
+    env_path = os.getenv("WEFINANCE_OCR_CACHE_DIR")
+    if env_path:
+        return Path(env_path).expanduser()
+    return STORAGE_FILE.parent / "ocr_cache"
+
+
+def _resolve_max_entries() -> int:
+    raw = os.getenv("WEFINANCE_OCR_CACHE_MAX_ENTRIES")
+    if not raw:
+        return DEFAULT_MAX_ENTRIES
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning("Invalid WEFINANCE_OCR_CACHE_MAX_ENTRIES=%s, using default", raw)
+        return DEFAULT_MAX_ENTRIES
+
+
+def build_cache_key(source_hash: str, model: str, prompt_version: str) -> str:
+    """Derive the cache key from image content, model and prompt version."""
+    payload = "|".join([source_hash, model, prompt_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OCRResultCache:
+    """
+    Persist validated transaction payloads keyed by image content.
+
+    Each entry is a small JSON file named after its key. File mtime doubles as
+    the LRU clock: hits refresh it, and writes evict the oldest entries once
+    ``max_entries`` is exceeded. ``max_entries <= 0`` disables the cache.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path | None = None,
+        max_entries: int | None = None,
+    ) -> None:
+        self.cache_dir = cache_dir or _resolve_cache_dir()
+        self.max_entries = (
+            max_entries if max_entries is not None else _resolve_max_entries()
+        )
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as exc:  # pragma: no cover - defensive
+                logger.warning("OCR cache disabled, cannot create %s: %s", self.cache_dir, exc)
+                self.max_entries = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return cached payloads for ``key`` or None on miss."""
+        if not self.enabled:
+            return None
+        path = self._entry_path(key)
+        with self._lock:
+            try:
+                with path.open("r", encoding="utf-8") as handle:
+                    payload = json.load(handle)
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Dropping unreadable OCR cache entry %s: %s", path, exc)
+                path.unlink(missing_ok=True)
+                self.misses += 1
+                return None
+            self.hits += 1
+        return payload.get("transactions", [])
+
+    def put(self, key: str, transactions: List[Dict[str, Any]]) -> None:
+        """Store payloads for ``key`` and evict least recently used entries."""
+        if not self.enabled:
+            return
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with self._lock:
+            try:
+                with tmp_path.open("w", encoding="utf-8") as handle:
+                    json.dump(
+                        {"transactions": transactions}, handle, ensure_ascii=False
+                    )
+                os.replace(tmp_path, path)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Failed to write OCR cache entry %s: %s", path, exc)
+                tmp_path.unlink(missing_ok=True)
+                return
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = list(self.cache_dir.glob("*.json"))
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return
+        entries.sort(key=lambda item: item.stat().st_mtime)
+        for stale in entries[:overflow]:
+            stale.unlink(missing_ok=True)
+        logger.debug("Evicted %d OCR cache entries", overflow)
+
+    def clear(self) -> None:
+        """Remove every cached entry and reset counters."""
+        with self._lock:
+            if self.cache_dir.exists():
+                for entry in self.cache_dir.glob("*.json"):
+                    entry.unlink(missing_ok=True)
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+_default_cache: OCRResultCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> OCRResultCache:
+    """Return the process-wide OCR cache shared by all sessions."""
+    global _default_cache  # pylint: disable=global-statement
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = OCRResultCache()
+        return _default_cache
+
+
+__all__ = ["OCRResultCache", "build_cache_key", "get_default_cache"]
@@ -2,14 +2,35 @@
 
 from __future__ import annotations
 
+import functools
+import hashlib
 import io
 import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, BinaryIO, Iterable, List, Optional
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
 from models.entities import OCRParseResult, Transaction
-from services.vision_ocr_service import VisionOCRService
-from utils.error_handling import UserFacingError
+from services.pdf_pages import (
+    classify_page,
+    iter_pages_in_processes,
+    render_page,
+)
+from services.structuring_service import StructuringService
+from services.vision_ocr_service import VisionOCRService, cascade_report
+from utils.error_handling import UserFacingError, submit_in_context
 
 try:  # pragma: no cover - 外部依赖按需安装
     import pypdfium2 as pdfium
@@ -20,7 +41,13 @@ logger = logging.getLogger(__name__)
 
 MAX_FILE_SIZE_MB = 200
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
-PDF_RENDER_SCALE = 2.0
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_PAGES_IN_MEMORY = 8
+# 多进程渲染默认关闭；页数不足该值的文档直接在进程内渲染，避免进程调度开销
+DEFAULT_PDF_PROCESS_MIN_PAGES = 16
+
+# PDFium 不是线程安全的，所有文档操作串行执行
+_PDFIUM_LOCK = threading.Lock()
 
 
 def _t(key: str, fallback: str, **kwargs) -> str:
@@ -37,6 +64,19 @@ def _t(key: str, fallback: str, **kwargs) -> str:
             return fallback
 
 
+def _resolve_positive_int(env_name: str, default: int) -> int:
+    """读取正整数配置，非法值回退到默认值。"""
+
+    raw = os.getenv(env_name)
+    if not raw:
+        return default
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        logger.warning("Invalid %s=%s, using default", env_name, raw)
+        return default
+
+
 def _looks_like_pdf(filename: str, mime_type: str | None) -> bool:
     """判断文件是否为PDF，避免误把CSV交给OCR。"""
 
@@ -45,8 +85,8 @@ def _looks_like_pdf(filename: str, mime_type: str | None) -> bool:
     return suffix_match or mime_match
 
 
-def _convert_pdf_to_images(file_bytes: bytes, filename: str) -> List[bytes]:
-    """把PDF逐页渲染为PNG字节，方便Vision模型处理。"""
+def _open_pdf(file_bytes: bytes, filename: str) -> Any:
+    """打开PDF文档，统一转换依赖缺失/损坏/空文档等错误。"""
 
     if pdfium is None:
         message = _t(
@@ -74,25 +114,127 @@ def _convert_pdf_to_images(file_bytes: bytes, filename: str) -> List[bytes]:
         raise UserFacingError(message, suggestion=suggestion, original_error=exc) from exc
 
     if len(pdf_doc) == 0:
+        pdf_doc.close()
         message = _t(
             "errors.pdf_render_fail",
             "PDF does not contain any pages: {filename}.",
             filename=filename,
         )
         raise UserFacingError(message)
+    return pdf_doc
+
+
+def _text_layer_enabled() -> bool:
+    return os.getenv("WEFINANCE_PDF_TEXT_LAYER", "1").strip().lower() not in {
+        "0",
+        "false",
+        "no",
+        "off",
+    }
+
+
+def _render_pdf_page(file_bytes: bytes, filename: str, page_index: int) -> bytes:
+    """单独渲染某一页，用于文本层解析失败后的视觉回退。"""
+
+    with _PDFIUM_LOCK:
+        pdf_doc = _open_pdf(file_bytes, filename)
+        try:
+            return render_page(pdf_doc[page_index])
+        finally:
+            pdf_doc.close()
+
+
+def _resolve_render_processes() -> int:
+    """读取多进程渲染的进程数，0 表示关闭。"""
 
-    images: List[bytes] = []
-    for page in pdf_doc:
-        bitmap = page.render(scale=PDF_RENDER_SCALE)
-        pil_image = bitmap.to_pil()
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format="PNG")
-        images.append(buffer.getvalue())
-        buffer.close()
-        pil_image.close()
+    raw = os.getenv("WEFINANCE_PDF_RENDER_PROCESSES")
+    if not raw:
+        return 0
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        logger.warning("Invalid WEFINANCE_PDF_RENDER_PROCESSES=%s, using default", raw)
+        return 0
+
+
+def _iter_pdf_pages(
+    file_bytes: bytes,
+    filename: str,
+    use_text_layer: bool = True,
+    render_processes: int = 0,
+) -> Iterator[Tuple[str, bytes | str]]:
+    """
+    逐页惰性产出PDF内容，区分电子版与扫描版
+
+    每次只渲染一页，调用方取走后即可释放，内存占用与页数无关。
+    PDFium 锁只在单页操作期间持有，不跨越 yield。
+
+    ``render_processes`` 大于 0 且页数达到 ``WEFINANCE_PDF_PROCESS_MIN_PAGES``
+    时，按页段分发到子进程并行渲染，产出顺序不变；子进程失败则从中断的页码
+    起回退到进程内渲染。
+
+    Yields:
+        ("text", 页面文本) 或 ("image", PNG字节)，按页码顺序
+    """
+
+    with _PDFIUM_LOCK:
+        pdf_doc = _open_pdf(file_bytes, filename)
+        page_count = len(pdf_doc)
+
+    text_pages = 0
+    next_page = 0
+    try:
+        min_pages = _resolve_positive_int(
+            "WEFINANCE_PDF_PROCESS_MIN_PAGES", DEFAULT_PDF_PROCESS_MIN_PAGES
+        )
+        if render_processes > 0 and page_count >= min_pages:
+            try:
+                for item in iter_pages_in_processes(
+                    file_bytes,
+                    page_count,
+                    render_processes,
+                    use_text_layer=use_text_layer,
+                ):
+                    next_page += 1
+                    if item[0] == "text":
+                        text_pages += 1
+                    yield item
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning(
+                    "PDF %s 多进程渲染失败，从第 %d 页起改为进程内渲染: %s",
+                    filename,
+                    next_page + 1,
+                    exc,
+                )
 
-    pdf_doc.close()
-    return images
+        for page_index in range(next_page, page_count):
+            with _PDFIUM_LOCK:
+                page = pdf_doc[page_index]
+                try:
+                    item = classify_page(page, use_text_layer)
+                finally:
+                    page.close()
+            if item[0] == "text":
+                text_pages += 1
+            yield item
+
+        logger.info(
+            "PDF %s 共 %d 页，其中 %d 页使用文本层解析",
+            filename,
+            page_count,
+            text_pages,
+        )
+    finally:
+        with _PDFIUM_LOCK:
+            pdf_doc.close()
+
+
+def _close_iterator(iterator: Iterator[Any]) -> None:
+    """提前结束时关闭任务生成器，确保PDF文档句柄被释放。"""
+
+    close = getattr(iterator, "close", None)
+    if close is not None:
+        close()
 
 
 class OCRService:
@@ -103,6 +245,10 @@ class OCRService:
         use_angle_class: bool = True,
         lang: str = "ch",
         structuring_service: Optional[Any] = None,
+        max_workers: Optional[int] = None,
+        use_text_layer: Optional[bool] = None,
+        max_pages_in_memory: Optional[int] = None,
+        render_processes: Optional[int] = None,
     ) -> None:
         """
         初始化OCR服务
@@ -110,11 +256,43 @@ class OCRService:
         Args:
             use_angle_class: 保留参数用于向后兼容，但不再使用
             lang: 保留参数用于向后兼容，但不再使用
-            structuring_service: 不再需要，Vision LLM直接输出结构化数据
+            structuring_service: 电子版PDF文本层的结构化服务，默认按需创建
+                StructuringService
+            max_workers: 同时进行的模型请求上限，1 表示串行
+            max_pages_in_memory: 已渲染但尚未识别完成的页面上限
+            use_text_layer: 电子版PDF是否优先读取文本层，默认读取环境变量
+                WEFINANCE_PDF_TEXT_LAYER（开启）
+            render_processes: 大型PDF并行渲染的进程数，0 表示关闭，默认读取
+                环境变量 WEFINANCE_PDF_RENDER_PROCESSES
         """
-        # 使用Vision LLM服务（默认gpt-4o）
+        # 使用Vision LLM服务（默认gpt-4o；WEFINANCE_VISION_CASCADE 可先试低价模型）
         self._vision_ocr = VisionOCRService(model="gpt-4o")
-        logger.info("OCR服务初始化完成，使用Vision LLM (gpt-4o)")
+        self.max_workers = (
+            max_workers
+            if max_workers is not None
+            else _resolve_positive_int("WEFINANCE_OCR_MAX_WORKERS", DEFAULT_MAX_WORKERS)
+        )
+        self.max_pages_in_memory = (
+            max_pages_in_memory
+            if max_pages_in_memory is not None
+            else _resolve_positive_int(
+                "WEFINANCE_PDF_MAX_PAGES_IN_MEMORY", DEFAULT_MAX_PAGES_IN_MEMORY
+            )
+        )
+        self.use_text_layer = (
+            use_text_layer if use_text_layer is not None else _text_layer_enabled()
+        )
+        self.render_processes = (
+            render_processes
+            if render_processes is not None
+            else _resolve_render_processes()
+        )
+        self._structuring = structuring_service
+        self._structuring_lock = threading.Lock()
+        logger.info(
+            "OCR服务初始化完成，使用Vision LLM (gpt-4o)，最大并发 %d",
+            self.max_workers,
+        )
 
     def extract_text(self, image_bytes: bytes) -> str:
         """
@@ -167,86 +345,244 @@ class OCRService:
         logger.warning("structure_transactions已弃用，请直接使用Vision LLM提取交易")
         return []
 
+    def _get_structuring_service(self) -> Any:
+        """文本层页面使用便宜的文本模型结构化，首次需要时再初始化。"""
+
+        with self._structuring_lock:
+            if self._structuring is None:
+                self._structuring = StructuringService()
+            return self._structuring
+
+    def _extract_text_page(
+        self,
+        text: str,
+        file_bytes: bytes,
+        filename: str,
+        page_index: int,
+        source_hash: str,
+    ) -> List[Transaction]:
+        """解析电子版PDF页面文本；失败或无结果时回退到视觉模型。"""
+
+        try:
+            transactions = self._get_structuring_service().parse_transactions(
+                text, source_hash=f"{source_hash}:p{page_index}"
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(
+                "文本层解析失败（%s 第%d页），回退视觉模型: %s",
+                filename,
+                page_index + 1,
+                exc,
+            )
+            transactions = []
+
+        if transactions:
+            return transactions
+
+        page_bytes = _render_pdf_page(file_bytes, filename, page_index)
+        return self._vision_ocr.extract_transactions_from_image(page_bytes)
+
+    def _iter_pdf_jobs(
+        self, file_bytes: bytes, filename: str
+    ) -> Iterator[Callable[[], List[Transaction]]]:
+        """把PDF拆成逐页识别任务：电子版页面走文本解析，扫描页走视觉模型。"""
+
+        source_hash = hashlib.sha256(file_bytes).hexdigest()
+        pages = _iter_pdf_pages(
+            file_bytes,
+            filename,
+            use_text_layer=self.use_text_layer,
+            render_processes=self.render_processes,
+        )
+        for page_index, (kind, payload) in enumerate(pages):
+            if kind == "text":
+                yield functools.partial(
+                    self._extract_text_page,
+                    payload,
+                    file_bytes,
+                    filename,
+                    page_index,
+                    source_hash,
+                )
+            else:
+                yield functools.partial(
+                    self._vision_ocr.extract_transactions_from_image, payload
+                )
+
+    def _run_jobs(
+        self, jobs: Iterable[Tuple[int, Callable[[], List[Transaction]]]]
+    ) -> List[Tuple[int, List[Transaction] | Exception]]:
+        """
+        流水线式执行逐页识别任务，按输入顺序返回 (文件序号, 结果)
+
+        任务由生成器按需产出（PDF页面在取用时才渲染），同时驻留内存的页面
+        不超过 ``max_pages_in_memory``，执行中的模型请求不超过
+        ``max_workers``。任一页抛出 ``UserFacingError`` 时取消尚未开始的
+        任务并立即向上抛出；其他异常按页返回，由调用方决定整份文件是否失败。
+        """
+        iterator = iter(jobs)
+        if self.max_workers <= 1:
+            results: List[Tuple[int, List[Transaction] | Exception]] = []
+            try:
+                for key, job in iterator:
+                    try:
+                        results.append((key, job()))
+                    except UserFacingError:
+                        raise
+                    except Exception as exc:  # pylint: disable=broad-except
+                        results.append((key, exc))
+            finally:
+                _close_iterator(iterator)
+            return results
+
+        slots = threading.BoundedSemaphore(max(1, self.max_pages_in_memory))
+        failures: List[UserFacingError] = []
+
+        def _on_done(future: Future) -> None:
+            if not future.cancelled():
+                exc = future.exception()
+                if isinstance(exc, UserFacingError):
+                    failures.append(exc)
+            slots.release()
+
+        submitted: List[Tuple[int, Future]] = []
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="wefinance-ocr"
+        )
+        try:
+            while True:
+                # 先占用名额再产出下一页，保证渲染不会跑在识别前面太远
+                slots.acquire()
+                if failures:
+                    raise failures[0]
+                try:
+                    key, job = next(iterator)
+                except StopIteration:
+                    slots.release()
+                    break
+                future = submit_in_context(executor, job)
+                future.add_done_callback(_on_done)
+                submitted.append((key, future))
+
+            for future in as_completed([future for _, future in submitted]):
+                exc = future.exception()
+                if isinstance(exc, UserFacingError):
+                    raise exc
+            return [
+                (key, future.exception() or future.result())
+                for key, future in submitted
+            ]
+        finally:
+            _close_iterator(iterator)
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def process_files(self, files: Iterable[BinaryIO]) -> List[OCRParseResult]:
         """
         处理上传的文件，使用Vision LLM提取交易记录
 
+        所有文件的页面以流水线方式并发识别（并发上限见 ``max_workers``，
+        驻留内存的页面上限见 ``max_pages_in_memory``），结果仍按文件及
+        页码顺序返回。
+
         Args:
             files: 上传的文件对象
 
         Returns:
             OCRParseResult列表
         """
-        outcomes: List[OCRParseResult] = []
-        for file_obj in files:
-            filename = getattr(
-                file_obj,
-                "name",
-                _t("common.unnamed_file", "Uploaded file"),
-            )
-            mime_type = getattr(file_obj, "type", None)
-            file_obj.seek(0)
-            raw_bytes = file_obj.read()
-            if not raw_bytes:
-                logger.warning("文件%s为空，已跳过。", filename)
-                continue
-
-            if len(raw_bytes) > MAX_FILE_SIZE_BYTES:
-                message = _t(
-                    "errors.file_too_large",
-                    "File {filename} exceeds the {size}MB upload limit.",
-                    filename=filename,
-                    size=MAX_FILE_SIZE_MB,
+        filenames: List[str] = []
+        file_errors: Dict[int, Exception] = {}
+
+        def _iter_jobs() -> Iterator[Tuple[int, Callable[[], List[Transaction]]]]:
+            for file_obj in files:
+                filename = getattr(
+                    file_obj,
+                    "name",
+                    _t("common.unnamed_file", "Uploaded file"),
                 )
-                suggestion = _t(
-                    "errors.file_too_large_suggestion",
-                    "Please compress the file or split it before retrying.",
-                )
-                raise UserFacingError(message, suggestion=suggestion)
-
-            try:
-                if _looks_like_pdf(filename, mime_type):
-                    # PDF需要先渲染为图片再识别
-                    page_images = _convert_pdf_to_images(raw_bytes, filename)
-                    transactions: List[Transaction] = []
-                    for page_bytes in page_images:
-                        transactions.extend(
-                            self._vision_ocr.extract_transactions_from_image(
-                                page_bytes
-                            )
-                        )
-                else:
-                    # 使用Vision LLM直接提取交易记录
-                    transactions = self._vision_ocr.extract_transactions_from_image(
-                        raw_bytes
+                mime_type = getattr(file_obj, "type", None)
+                file_obj.seek(0)
+                raw_bytes = file_obj.read()
+                if not raw_bytes:
+                    logger.warning("文件%s为空，已跳过。", filename)
+                    continue
+
+                if len(raw_bytes) > MAX_FILE_SIZE_BYTES:
+                    message = _t(
+                        "errors.file_too_large",
+                        "File {filename} exceeds the {size}MB upload limit.",
+                        filename=filename,
+                        size=MAX_FILE_SIZE_MB,
                     )
+                    suggestion = _t(
+                        "errors.file_too_large_suggestion",
+                        "Please compress the file or split it before retrying.",
+                    )
+                    raise UserFacingError(message, suggestion=suggestion)
+
+                file_index = len(filenames)
+                filenames.append(filename)
+                try:
+                    if _looks_like_pdf(filename, mime_type):
+                        # 电子版页面直接读文本层，扫描页按需渲染为图片识别
+                        for job in self._iter_pdf_jobs(raw_bytes, filename):
+                            yield file_index, job
+                    else:
+                        yield file_index, functools.partial(
+                            self._vision_ocr.extract_transactions_from_image,
+                            raw_bytes,
+                        )
+                except UserFacingError:
+                    # 让UI层展示友好错误
+                    raise
+                except Exception as exc:  # pylint: disable=broad-except
+                    file_errors[file_index] = exc
 
-                # 生成简单的OCR文本用于显示
-                raw_text = "\n".join(
-                    f"{txn.date} | {txn.merchant} | {txn.category} | ¥{txn.amount}"
-                    for txn in transactions
-                )
+        page_results: Dict[int, List[List[Transaction] | Exception]] = {}
+        for file_index, result in self._run_jobs(_iter_jobs()):
+            page_results.setdefault(file_index, []).append(result)
 
-                outcomes.append(
-                    OCRParseResult(
-                        filename=filename, text=raw_text, transactions=transactions
-                    )
+        outcomes: List[OCRParseResult] = []
+        for file_index, filename in enumerate(filenames):
+            file_results = page_results.get(file_index, [])
+            error = file_errors.get(file_index)
+            if error is None:
+                error = next(
+                    (item for item in file_results if isinstance(item, Exception)),
+                    None,
                 )
-                logger.info(f"文件 {filename} 识别到 {len(transactions)} 条交易记录")
 
-            except UserFacingError:
-                # 让UI层展示友好错误
-                raise
-            except Exception as exc:  # pylint: disable=broad-except
-                logger.error(f"处理文件 {filename} 失败: {exc}")
+            if error is not None:
+                logger.error(f"处理文件 {filename} 失败: {error}")
                 # 返回空结果而不是抛出异常，让用户可以继续处理其他文件
                 failure_text = _t("errors.ocr_run_fail", "OCR failed.")
                 outcomes.append(
                     OCRParseResult(
                         filename=filename,
-                        text=f"{failure_text}: {str(exc)}",
+                        text=f"{failure_text}: {str(error)}",
                         transactions=[],
                     )
                 )
+                continue
+
+            transactions: List[Transaction] = [
+                txn for page_transactions in file_results for txn in page_transactions
+            ]
+
+            # 生成简单的OCR文本用于显示
+            raw_text = "\n".join(
+                f"{txn.date} | {txn.merchant} | {txn.category} | ¥{txn.amount}"
+                for txn in transactions
+            )
+
+            outcomes.append(
+                OCRParseResult(
+                    filename=filename, text=raw_text, transactions=transactions
+                )
+            )
+            logger.info(f"文件 {filename} 识别到 {len(transactions)} 条交易记录")
 
+        if self._vision_ocr.cascade:
+            # 各级模型的命中率，用于调整级联配置
+            logger.info("视觉模型级联命中率：%s", cascade_report())
         return outcomes
@@ -0,0 +1,183 @@
+"""PDF page rendering helpers, including an optional multi-process renderer.
+
+This module deliberately imports nothing but pypdfium2 so that spawned
+renderer processes start quickly.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Iterator, List, Tuple
+
+try:  # pragma: no cover - 外部依赖按需安装
+    import pypdfium2 as pdfium
+except ImportError:  # pragma: no cover - 运行时再提示用户安装
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+PDF_RENDER_SCALE = 2.0
+# 文本层去空白后至少这么多字符才走文本解析，避免把只有页码的扫描件误判为电子版
+PDF_TEXT_MIN_CHARS = 40
+# 每个渲染任务处理的连续页数，兼顾进程间传输开销与负载均衡
+PDF_PROCESS_CHUNK_PAGES = 4
+
+PageItem = Tuple[str, Any]
+
+
+def render_page(page: Any) -> bytes:
+    """把单页渲染为PNG字节。"""
+
+    bitmap = page.render(scale=PDF_RENDER_SCALE)
+    pil_image = bitmap.to_pil()
+    buffer = io.BytesIO()
+    pil_image.save(buffer, format="PNG")
+    png_bytes = buffer.getvalue()
+    buffer.close()
+    pil_image.close()
+    return png_bytes
+
+
+def page_text(page: Any) -> str:
+    """读取页面自带的文本层（扫描件通常为空）。"""
+
+    textpage = page.get_textpage()
+    try:
+        return textpage.get_text_range()
+    finally:
+        textpage.close()
+
+
+def has_text_layer(text: str) -> bool:
+    """文本层足够长且包含数字时，才认为可以跳过视觉模型。"""
+
+    compact = "".join(text.split())
+    return len(compact) >= PDF_TEXT_MIN_CHARS and any(ch.isdigit() for ch in compact)
+
+
+def classify_page(page: Any, use_text_layer: bool) -> PageItem:
+    """返回 ("text", 页面文本) 或 ("image", PNG字节)。"""
+
+    text = page_text(page) if use_text_layer else ""
+    if has_text_layer(text):
+        return ("text", text)
+    return ("image", render_page(page))
+
+
+def _render_page_range(
+    pdf_path: str, start: int, stop: int, use_text_layer: bool
+) -> List[PageItem]:
+    """子进程入口：渲染 [start, stop) 页并按顺序返回。"""
+
+    pdf_doc = pdfium.PdfDocument(pdf_path)
+    try:
+        items: List[PageItem] = []
+        for page_index in range(start, stop):
+            page = pdf_doc[page_index]
+            try:
+                items.append(classify_page(page, use_text_layer))
+            finally:
+                page.close()
+        return items
+    finally:
+        pdf_doc.close()
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _get_render_pool(processes: int) -> ProcessPoolExecutor:
+    """复用进程级渲染池，避免每次上传都重新拉起子进程。"""
+
+    global _pool, _pool_size  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # Streamlit 进程内有多个线程，fork 不安全，统一使用 spawn
+            _pool = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pool_size = processes
+        return _pool
+
+
+def _discard_render_pool() -> None:
+    global _pool  # pylint: disable=global-statement
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def iter_pages_in_processes(
+    file_bytes: bytes,
+    page_count: int,
+    processes: int,
+    use_text_layer: bool = True,
+    start_page: int = 0,
+) -> Iterator[PageItem]:
+    """
+    按页码顺序产出页面，渲染工作分块分发到多个进程
+
+    PDF 先写入临时文件，子进程按路径打开，避免把整份文件序列化给每个任务。
+    同时在途的分块不超过 ``processes`` 个，因此内存占用仍与总页数无关。
+    """
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as handle:
+        handle.write(file_bytes)
+        pdf_path = handle.name
+
+    pending: Deque[Future] = deque()
+    try:
+        pool = _get_render_pool(processes)
+        ranges = iter(
+            (start, min(start + PDF_PROCESS_CHUNK_PAGES, page_count))
+            for start in range(start_page, page_count, PDF_PROCESS_CHUNK_PAGES)
+        )
+
+        def _submit_next() -> None:
+            page_range = next(ranges, None)
+            if page_range is not None:
+                pending.append(
+                    pool.submit(_render_page_range, pdf_path, *page_range, use_text_layer)
+                )
+
+        for _ in range(processes):
+            _submit_next()
+        while pending:
+            try:
+                items = pending.popleft().result()
+            except Exception:
+                _discard_render_pool()
+                raise
+            _submit_next()
+            yield from items
+    finally:
+        for future in pending:
+            future.cancel()
+        try:
+            os.unlink(pdf_path)
+        except OSError:  # pragma: no cover - defensive
+            logger.debug("Failed to remove temp PDF %s", pdf_path)
+
+
+__all__ = [
+    "PDF_RENDER_SCALE",
+    "PDF_TEXT_MIN_CHARS",
+    "classify_page",
+    "has_text_layer",
+    "iter_pages_in_processes",
+    "page_text",
+    "render_page",
+]
@@ -14,12 +14,23 @@ from dotenv import load_dotenv
 from openai import OpenAI
 
 from models.entities import Recommendation, Transaction
+from services.llm_clients import get_openai_client
+from services.llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    create_chat_completion,
+)
 from utils.error_handling import safe_call
 from utils.i18n import I18n
+from utils.ledger import Ledger, as_ledger
+from utils.single_flight import SingleFlight, request_fingerprint
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# 进程内正在进行的相同LLM请求（同一模型+提示词+参数）共享一次调用
+_IN_FLIGHT = SingleFlight()
+
 
 class RecommendationService:
     """Generate risk-aware allocation plans with explainable rationale."""
@@ -48,9 +59,20 @@ class RecommendationService:
         if self._client is None:
             if not self.api_key:
                 raise RuntimeError("OPENAI_API_KEY not configured")
-            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            self._client = get_openai_client(self.api_key, self.base_url)
         return self._client
 
+    @staticmethod
+    def _complete(client: OpenAI, **kwargs: Any) -> Any:
+        """
+        Issue a scheduled chat completion, sharing identical in-flight requests.
+
+        The fingerprint covers model, prompt and sampling parameters, so a
+        double click or overlapping rerun is billed once.
+        """
+        key = request_fingerprint(str(client.base_url), kwargs)
+        return _IN_FLIGHT.do(key, lambda: create_chat_completion(client, **kwargs))
+
     @staticmethod
     def _strip_code_fences(content: str) -> str:
         """去除LLM输出中常见的markdown代码块包装"""
@@ -202,7 +224,9 @@ Requirements:
 """
 
         try:
-            response = client.chat.completions.create(
+            response = self._complete(
+                client,
+                priority=PRIORITY_INTERACTIVE,
                 model=self.model,
                 temperature=0.0,  # 风险评估需要稳定输出
                 messages=[
@@ -332,20 +356,13 @@ Requirements:
         }
 
     def _transactions_dataframe(
-        self, transactions: Iterable[Transaction]
+        self, transactions: Ledger | Iterable[Transaction]
     ) -> pd.DataFrame:
-        rows = [
-            {
-                "date": pd.to_datetime(txn.date),
-                "amount": float(txn.amount),
-                "category": txn.category or "其他",
-            }
-            for txn in transactions
-        ]
-        if not rows:
-            return pd.DataFrame(columns=["date", "amount", "category"])
-        df = pd.DataFrame(rows)
-        df.sort_values("date", inplace=True)
+        df = as_ledger(transactions).to_frame(["date", "amount", "category"])
+        if (df["category"] == "").any():
+            df["category"] = (
+                df["category"].astype(object).replace("", "其他").astype("category")
+            )
         return df
 
     @staticmethod
@@ -375,7 +392,7 @@ Requirements:
     def _category_breakdown(df: pd.DataFrame) -> Dict[str, float]:
         if df.empty:
             return {}
-        totals = df.groupby("category")["amount"].sum()
+        totals = df.groupby("category", observed=True)["amount"].sum()
         full = totals.sum()
         if full == 0:
             return {}
@@ -500,7 +517,8 @@ Requirements:
 """
 
         try:
-            response = client.chat.completions.create(
+            response = self._complete(
+                client,
                 model=self.model,
                 temperature=0.3,  # 稍高温度允许创造性，但保持合理性
                 messages=[
@@ -817,7 +835,9 @@ Requirements:
 
         try:
             logger.info("开始生成个性化风险问题")
-            response = client.chat.completions.create(
+            response = self._complete(
+                client,
+                priority=PRIORITY_INTERACTIVE,
                 model=self.model,
                 temperature=0.7,
                 messages=[
@@ -1115,7 +1135,9 @@ Format Requirements:
 
         try:
             logger.info(f"开始生成详细报告，使用模型: {self.report_model}")
-            response = client.chat.completions.create(
+            response = self._complete(
+                client,
+                priority=PRIORITY_BACKGROUND,
                 model=self.report_model,
                 temperature=0.7,  # 稍高温度允许更自然的写作风格
                 max_tokens=12000,  # 支持4000-6000字的详细报告
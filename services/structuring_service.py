@@ -8,14 +8,27 @@ import os
 from typing import List
 
 from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError
+from openai import OpenAIError
 
 from models.entities import Transaction
+from services.llm_clients import get_openai_client
+from services.llm_scheduler import create_chat_completion
+from utils.single_flight import SingleFlight, request_fingerprint
+from utils.transactions import generate_transaction_id
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+STRUCTURING_PROMPT = (
+    "根据以下账单OCR文本，提取所有交易信息并返回JSON对象。"
+    "遵循字段：transactions -> 列表，每个包含 date (YYYY-MM-DD)、merchant、"
+    "category、amount (数字，支出为正值)、payment_method（可选）、raw_text。"
+    "若无法识别交易，请返回空列表。保持中文分类。"
+)
+
+_IN_FLIGHT = SingleFlight()
+
 
 def _t(key: str, fallback: str) -> str:
     """Translate error messages when i18n is available."""
@@ -50,22 +63,31 @@ class StructuringService:
                 )
             )
 
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        self.client = get_openai_client(self.api_key, self.base_url)
+
+    def parse_transactions(
+        self, text: str, *, source_hash: str | None = None
+    ) -> List[Transaction]:
+        """
+        Convert OCR text into normalized transactions via GPT JSON mode.
 
-    def parse_transactions(self, text: str) -> List[Transaction]:
-        """Convert OCR text into normalized transactions via GPT JSON mode."""
+        Entries without an ``id`` get a deterministic one derived from their
+        fields, ``source_hash`` and position, so re-parsing the same text
+        yields the same identifiers.
+        """
         if not text.strip():
             return []
 
-        prompt = (
-            "根据以下账单OCR文本，提取所有交易信息并返回JSON对象。"
-            "遵循字段：transactions -> 列表，每个包含 date (YYYY-MM-DD)、merchant、"
-            "category、amount (数字，支出为正值)、payment_method（可选）、raw_text。"
-            "若无法识别交易，请返回空列表。保持中文分类。"
+        # 并发的相同请求（重复点击、页面重跑）共享一次模型调用
+        key = request_fingerprint(
+            self.model, self.temperature, STRUCTURING_PROMPT, text, source_hash
         )
+        return list(_IN_FLIGHT.do(key, lambda: self._parse(text, source_hash)))
 
+    def _parse(self, text: str, source_hash: str | None) -> List[Transaction]:
         try:
-            completion = self.client.chat.completions.create(
+            completion = create_chat_completion(
+                self.client,
                 model=self.model,
                 temperature=self.temperature,
                 response_format={"type": "json_object"},
@@ -74,7 +96,7 @@ class StructuringService:
                         "role": "system",
                         "content": "You are an expert financial data analyst who outputs valid JSON.",
                     },
-                    {"role": "user", "content": f"{prompt}\n\n文本：\n{text}"},
+                    {"role": "user", "content": f"{STRUCTURING_PROMPT}\n\n文本：\n{text}"},
                 ],
             )
         except OpenAIError as exc:  # pragma: no cover - network dependency
@@ -115,12 +137,22 @@ class StructuringService:
             )
 
         transactions: List[Transaction] = []
-        for entry in transactions_payload:
+        for idx, entry in enumerate(transactions_payload):
             if not isinstance(entry, dict):
                 logger.warning("忽略非字典交易条目：%s", entry)
                 continue
             try:
-                transactions.append(Transaction(**entry))
+                payload = dict(entry)
+                if not payload.get("id"):
+                    payload["id"] = generate_transaction_id(
+                        merchant=str(payload.get("merchant", "")),
+                        date_value=payload.get("date", ""),
+                        amount=float(payload.get("amount", 0)),
+                        currency=payload.get("currency") or "CNY",
+                        source_hash=source_hash or "structuring",
+                        sequence=idx,
+                    )
+                transactions.append(Transaction(**payload))
             except Exception as exc:  # pylint: disable=broad-except
                 logger.warning("交易解析失败：%s，错误：%s", entry, exc)
                 continue
@@ -8,14 +8,19 @@ import json
 import logging
 import os
 import re
+import threading
 from datetime import date
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from dateutil import parser as date_parser
-from openai import OpenAI
 
 from models.entities import LineItem, Transaction
-from utils.error_handling import safe_call
+from services.image_preprocessor import prepare_image_for_vision
+from services.llm_clients import get_openai_client
+from services.llm_scheduler import create_chat_completion
+from services.ocr_cache import OCRResultCache, build_cache_key, get_default_cache
+from utils.error_handling import deadline, safe_call
+from utils.single_flight import SingleFlight
 from utils.transactions import generate_transaction_id
 
 logger = logging.getLogger(__name__)
@@ -31,6 +36,124 @@ def _t(key: str, fallback: str) -> str:
         return fallback
 
 
+# 视觉模型提示词（增强多语言支持和字段容错）
+VISION_PROMPT = """你是一个专业的财务账单识别助手。请仔细分析这张账单图片，提取所有交易记录。
+
+【核心识别规则】：
+★ 首先统计图片中有多少笔交易（有几行独立金额就有几笔交易）
+★ 然后逐行提取每一笔的详细信息，确保 transactions 数组长度 = transaction_count
+★ 如看到合计行，仅用于验证总额，不作为单独交易计数
+
+多语言处理规则：
+1. **语言识别**：
+   - 如果账单为韩文/日文/泰文等非中英文：
+     * 商户名保留原文（不要翻译）
+     * 金额(amount)和分类(category)必须提取
+     * 如果有英文字段，优先使用英文值
+   - 如果账单为中文/英文：正常提取所有字段
+
+2. **字段容错策略**：
+   - date缺失 → 尝试从receipt_time推断，或设为null（但标记partial_data=true）
+   - merchant缺失 → 从票据抬头/店铺名提取，找不到则设为"Unknown Merchant"
+   - category缺失 → 根据商品明细智能推断（食品→餐饮，服装→购物，交通卡→交通）
+   - **即使部分字段缺失，也要返回数据，不要直接返回空数组[]**
+
+3. **货币识别增强**：
+   - RM 或 MYR → "MYR"（马来西亚林吉特）
+   - ฿ 或 THB → "THB"（泰铢）
+   - ₩ 或 KRW → "KRW"（韩元）
+   - ¥ → "CNY"（人民币）
+   - $ → "USD"（美元，但S$为SGD新加坡元）
+   - 无符号且无法判断 → 默认"CNY"
+
+4. **提取字段**：
+   - date: 日期（YYYY-MM-DD格式）或 null
+   - merchant: 商户名称（保持原文）或 "Unknown Merchant"
+   - category: 分类（餐饮、交通、购物、娱乐、医疗、教育、其他）
+   - amount: 总金额（数字，不带货币符号，必需）
+   - currency: 货币代码（见上述规则）
+   - partial_data: 布尔值（如果有字段被推断，设为true）
+   - inferred_fields: 数组（列出哪些字段是推断的，如 ["date", "merchant"]）
+
+5. **详细收据字段**（可选）：
+   - line_items: 商品明细数组
+   - subtotal: 小计
+   - total_discount: 总折扣金额
+   - receipt_number: 收据编号
+
+返回格式（纯JSON对象，不要markdown代码块）：
+{
+  "transaction_count": 4,  // 图片中的交易总数（必填）
+  "transactions": [        // 交易详细列表（长度必须等于transaction_count）
+    {
+      "date": "2025-11-01",
+      "merchant": "星巴克",
+    "category": "餐饮",
+    "amount": 45.0,
+    "currency": "CNY",
+    "partial_data": false,
+    "inferred_fields": []
+    }
+  ]
+}
+
+部分字段缺失示例（韩文账单）：
+{
+  "transaction_count": 1,
+  "transactions": [
+    {
+      "date": null,
+      "merchant": "스타벅스",
+    "category": "餐饮",
+    "amount": 9000.0,
+    "currency": "KRW",
+    "partial_data": true,
+    "inferred_fields": ["date"]
+    }
+  ]
+}
+
+详细收据示例：
+{
+  "transaction_count": 1,
+  "transactions": [
+    {
+      "date": "2018-12-25",
+    "merchant": "BOOK TA.K (TAMAN DAYA) SDN BHD",
+    "category": "购物",
+    "amount": 9.0,
+    "currency": "MYR",
+    "line_items": [
+      {
+        "description": "RF MODELLING CLAY KIDDY FISH",
+        "quantity": 1,
+        "unit_price": 9.0,
+        "amount": 9.0
+      }
+    ],
+    "receipt_number": "TD01167104",
+    "partial_data": false,
+    "inferred_fields": []
+    }
+  ]
+}
+
+如果图片中没有交易记录，返回：{"transaction_count": 0, "transactions": []}
+
+重要：即使部分字段缺失，也要尝试返回部分数据，并标记inferred_fields。"""
+
+# 提示词变更后缓存自动失效
+PROMPT_VERSION = hashlib.sha256(VISION_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# 级联模式下明细小计与总额允许的相对偏差
+LINE_ITEM_TOLERANCE = 0.05
+# 每级模型单独计时，级联总耗时上限为 级数 × 该值；低价模型超时不挤占主模型的时间
+VISION_STAGE_TIMEOUT = 45
+
+# 进程内正在进行的识别请求，按缓存键（图片内容+模型+提示词版本）去重
+_IN_FLIGHT = SingleFlight()
+
+
 TYPO_FIELD_MAP = {
     "amout": "amount",
     "marchant": "merchant",
@@ -107,6 +230,106 @@ def _apply_typo_fix(entry: dict) -> dict:
     return entry
 
 
+def _line_items_consistent(txn: Transaction) -> bool:
+    """明细小计之和（含或不含折扣）与总额相符。"""
+    subtotal = sum(item.amount for item in txn.line_items)
+    discounts = sum(abs(item.discount or 0.0) for item in txn.line_items)
+    tolerance = max(0.01, abs(txn.amount) * LINE_ITEM_TOLERANCE)
+    return any(
+        abs(candidate - txn.amount) <= tolerance
+        for candidate in (subtotal, subtotal - discounts)
+    )
+
+
+def recognition_issues(
+    content: str,
+    entries: Sequence[Any],
+    transactions: Sequence[Transaction],
+) -> List[str]:
+    """
+    Reasons a vision result should not be trusted; an empty list means accept.
+
+    Used by the model cascade to decide whether to escalate to the next,
+    stronger model. A result without any valid transaction is never trusted.
+    """
+    issues: List[str] = []
+    if not transactions:
+        # 空结果多半是低价模型漏识别，升级交给更强的模型确认
+        issues.append("empty")
+    try:
+        data = json.loads(_strip_markdown_fences(content or ""))
+    except json.JSONDecodeError:
+        issues.append("json_repair")
+        data = None
+    if isinstance(data, dict):
+        declared = data.get("transaction_count")
+        if isinstance(declared, (int, float)) and int(declared) != len(entries):
+            issues.append("count_mismatch")
+    if any(
+        not isinstance(entry, dict) or entry.get("amount") in (None, "")
+        for entry in entries
+    ):
+        issues.append("missing_amount")
+    elif len(transactions) < len(entries):
+        issues.append("invalid_rows")
+    if any(txn.line_items and not _line_items_consistent(txn) for txn in transactions):
+        issues.append("line_item_sum")
+    return issues
+
+
+class CascadeStats:
+    """Process-wide per-model outcome counters for the vision cascade."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, model: str, issues: Sequence[str], *, accepted: bool) -> None:
+        """Count one attempt; the last stage is accepted even with issues."""
+        with self._lock:
+            stage = self._stages.setdefault(
+                model, {"attempts": 0, "accepted": 0, "issues": {}}
+            )
+            stage["attempts"] += 1
+            if accepted:
+                stage["accepted"] += 1
+            for issue in issues:
+                stage["issues"][issue] = stage["issues"].get(issue, 0) + 1
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """Attempts, acceptances, hit rate and validation issues per model."""
+        with self._lock:
+            return {
+                model: {
+                    "attempts": stage["attempts"],
+                    "accepted": stage["accepted"],
+                    "hit_rate": (
+                        stage["accepted"] / stage["attempts"] if stage["attempts"] else 0.0
+                    ),
+                    "issues": dict(stage["issues"]),
+                }
+                for model, stage in self._stages.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+CASCADE_STATS = CascadeStats()
+
+
+def cascade_report() -> Dict[str, Dict[str, Any]]:
+    """Per-stage hit rates of the vision cascade since process start."""
+    return CASCADE_STATS.report()
+
+
+def _resolve_cascade() -> Tuple[str, ...]:
+    """读取 WEFINANCE_VISION_CASCADE：在主模型之前依次尝试的低价模型。"""
+    raw = os.getenv("WEFINANCE_VISION_CASCADE", "")
+    return tuple(model.strip() for model in raw.split(",") if model.strip())
+
+
 def _validate_and_fix_transaction(
     item: dict,
     idx: int,
@@ -174,6 +397,8 @@ class VisionOCRService:
         model: str = "gpt-4o",
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
+        cache: Optional[OCRResultCache] = None,
+        cascade: Optional[Sequence[str]] = None,
     ) -> None:
         """
         初始化视觉OCR服务
@@ -182,8 +407,15 @@ class VisionOCRService:
             model: 视觉模型名称，默认使用 gpt-4o（推荐），也支持 qwen3-vl-plus, gemini-2.5-pro
             api_key: OpenAI兼容API密钥
             base_url: API基础URL
+            cache: 识别结果缓存，默认使用进程级共享磁盘缓存
+            cascade: 先于主模型尝试的低价模型，结果未通过校验时才升级到下一个；
+                默认读取环境变量 WEFINANCE_VISION_CASCADE，空表示只用主模型
         """
         self.model = model
+        self.cascade = tuple(cascade) if cascade is not None else _resolve_cascade()
+        # 依次尝试的模型，主模型始终作为最后一级
+        self.stages = tuple(m for m in self.cascade if m != model) + (model,)
+        self.cache = cache if cache is not None else get_default_cache()
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
 
@@ -195,10 +427,20 @@ class VisionOCRService:
                 )
             )
 
-        self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-        logger.info(f"初始化视觉OCR服务，使用模型：{self.model}")
+        self.client = get_openai_client(self.api_key, self.base_url)
+        self.preprocess_stats = {"images": 0, "original_bytes": 0, "uploaded_bytes": 0}
+        self._stats_lock = threading.Lock()
+        logger.info(f"初始化视觉OCR服务，使用模型：{' -> '.join(self.stages)}")
 
-    @safe_call(timeout=30, error_message="账单识别失败")
+    def _record_preprocess(self, original_size: int, uploaded_size: int) -> None:
+        """累计预处理前后的字节数，便于评估节省的上传量。"""
+        with self._stats_lock:
+            self.preprocess_stats["images"] += 1
+            self.preprocess_stats["original_bytes"] += original_size
+            self.preprocess_stats["uploaded_bytes"] += uploaded_size
+
+    # 不设整体时限：每级模型调用在 _recognize 中各自计时，外层已有的截止时间仍然生效
+    @safe_call(timeout=None, error_message="账单识别失败")
     def extract_transactions_from_image(self, image_bytes: bytes) -> List[Transaction]:
         """
         从图片中提取交易记录
@@ -209,172 +451,120 @@ class VisionOCRService:
         Returns:
             Transaction对象列表
         """
-        try:
-            # 将图片编码为base64
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
-            source_hash = hashlib.sha256(image_bytes).hexdigest()
-
-            # 构造提示词（增强多语言支持和字段容错）
-            prompt = """你是一个专业的财务账单识别助手。请仔细分析这张账单图片，提取所有交易记录。
-
-【核心识别规则】：
-★ 首先统计图片中有多少笔交易（有几行独立金额就有几笔交易）
-★ 然后逐行提取每一笔的详细信息，确保 transactions 数组长度 = transaction_count
-★ 如看到合计行，仅用于验证总额，不作为单独交易计数
-
-多语言处理规则：
-1. **语言识别**：
-   - 如果账单为韩文/日文/泰文等非中英文：
-     * 商户名保留原文（不要翻译）
-     * 金额(amount)和分类(category)必须提取
-     * 如果有英文字段，优先使用英文值
-   - 如果账单为中文/英文：正常提取所有字段
-
-2. **字段容错策略**：
-   - date缺失 → 尝试从receipt_time推断，或设为null（但标记partial_data=true）
-   - merchant缺失 → 从票据抬头/店铺名提取，找不到则设为"Unknown Merchant"
-   - category缺失 → 根据商品明细智能推断（食品→餐饮，服装→购物，交通卡→交通）
-   - **即使部分字段缺失，也要返回数据，不要直接返回空数组[]**
-
-3. **货币识别增强**：
-   - RM 或 MYR → "MYR"（马来西亚林吉特）
-   - ฿ 或 THB → "THB"（泰铢）
-   - ₩ 或 KRW → "KRW"（韩元）
-   - ¥ → "CNY"（人民币）
-   - $ → "USD"（美元，但S$为SGD新加坡元）
-   - 无符号且无法判断 → 默认"CNY"
-
-4. **提取字段**：
-   - date: 日期（YYYY-MM-DD格式）或 null
-   - merchant: 商户名称（保持原文）或 "Unknown Merchant"
-   - category: 分类（餐饮、交通、购物、娱乐、医疗、教育、其他）
-   - amount: 总金额（数字，不带货币符号，必需）
-   - currency: 货币代码（见上述规则）
-   - partial_data: 布尔值（如果有字段被推断，设为true）
-   - inferred_fields: 数组（列出哪些字段是推断的，如 ["date", "merchant"]）
-
-5. **详细收据字段**（可选）：
-   - line_items: 商品明细数组
-   - subtotal: 小计
-   - total_discount: 总折扣金额
-   - receipt_number: 收据编号
-
-返回格式（纯JSON对象，不要markdown代码块）：
-{
-  "transaction_count": 4,  // 图片中的交易总数（必填）
-  "transactions": [        // 交易详细列表（长度必须等于transaction_count）
-    {
-      "date": "2025-11-01",
-      "merchant": "星巴克",
-    "category": "餐饮",
-    "amount": 45.0,
-    "currency": "CNY",
-    "partial_data": false,
-    "inferred_fields": []
-    }
-  ]
-}
-
-部分字段缺失示例（韩文账单）：
-{
-  "transaction_count": 1,
-  "transactions": [
-    {
-      "date": null,
-      "merchant": "스타벅스",
-    "category": "餐饮",
-    "amount": 9000.0,
-    "currency": "KRW",
-    "partial_data": true,
-    "inferred_fields": ["date"]
-    }
-  ]
-}
-
-详细收据示例：
-{
-  "transaction_count": 1,
-  "transactions": [
-    {
-      "date": "2018-12-25",
-    "merchant": "BOOK TA.K (TAMAN DAYA) SDN BHD",
-    "category": "购物",
-    "amount": 9.0,
-    "currency": "MYR",
-    "line_items": [
-      {
-        "description": "RF MODELLING CLAY KIDDY FISH",
-        "quantity": 1,
-        "unit_price": 9.0,
-        "amount": 9.0
-      }
-    ],
-    "receipt_number": "TD01167104",
-    "partial_data": false,
-    "inferred_fields": []
-    }
-  ]
-}
-
-如果图片中没有交易记录，返回：{"transaction_count": 0, "transactions": []}
-
-重要：即使部分字段缺失，也要尝试返回部分数据，并标记inferred_fields。"""
+        source_hash = hashlib.sha256(image_bytes).hexdigest()
+        # 未启用级联时键与单模型一致，已有缓存继续有效
+        cache_key = build_cache_key(source_hash, ">".join(self.stages), PROMPT_VERSION)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logger.info("命中OCR缓存，跳过视觉模型调用（%d 条交易）", len(cached))
+            return [Transaction.model_validate(entry) for entry in cached]
+
+        # 重复点击或页面重跑时，同一图片同一模型的并发请求共享一次模型调用
+        return list(
+            _IN_FLIGHT.do(
+                cache_key,
+                lambda: self._recognize(image_bytes, source_hash, cache_key),
+            )
+        )
 
-            # 调用视觉模型
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                },
+    def _call_model(self, model: str, base64_image: str, mime_type: str) -> str:
+        """调用单个视觉模型，返回原始文本响应。"""
+        response = create_chat_completion(
+            self.client,
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": VISION_PROMPT},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{base64_image}"
                             },
-                        ],
-                    }
-                ],
-                response_format={"type": "json_object"},
-                max_tokens=3000,
-                temperature=0.0,  # 确定性输出，新数据结构已解决多行识别问题
+                        },
+                    ],
+                }
+            ],
+            response_format={"type": "json_object"},
+            max_tokens=3000,
+            temperature=0.0,  # 确定性输出，新数据结构已解决多行识别问题
+        )
+        content = response.choices[0].message.content
+        logger.debug("视觉模型(%s)原始响应: %s", model, content)
+        return content or ""
+
+    @staticmethod
+    def _parse_content(
+        content: str, source_hash: str
+    ) -> Tuple[List[dict], List[Transaction]]:
+        """解析模型响应，返回原始条目与校验通过的交易。"""
+        transactions_data = _robust_json_parse(content)
+        # _robust_json_parse 已展开 transactions 数组，格式按原始响应判断
+        try:
+            envelope = json.loads(_strip_markdown_fences(content or ""))
+        except json.JSONDecodeError:
+            envelope = None
+
+        # 新格式：{transaction_count, transactions}
+        if isinstance(envelope, dict) and "transactions" in envelope:
+            transaction_count = envelope.get("transaction_count", 0)
+            logger.info(
+                f"LLM声明识别到 {transaction_count} 条交易，实际返回 {len(transactions_data)} 条"
             )
-
-            # 解析响应
-            content = response.choices[0].message.content
-            logger.debug("视觉模型原始响应: %s", content)
-
-            response_data = _robust_json_parse(content)
-
-            # 新格式：{transaction_count, transactions}
-            if isinstance(response_data, dict) and "transactions" in response_data:
-                transaction_count = response_data.get("transaction_count", 0)
-                transactions_data = response_data.get("transactions", [])
-                logger.info(
-                    f"LLM声明识别到 {transaction_count} 条交易，实际返回 {len(transactions_data)} 条"
-                )
-            # 兼容旧格式：直接返回数组
-            elif isinstance(response_data, list):
-                transactions_data = response_data
-                logger.warning("LLM返回旧格式数组，未提供transaction_count")
-            else:
-                logger.error(f"无法识别的响应格式: {type(response_data)}")
-                transactions_data = []
+        # 兼容旧格式：直接返回数组
+        elif isinstance(envelope, list):
+            logger.warning("LLM返回旧格式数组，未提供transaction_count")
+
+        transactions: List[Transaction] = []
+        for idx, item in enumerate(transactions_data):
+            txn = _validate_and_fix_transaction(item, idx, source_hash)
+            if txn:
+                transactions.append(txn)
+        return transactions_data, transactions
+
+    def _recognize(
+        self, image_bytes: bytes, source_hash: str, cache_key: str
+    ) -> List[Transaction]:
+        """按级联顺序调用视觉模型识别单张图片并写入缓存。"""
+        try:
+            # 纠正方向、限制分辨率并重新压缩，控制上传体积
+            payload_bytes, mime_type = prepare_image_for_vision(image_bytes)
+            self._record_preprocess(len(image_bytes), len(payload_bytes))
+            base64_image = base64.b64encode(payload_bytes).decode("utf-8")
 
             transactions: List[Transaction] = []
-            for idx, item in enumerate(transactions_data):
-                txn = _validate_and_fix_transaction(item, idx, source_hash)
-                if txn:
-                    transactions.append(txn)
+            for position, model in enumerate(self.stages):
+                final_stage = position == len(self.stages) - 1
+                try:
+                    with deadline(VISION_STAGE_TIMEOUT):
+                        content = self._call_model(model, base64_image, mime_type)
+                except Exception as exc:  # pylint: disable=broad-except
+                    if final_stage:
+                        raise
+                    # 低价模型不可用时直接升级，不影响最终结果
+                    logger.warning("视觉模型 %s 调用失败，升级：%s", model, exc)
+                    CASCADE_STATS.record(model, ["error"], accepted=False)
+                    continue
+
+                entries, transactions = self._parse_content(content, source_hash)
+                issues = recognition_issues(content, entries, transactions)
+                if issues and not final_stage:
+                    logger.info("视觉模型 %s 结果未通过校验 %s，升级", model, issues)
+                    CASCADE_STATS.record(model, issues, accepted=False)
+                    continue
+                CASCADE_STATS.record(model, issues, accepted=True)
+                break
 
             logger.info(f"成功从图片中提取 {len(transactions)} 条交易记录")
+            if transactions:
+                # 空结果可能是临时失败，不写入缓存
+                self.cache.put(
+                    cache_key,
+                    [txn.model_dump(mode="json") for txn in transactions],
+                )
             return transactions
 
-        except json.JSONDecodeError as exc:
-            logger.error("JSON解析失败: %s, 原始响应: %s", exc, content)
-            raise
         except Exception as exc:
             logger.error("视觉OCR识别失败: %s", exc)
             raise
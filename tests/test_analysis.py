@@ -0,0 +1,62 @@
+"""Tests for grouped (median/MAD) anomaly detection."""
+
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import List
+
+from models.entities import Transaction
+from modules.analysis import compute_anomaly_report
+
+
+def _ledger() -> List[Transaction]:
+    start = date(2024, 1, 1)
+    transactions = [
+        Transaction(
+            id=f"rent-{i}",
+            date=start + timedelta(days=30 * i),
+            merchant="房东",
+            category="住房",
+            amount=3000.0,
+        )
+        for i in range(12)
+    ]
+    transactions += [
+        Transaction(
+            id=f"coffee-{i}",
+            date=start + timedelta(days=i),
+            merchant="咖啡店",
+            category="餐饮",
+            amount=20.0,
+        )
+        for i in range(30)
+    ]
+    transactions.append(
+        Transaction(
+            id="coffee-spike",
+            date=start + timedelta(days=31),
+            merchant="咖啡店",
+            category="餐饮",
+            amount=100.0,
+        )
+    )
+    return transactions
+
+
+def test_grouped_mode_ignores_constant_group():
+    report = compute_anomaly_report(_ledger(), mode="grouped")
+    flagged = {item["transaction_id"] for item in report["items"]}
+    assert not any(txn_id.startswith("rent-") for txn_id in flagged)
+
+
+def test_grouped_mode_flags_spike_in_constant_group():
+    report = compute_anomaly_report(_ledger(), mode="grouped")
+    items = {item["transaction_id"]: item for item in report["items"]}
+    assert set(items) == {"coffee-spike"}
+    assert items["coffee-spike"]["model"] == "merchant"
+    assert items["coffee-spike"]["z_score"] > 10
+
+
+def test_global_mode_unchanged():
+    report = compute_anomaly_report(_ledger(), mode="global")
+    assert all(item["model"] == "global" for item in report["items"])
@@ -0,0 +1,160 @@
+"""Tests for the incremental anomaly statistics."""
+
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pytest
+
+from modules.anomaly_engine import IncrementalAnomalyEngine, RunningStats
+
+
+def _stats(values) -> RunningStats:
+    stats = RunningStats()
+    for value in values:
+        stats.add(float(value))
+    return stats
+
+
+def _assert_matches(stats: RunningStats, values) -> None:
+    values = np.asarray(values, dtype=float)
+    assert stats.count == len(values)
+    if len(values):
+        assert stats.mean == pytest.approx(values.mean(), rel=1e-9, abs=1e-9)
+        assert stats.std == pytest.approx(values.std(), rel=1e-6, abs=1e-6)
+    else:
+        assert (stats.mean, stats.m2, stats.std) == (0.0, 0.0, 0.0)
+
+
+@pytest.fixture
+def amounts():
+    return np.random.default_rng(7).lognormal(4.0, 1.0, 200).round(2)
+
+
+def test_add_and_remove_track_numpy(amounts):
+    stats = _stats(amounts)
+    _assert_matches(stats, amounts)
+
+    for value in amounts[150:][::-1]:
+        stats.remove(float(value))
+    _assert_matches(stats, amounts[:150])
+
+    for value in amounts[:150]:
+        stats.remove(float(value))
+    _assert_matches(stats, [])
+
+
+def test_single_value_and_empty_edge_cases():
+    stats = _stats([42.0])
+    _assert_matches(stats, [42.0])
+    assert stats.variance == 0.0
+
+    stats.remove(42.0)
+    _assert_matches(stats, [])
+    # 空统计再移除保持为空，不出现负计数
+    stats.remove(1.0)
+    _assert_matches(stats, [])
+
+    stats.add(5.0)
+    _assert_matches(stats, [5.0])
+
+
+def test_merge_and_subtract_track_numpy(amounts):
+    left, right = amounts[:120], amounts[120:]
+    merged = _stats(left).merge(_stats(right))
+    _assert_matches(merged, amounts)
+
+    _assert_matches(merged.subtract(_stats(right)), left)
+    _assert_matches(merged.subtract(_stats(left)), right)
+    _assert_matches(merged.subtract(merged), [])
+
+
+@pytest.mark.parametrize(
+    "left, right",
+    [([], []), ([], [3.0]), ([3.0], []), ([3.0], [7.0]), ([1.0, 2.0], [9.0])],
+)
+def test_merge_and_subtract_small_samples(left, right):
+    merged = _stats(left).merge(_stats(right))
+    _assert_matches(merged, left + right)
+    _assert_matches(merged.subtract(_stats(right)), left)
+
+
+def _records(amounts):
+    merchants = ("超市", "咖啡店", "房东", "加油站")
+    return [
+        {
+            "id": f"t{i}",
+            "amount": float(amount),
+            "merchant": merchants[i % len(merchants)],
+            "category": "餐饮" if i % 2 else "住房",
+        }
+        for i, amount in enumerate(amounts)
+    ]
+
+
+def _assert_engine_matches(engine: IncrementalAnomalyEngine, records) -> None:
+    _assert_matches(engine.global_stats, [r["amount"] for r in records])
+    assert engine.matches(records)
+    for group in engine.group_by:
+        keys = {r[group] for r in records}
+        assert set(engine.groups[group]) == keys
+        for key in keys:
+            values = [r["amount"] for r in records if r[group] == key]
+            _assert_matches(engine.group_stats(group, key), values)
+
+
+def test_engine_add_remove_and_replace(amounts):
+    records = _records(amounts)
+    engine = IncrementalAnomalyEngine.from_records(
+        records[:100], group_by=("category", "merchant")
+    )
+    _assert_engine_matches(engine, records[:100])
+
+    assert engine.add(records[100:]) == 100
+    _assert_engine_matches(engine, records)
+
+    assert engine.remove(records[:50]) == 50
+    _assert_engine_matches(engine, records[50:])
+
+    # 只改一条金额：replace 只移除旧行、加入新行
+    edited = records[50:]
+    edited[0] = {**edited[0], "amount": edited[0]["amount"] + 1}
+    assert engine.replace(records[50:], edited) == 2
+    _assert_engine_matches(engine, edited)
+
+    engine.remove(edited)
+    _assert_engine_matches(engine, [])
+    assert engine.groups == {"category": {}, "merchant": {}}
+
+
+def test_engine_stats_excluding_merchants(amounts):
+    records = _records(amounts)
+    engine = IncrementalAnomalyEngine.from_records(records)
+    kept = [r["amount"] for r in records if r["merchant"] not in ("超市", "房东")]
+    _assert_matches(engine.stats(["超市", "房东", "不存在"]), kept)
+    _assert_matches(engine.stats(), [r["amount"] for r in records])
+    everyone = {r["merchant"] for r in records}
+    _assert_matches(engine.stats(everyone), [])
+
+    # 未按商户分组时无法扣除，调用方应回退到全量计算
+    assert IncrementalAnomalyEngine.from_records(records, group_by=()).stats(["超市"]) is None
+
+
+def test_engine_round_trip_and_matches(amounts):
+    records = _records(amounts)
+    engine = IncrementalAnomalyEngine.from_records(records)
+    restored = IncrementalAnomalyEngine.from_dict(json.loads(json.dumps(engine.to_dict())))
+
+    _assert_engine_matches(restored, records)
+    assert not restored.matches(records[:-1])
+    changed = records[:-1] + [{**records[-1], "amount": records[-1]["amount"] + 0.01}]
+    assert not restored.matches(changed)
+
+
+def test_engine_snapshot_without_total_is_rejected(amounts):
+    records = _records(amounts)
+    payload = IncrementalAnomalyEngine.from_records(records).to_dict()
+    del payload["total"]
+    assert not IncrementalAnomalyEngine.from_dict(payload).matches(records)
+    assert IncrementalAnomalyEngine().matches([])
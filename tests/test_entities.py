@@ -0,0 +1,76 @@
+"""Tests for the compact transaction record."""
+
+from __future__ import annotations
+
+import copy
+import datetime as dt
+import pickle
+import tracemalloc
+
+import pytest
+
+from models.entities import Transaction, TransactionRecord
+
+
+def _record() -> TransactionRecord:
+    return TransactionRecord.from_any(
+        {
+            "id": "t1",
+            "date": "2024-01-05",
+            "merchant": "超市",
+            "category": "餐饮",
+            "amount": 12.5,
+            "line_items": [
+                {"description": "牛奶", "quantity": 2, "unit_price": 5, "amount": 10}
+            ],
+            "receipt_time": "2024-01-05T10:30:00",
+        }
+    )
+
+
+def test_record_is_read_only():
+    record = _record()
+    with pytest.raises(AttributeError):
+        record.amount = 1.0
+
+
+def test_pickle_round_trip():
+    record = _record()
+    restored = pickle.loads(pickle.dumps(record))
+    assert restored == record
+    assert restored.to_dict() == record.to_dict()
+    with pytest.raises(AttributeError):
+        restored.amount = 1.0
+
+
+def test_copy_and_deepcopy():
+    record = _record()
+    assert copy.copy(record) == record
+    assert copy.deepcopy({"transactions": [record]})["transactions"] == [record]
+
+
+def test_record_uses_far_less_memory_than_model():
+    rows = [
+        {
+            "id": f"t{i}",
+            "date": dt.date(2024, 1, 1 + i % 28),
+            "merchant": f"商户{i % 50}",
+            "category": "餐饮",
+            "amount": float(i),
+        }
+        for i in range(2000)
+    ]
+
+    def _traced(build):
+        tracemalloc.start()
+        try:
+            built = build()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del built
+        return size
+
+    model_bytes = _traced(lambda: [Transaction(**row) for row in rows])
+    record_bytes = _traced(lambda: [TransactionRecord.from_any(row) for row in rows])
+    assert record_bytes * 4 < model_bytes
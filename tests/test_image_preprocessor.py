@@ -0,0 +1,37 @@
+"""Tests for bill image normalisation."""
+
+from __future__ import annotations
+
+import io
+
+import pytest
+from PIL import Image
+
+from services.image_preprocessor import prepare_image_for_vision
+from utils.error_handling import UserFacingError
+
+
+def _png(size=(400, 300), color=(255, 255, 255)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_large_image_is_downscaled():
+    payload, mime_type = prepare_image_for_vision(_png((1000, 500)), max_edge=256)
+    with Image.open(io.BytesIO(payload)) as image:
+        assert max(image.size) == 256
+    assert mime_type in ("image/jpeg", "image/png")
+
+
+def test_undecodable_bytes_pass_through():
+    assert prepare_image_for_vision(b"not an image") == (b"not an image", "image/png")
+
+
+def test_decompression_bomb_is_rejected(monkeypatch):
+    # 超过上限两倍时 Pillow 抛出 DecompressionBombError
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(UserFacingError) as excinfo:
+        prepare_image_for_vision(_png((100, 100)))
+    assert isinstance(excinfo.value.original_error, Image.DecompressionBombError)
+    assert excinfo.value.suggestion
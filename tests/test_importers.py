@@ -0,0 +1,97 @@
+"""Tests for the vectorised transaction importer."""
+
+from __future__ import annotations
+
+import io
+from datetime import date
+
+import pandas as pd
+
+from utils.importers import (
+    CSV_FALLBACK_ENCODING,
+    detect_encoding,
+    iter_csv_frames,
+    normalize_transaction_frame,
+)
+from utils.transactions import generate_transaction_id
+
+
+def _legacy_ids(rows, date_strings, source_hash):
+    """IDs the row-by-row importer produced (date hashed as it formatted it)."""
+    return [
+        generate_transaction_id(
+            merchant=merchant,
+            date_value=date_str,
+            amount=amount,
+            currency="CNY",
+            source_hash=source_hash,
+            sequence=sequence,
+        )
+        for sequence, ((merchant, amount), date_str) in enumerate(
+            zip(rows, date_strings), start=1
+        )
+    ]
+
+
+def test_ids_match_row_wise_importer_for_text_dates():
+    rows = [("超市", 12.5), ("Coffee", 30.0), ("书店", 88.0)]
+    df = pd.DataFrame(
+        {
+            "date": ["2024/01/05", " 2024-01-06 ", "20240107"],
+            "merchant": [merchant for merchant, _ in rows],
+            "amount": [amount for _, amount in rows],
+        }
+    )
+    frame = normalize_transaction_frame(df, source_hash="abc")
+    expected = _legacy_ids(rows, ["2024/01/05", "2024-01-06", "20240107"], "abc")
+    assert frame["id"].tolist() == expected
+    assert frame["date"].dt.strftime("%Y-%m-%d").tolist() == [
+        "2024-01-05",
+        "2024-01-06",
+        "2024-01-07",
+    ]
+
+
+def test_ids_match_row_wise_importer_for_date_values():
+    rows = [("超市", 12.5), ("Coffee", 30.0)]
+    timestamps = pd.DataFrame(
+        {
+            "date": [pd.Timestamp(2024, 1, 5, 10, 30), pd.Timestamp(2024, 1, 6)],
+            "merchant": [merchant for merchant, _ in rows],
+            "amount": [amount for _, amount in rows],
+        }
+    )
+    frame = normalize_transaction_frame(timestamps)
+    assert frame["id"].tolist() == _legacy_ids(rows, ["2024-01-05", "2024-01-06"], None)
+
+    dates = timestamps.assign(date=[date(2024, 1, 5), date(2024, 1, 6)])
+    frame = normalize_transaction_frame(dates)
+    assert frame["id"].tolist() == _legacy_ids(rows, ["2024-01-05", "2024-01-06"], None)
+
+
+def test_gbk_file_with_ascii_head_imports_completely():
+    ascii_rows = "".join(f"2024-01-01,Shop{i},10\n" for i in range(5000))
+    payload = ("date,merchant,amount\n" + ascii_rows + "2024-01-02,超市,25\n").encode("gbk")
+    assert len(ascii_rows) > 64 * 1024
+    handle = io.BytesIO(payload)
+
+    assert detect_encoding(handle) == CSV_FALLBACK_ENCODING
+    assert handle.tell() == 0
+    frames = [frame for frame, _, _ in iter_csv_frames(handle, chunk_rows=1000)]
+    merchants = pd.concat(frames)["merchant"].tolist()
+    assert len(merchants) == 5001
+    assert merchants[-1] == "超市"
+
+
+def test_malformed_lines_are_counted_across_chunks():
+    rows = [f"2024-01-0{i % 9 + 1},Shop{i},{i + 1}" for i in range(10)]
+    # 第 4 行恰好落在分块边界上，尾部是账单汇总行
+    rows.insert(4, "2024-01-01,Shop,1,extra,fields")
+    rows.insert(8, "2024-01-01,Shop,1,extra")
+    rows.append("合计,10 笔,45,元,完")
+    handle = io.BytesIO(("date,merchant,amount\n" + "\n".join(rows) + "\n").encode())
+
+    chunks = list(iter_csv_frames(handle, chunk_rows=4))
+    merchants = pd.concat(frame for frame, _, _ in chunks)["merchant"].tolist()
+    assert merchants == [f"Shop{i}" for i in range(10)]
+    assert chunks[-1][1:] == (1.0, 3)
@@ -0,0 +1,153 @@
+"""Tests for the client-side LLM rate limiter and retry loop."""
+
+from __future__ import annotations
+
+import importlib
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from openai import DefaultHttpxClient, RateLimitError
+
+from services import llm_scheduler
+from services.llm_scheduler import (
+    MAX_RETRIES,
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMScheduler,
+    TokenBucket,
+    backoff_delay,
+    retry_after_seconds,
+)
+
+# SDK 底层的 HTTP 库（httpx 或 httpx2），用于构造带响应头的 API 错误
+_http = importlib.import_module(
+    next(
+        cls for cls in DefaultHttpxClient.__mro__[1:] if cls.__name__ == "Client"
+    ).__module__.split(".")[0]
+)
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def _rate_limit_error(headers=None) -> RateLimitError:
+    request = _http.Request("POST", "https://api.example.com/v1/chat/completions")
+    response = _http.Response(429, headers=headers or {}, request=request)
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+class _RecordingScheduler(LLMScheduler):
+    def __init__(self, limits) -> None:
+        super().__init__(limits)
+        self.settled = []
+
+    def settle(self, model, reserved, used):
+        self.settled.append((reserved, used))
+        super().settle(model, reserved, used)
+
+
+def _client(outcomes):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return client, calls
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(llm_scheduler.time, "sleep", lambda seconds: None)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    bucket.take(60)
+    assert bucket.wait_time(30, now) == pytest.approx(30.0)
+    assert bucket.wait_time(30, now + 30) == 0.0
+    bucket.give_back(1000)
+    assert bucket.level == bucket.capacity
+
+
+def test_token_bucket_admits_oversized_request_when_full():
+    bucket = TokenBucket(100)
+    assert bucket.wait_time(500, bucket.updated) == 0.0
+    bucket.take(500)
+    assert bucket.level == 0.0
+
+
+def test_lower_priority_yields_to_waiting_higher_priority():
+    scheduler = LLMScheduler({"m": (600, 1_000_000)})
+    budget = scheduler._budget("m")
+    budget.requests.level = 0.0
+    order = []
+
+    def worker(priority):
+        scheduler.acquire("m", 10, priority)
+        order.append(priority)
+
+    background = threading.Thread(target=worker, args=(PRIORITY_BACKGROUND,))
+    background.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=worker, args=(PRIORITY_INTERACTIVE,))
+    interactive.start()
+    background.join(5)
+    interactive.join(5)
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
+
+
+def test_retries_rate_limit_and_refunds_failed_reservations(no_sleep):
+    scheduler = _RecordingScheduler({"m": (1000, 1_000_000)})
+    response = SimpleNamespace(usage=SimpleNamespace(total_tokens=12))
+    error = _rate_limit_error({"retry-after-ms": "0"})
+    client, calls = _client([error, error, response])
+
+    result = scheduler.create_chat_completion(client, model="m", messages=MESSAGES)
+
+    assert result is response
+    assert len(calls) == 3
+    reserved = scheduler.settled[0][0]
+    assert scheduler.settled == [(reserved, 0), (reserved, 0), (reserved, 12)]
+    assert scheduler.stats["rate_limited"] == 2
+
+
+def test_gives_up_after_max_retries(no_sleep):
+    scheduler = _RecordingScheduler({"m": (1000, 1_000_000)})
+    client, calls = _client([_rate_limit_error({"retry-after-ms": "0"})])
+
+    with pytest.raises(RateLimitError):
+        scheduler.create_chat_completion(client, model="m", messages=MESSAGES)
+
+    assert len(calls) == MAX_RETRIES + 1
+    assert all(used == 0 for _, used in scheduler.settled)
+
+
+def test_non_retryable_error_is_raised_immediately(no_sleep):
+    scheduler = _RecordingScheduler({"m": (1000, 1_000_000)})
+    client, calls = _client([ValueError("bad request")])
+
+    with pytest.raises(ValueError):
+        scheduler.create_chat_completion(client, model="m", messages=MESSAGES)
+
+    assert len(calls) == 1
+    assert [used for _, used in scheduler.settled] == [0]
+
+
+def test_backoff_delay_bounds():
+    for attempt in range(6):
+        cap = min(llm_scheduler.BACKOFF_CAP, llm_scheduler.BACKOFF_BASE * 2**attempt)
+        assert 0.0 <= backoff_delay(attempt) <= cap
+    assert 3.0 <= backoff_delay(0, retry_after=3.0) <= 3.3
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(_rate_limit_error({"retry-after-ms": "1500"})) == 1.5
+    assert retry_after_seconds(_rate_limit_error({"retry-after": "2"})) == 2.0
+    assert retry_after_seconds(_rate_limit_error()) is None
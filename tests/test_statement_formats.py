@@ -0,0 +1,177 @@
+"""Fixture tests for the fixed-layout statement parsers."""
+
+from __future__ import annotations
+
+import csv
+import io
+
+import pandas as pd
+import pytest
+
+from utils.importers import iter_csv_frames, sniff_csv
+from utils.statement_formats import (
+    HEADER_SCAN_ROWS,
+    canonical_header,
+    detect_format,
+    infer_categories,
+)
+
+# 每种格式一份最小样例：导出时的前置说明行 + 表头 + 支出/收入/失败等行
+SAMPLES = {
+    "alipay": (
+        "支付宝交易明细\n"
+        "账号:[user@example.com]\n"
+        "起始日期:[2024-01-01 00:00:00]    终止日期:[2024-01-31 23:59:59]\n"
+        "交易时间,交易分类,交易对方,对方账号,商品说明,收/支,金额,收/付款方式,交易状态,交易订单号\n"
+        "2024-01-05 12:30:00,餐饮美食,肯德基,kfc***,午餐套餐,支出,35.50,花呗,交易成功,A001\n"
+        "2024-01-06 09:00:00,转账红包,张三,zs***,转账,收入,200.00,余额,交易成功,A002\n"
+        "2024-01-07 18:00:00,日用百货,,tm***,天猫超市订单,支出,88.00,,交易关闭,A003\n"
+        '2024-01-08 20:15:00,日用百货,,tm***,天猫超市订单,支出,"1,288.00",,交易成功,A004\n'
+    ),
+    "alipay_legacy": (
+        "支付宝交易记录明细查询\n"
+        "账号:[20880000000000000000]\n"
+        "交易号,商户订单号,交易创建时间,付款时间,交易对方,商品名称,金额（元）,收/支,交易状态\n"
+        "L001,M001,2024-02-01 08:00:00,2024-02-01 08:00:05,滴滴出行,快车,23.40,支出,交易成功\n"
+        "L002,M002,2024-02-02 10:00:00,2024-02-02 10:00:02,李四,还款,50.00,收入,交易成功\n"
+        "L003,M003,2024-02-03 11:00:00,,某书店,教材,60.00,支出,退款成功（全额退款）\n"
+    ),
+    "wechat": (
+        "微信支付账单明细\n"
+        "微信昵称：[测试]\n"
+        "----------------------微信支付账单明细列表--------------------\n"
+        "交易时间,交易类型,交易对方,商品,收/支,金额(元),支付方式,当前状态,交易单号,商户单号,备注\n"
+        "2024-03-01 07:45:00,商户消费,瑞幸咖啡,生椰拿铁,支出,¥15.90,零钱,支付成功,W001,S001,/\n"
+        "2024-03-02 12:00:00,微信红包,王五,/,收入,¥8.88,/,已存入零钱,W002,/,/\n"
+        "2024-03-03 19:00:00,商户消费,电影院,,支出,¥45.00,,支付成功,W003,S003,/\n"
+    ),
+    "icbc": (
+        "中国工商银行借记账户历史明细\n"
+        "卡号: 6222 **** 1234\n"
+        "交易日期,摘要,交易场所,发生额(收入),发生额(支出),余额,钱币,对方户名\n"
+        "2024-04-01,消费,北京华联超市,,126.30,5000.00,人民币,\n"
+        "2024-04-02,工资,,8000.00,,13000.00,人民币,某公司\n"
+        "2024-04-03,医疗,,,300.00,12700.00,美元,某医院\n"
+    ),
+    "bank_split": (
+        "账户明细\n"
+        "交易日期,交易类型,收入,支出,余额,币种,对方户名,交易备注\n"
+        "2024-05-01,消费,,42.00,958.00,人民币,,地铁充值\n"
+        "2024-05-02,转账,1000.00,,1958.00,人民币,赵六,\n"
+        "2024-05-03,消费,,19.90,1938.10,港币,网易云音乐,会员续费\n"
+    ),
+    "bank_signed": (
+        "交易日期,交易金额,账户余额,币种,对方户名,摘要\n"
+        "2024-06-01,-58.00,942.00,人民币,美团外卖,网上支付\n"
+        "2024-06-02,+3000.00,3942.00,人民币,某公司,代发工资\n"
+        "2024-06-03,-1200.00,2742.00,人民币,,学费\n"
+    ),
+}
+
+# (日期, 商户, 分类, 金额, 币种, 支付方式)
+EXPECTED = {
+    "alipay": [
+        ("2024-01-05", "肯德基", "餐饮", 35.5, "CNY", "花呗"),
+        ("2024-01-08", "天猫超市订单", "购物", 1288.0, "CNY", "支付宝"),
+    ],
+    "alipay_legacy": [
+        ("2024-02-01", "滴滴出行", "交通", 23.4, "CNY", "支付宝"),
+    ],
+    "wechat": [
+        ("2024-03-01", "瑞幸咖啡", "餐饮", 15.9, "CNY", "零钱"),
+        ("2024-03-03", "电影院", "娱乐", 45.0, "CNY", "微信支付"),
+    ],
+    "icbc": [
+        ("2024-04-01", "北京华联超市", "购物", 126.3, "CNY", "工商银行"),
+        ("2024-04-03", "某医院", "医疗", 300.0, "USD", "工商银行"),
+    ],
+    "bank_split": [
+        ("2024-05-01", "地铁充值", "交通", 42.0, "CNY", None),
+        ("2024-05-03", "网易云音乐", "娱乐", 19.9, "HKD", None),
+    ],
+    "bank_signed": [
+        ("2024-06-01", "美团外卖", "餐饮", 58.0, "CNY", None),
+        ("2024-06-03", "学费", "教育", 1200.0, "CNY", None),
+    ],
+}
+
+HEADER_ROWS = {
+    "alipay": 3,
+    "alipay_legacy": 2,
+    "wechat": 3,
+    "icbc": 2,
+    "bank_split": 1,
+    "bank_signed": 0,
+}
+
+
+def _import(text: str, encoding: str = "utf-8") -> pd.DataFrame:
+    handle = io.BytesIO(text.encode(encoding))
+    frames = [frame for frame, _, _ in iter_csv_frames(handle, source_hash="h")]
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("name", list(SAMPLES))
+def test_detects_header_after_preamble(name):
+    rows = csv.reader(SAMPLES[name].splitlines())
+    statement_format, header_row = detect_format(rows)
+    assert statement_format is not None
+    assert statement_format.name == name
+    assert header_row == HEADER_ROWS[name]
+
+
+@pytest.mark.parametrize("name", list(SAMPLES))
+def test_maps_expense_rows_and_drops_the_rest(name):
+    frame = _import(SAMPLES[name])
+    rows = [
+        (
+            row.date.strftime("%Y-%m-%d"),
+            row.merchant,
+            row.category,
+            row.amount,
+            row.currency,
+            row.payment_method,
+        )
+        for row in frame.itertuples()
+    ]
+    assert rows == EXPECTED[name]
+
+
+def test_export_order_ids_are_kept():
+    frame = _import(SAMPLES["alipay"])
+    assert frame["id"].tolist() == ["A001", "A004"]
+    # 无订单号的银行流水按内容哈希生成ID
+    generated = _import(SAMPLES["bank_signed"])["id"]
+    assert generated.str.fullmatch(r"[0-9a-f]{16}").all()
+
+
+def test_gbk_export_with_fullwidth_headers():
+    text = SAMPLES["icbc"].replace("(", "（").replace(")", "）")
+    handle = io.BytesIO(text.encode("gbk"))
+    encoding, statement_format, header_row = sniff_csv(handle)
+    assert encoding == "gb18030"
+    assert statement_format.name == "icbc"
+    assert header_row == HEADER_ROWS["icbc"]
+    assert _import(text, "gbk")["merchant"].tolist() == ["北京华联超市", "某医院"]
+
+
+def test_generic_csv_is_not_claimed_by_a_layout():
+    rows = [["date", "merchant", "amount"], ["2024-01-01", "超市", "10"]]
+    assert detect_format(rows) == (None, 0)
+    # 表头出现得太靠后则不再识别
+    header = SAMPLES["bank_signed"].splitlines()[0].split(",")
+    assert detect_format([["说明"]] * HEADER_SCAN_ROWS + [header]) == (None, 0)
+
+
+def test_canonical_header_normalises_exports():
+    assert canonical_header("\ufeff 金额（元） ") == "金额(元)"
+    assert canonical_header('"收/支"') == "收/支"
+
+
+def test_infer_categories_uses_first_matching_keyword_group():
+    categories = infer_categories(
+        pd.Series(["餐饮美食", "", "", "", "转账"]),
+        pd.Series(["", "滴滴快车", "京东自营", "美团打车", "给朋友"]),
+    )
+    # “美团”属于餐饮且排在交通之前，先命中者生效
+    assert categories.tolist() == ["餐饮", "交通", "购物", "餐饮", "其他"]
@@ -0,0 +1,277 @@
+"""Tests for the persistence backends."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from collections import OrderedDict
+
+import pytest
+
+from utils import storage
+from utils.storage import (
+    STORAGE_PREFIX,
+    TRANSACTIONS_KEY,
+    FileStorageBackend,
+    SQLiteStorageBackend,
+    load_from_storage,
+    save_to_storage,
+    user_namespace,
+)
+
+
+def _txn(txn_id: str, amount: float = 10.0) -> dict:
+    return {
+        "id": txn_id,
+        "date": "2024-01-05",
+        "merchant": "超市",
+        "category": "餐饮",
+        "amount": amount,
+    }
+
+
+def _on_disk(path) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text("utf-8"))
+
+
+class _CountingFileBackend(FileStorageBackend):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.rewrites = 0
+        self.fail = False
+
+    def _save_all(self, data):
+        self.rewrites += 1
+        return False if self.fail else super()._save_all(data)
+
+
+def test_file_saves_within_window_become_one_rewrite(tmp_path):
+    path = tmp_path / "data.json"
+    backend = _CountingFileBackend(path, flush_delay=0.5)
+    assert backend.save("budget", 1)
+    timer = backend._timer
+    assert backend.save("budget", 2)
+    assert backend.save("locale", "zh_CN")
+
+    # 落盘前读取已能看到缓冲中的值
+    assert backend.load("budget") == 2
+    assert _on_disk(path) == {}
+    timer.join(5)
+    assert backend.rewrites == 1
+    assert _on_disk(path) == {
+        f"{STORAGE_PREFIX}budget": 2,
+        f"{STORAGE_PREFIX}locale": "zh_CN",
+    }
+
+
+def test_file_failed_flush_keeps_writes_buffered(tmp_path):
+    path = tmp_path / "data.json"
+    backend = _CountingFileBackend(path, flush_delay=60)
+    backend.save("budget", 1)
+    backend.fail = True
+    assert not backend.flush()
+    assert backend.load("budget") == 1
+
+    backend.fail = False
+    backend.close()
+    assert backend._timer is None
+    assert _on_disk(path) == {f"{STORAGE_PREFIX}budget": 1}
+
+
+def test_file_ledger_save_returns_after_it_is_on_disk(tmp_path):
+    path = tmp_path / "data.json"
+    backend = _CountingFileBackend(path, flush_delay=60)
+    backend.save("budget", 1)
+    assert backend.save(TRANSACTIONS_KEY, [_txn("a")])
+    # 账本连同已缓冲的其他键一次写入
+    assert backend.rewrites == 1
+    on_disk = _on_disk(path)
+    assert [entry["id"] for entry in on_disk[f"{STORAGE_PREFIX}{TRANSACTIONS_KEY}"]] == ["a"]
+    assert on_disk[f"{STORAGE_PREFIX}budget"] == 1
+
+    backend.fail = True
+    assert not backend.save(TRANSACTIONS_KEY, [_txn("b")])
+
+
+def test_file_write_through_without_delay(tmp_path):
+    path = tmp_path / "data.json"
+    backend = _CountingFileBackend(path, flush_delay=0)
+    assert backend.save("budget", 1)
+    assert backend._timer is None
+    assert _on_disk(path) == {f"{STORAGE_PREFIX}budget": 1}
+
+
+def _sqlite(tmp_path) -> SQLiteStorageBackend:
+    return SQLiteStorageBackend(tmp_path / "data.sqlite3")
+
+
+def test_sqlite_save_and_load(tmp_path):
+    backend = _sqlite(tmp_path)
+    assert backend.load("budget", 0) == 0
+    assert backend.save("budget", {"monthly": 3000})
+    assert backend.save(TRANSACTIONS_KEY, [_txn("a"), _txn("b")])
+
+    reopened = _sqlite(tmp_path)
+    assert reopened.load("budget") == {"monthly": 3000}
+    assert [entry["id"] for entry in reopened.load(TRANSACTIONS_KEY)] == ["a", "b"]
+    assert backend.save(TRANSACTIONS_KEY, [])
+    assert backend.load(TRANSACTIONS_KEY, None) == []
+
+
+def test_sqlite_append_and_query(tmp_path):
+    backend = _sqlite(tmp_path)
+    assert backend.append(TRANSACTIONS_KEY, [_txn("a")])
+    assert backend.append(TRANSACTIONS_KEY, [_txn("b", 99.0), _txn("c")])
+    assert [entry["id"] for entry in backend.load(TRANSACTIONS_KEY)] == ["a", "b", "c"]
+    assert backend.query_transactions(merchant="超市", start_date="2024-01-01")[1]["amount"] == 99.0
+
+
+def test_sqlite_append_migrates_legacy_inline_ledger(tmp_path):
+    backend = _sqlite(tmp_path)
+    backend._conn.execute(
+        "INSERT INTO kv (key, value) VALUES (?, ?)",
+        (f"{STORAGE_PREFIX}{TRANSACTIONS_KEY}", json.dumps([_txn("old")])),
+    )
+    assert backend.append(TRANSACTIONS_KEY, [_txn("new")])
+    assert [entry["id"] for entry in backend.load(TRANSACTIONS_KEY)] == ["old", "new"]
+    assert backend.query_transactions()[0]["id"] == "old"
+
+
+def test_sqlite_failed_save_rolls_back(tmp_path):
+    backend = _sqlite(tmp_path)
+    backend.save(TRANSACTIONS_KEY, [_txn("a")])
+    # 第二条无法序列化，整个事务应回滚，原账本保持不变
+    assert not backend.save(TRANSACTIONS_KEY, [_txn("b"), {**_txn("c"), "amount": object()}])
+    assert not backend._conn.in_transaction
+    assert [entry["id"] for entry in backend.load(TRANSACTIONS_KEY)] == ["a"]
+
+
+def test_sqlite_locked_database_reports_failure(tmp_path, caplog):
+    backend = _sqlite(tmp_path)
+    backend._conn.execute("PRAGMA busy_timeout=0")
+    other = sqlite3.connect(str(backend.db_file), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        assert not backend.save("budget", 1)
+        assert not backend.append(TRANSACTIONS_KEY, [_txn("a")])
+        assert not backend.clear()
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    # 记录的是真实原因（数据库被锁），而非 ROLLBACK 的“无活动事务”
+    assert "locked" in caplog.text
+    assert "no transaction is active" not in caplog.text
+    assert backend.save("budget", 1)
+
+
+@pytest.fixture
+def namespaces(tmp_path, monkeypatch):
+    """Fresh per-namespace cache rooted in ``tmp_path``, holding at most two spaces."""
+    for name in ("WEFINANCE_STORAGE_BACKEND", "WEFINANCE_LEDGER_FORMAT", "WEFINANCE_LEDGER_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(storage, "STORAGE_FILE", tmp_path / "data.json")
+    monkeypatch.setattr(storage, "_spaces", OrderedDict())
+    monkeypatch.setattr(storage, "_max_namespaces", 2)
+    yield tmp_path
+    for space in storage._spaces.values():
+        space.backend.close()
+
+
+def test_user_named_default_is_isolated_from_anonymous(namespaces):
+    save_to_storage("budget", 1)
+    save_to_storage("budget", 2, namespace=user_namespace("default"))
+    save_to_storage("budget", 3, namespace=user_namespace("alice"))
+
+    assert load_from_storage("budget") == 1
+    assert load_from_storage("budget", namespace=user_namespace("default")) == 2
+    assert load_from_storage("budget", namespace=user_namespace("alice")) == 3
+    assert user_namespace(" ") == storage.DEFAULT_NAMESPACE
+
+
+def test_eviction_flushes_idle_namespace(namespaces):
+    for user in ("a", "b", "c"):
+        save_to_storage("budget", user, namespace=user_namespace(user))
+
+    assert user_namespace("a") not in storage._spaces
+    assert len(storage._spaces) == 2
+    # 缓冲写入在淘汰时已落盘
+    on_disk = json.loads((namespaces / "users" / "a" / "data.json").read_text("utf-8"))
+    assert on_disk[f"{STORAGE_PREFIX}budget"] == "a"
+    assert load_from_storage("budget", namespace=user_namespace("a")) == "a"
+
+
+def test_borrowed_namespace_is_never_evicted_or_duplicated(namespaces):
+    with storage._using_space(user_namespace("a")) as held:
+        for user in ("b", "c", "d"):
+            save_to_storage("budget", user, namespace=user_namespace(user))
+        assert storage._spaces[user_namespace("a")] is held
+        save_to_storage("budget", "a", namespace=user_namespace("a"))
+        assert storage._spaces[user_namespace("a")] is held
+
+    # 归还后按最近使用顺序正常淘汰
+    for user in ("e", "f"):
+        save_to_storage("budget", user, namespace=user_namespace(user))
+    assert user_namespace("a") not in storage._spaces
+
+
+def test_evicted_sqlite_backend_is_closed(namespaces, monkeypatch):
+    monkeypatch.setenv("WEFINANCE_STORAGE_BACKEND", "sqlite")
+    save_to_storage("budget", 1, namespace=user_namespace("a"))
+    backend = storage._spaces[user_namespace("a")].backend
+    for user in ("b", "c"):
+        save_to_storage("budget", 2, namespace=user_namespace(user))
+
+    with pytest.raises(sqlite3.ProgrammingError):
+        backend.load("budget")
+    assert load_from_storage("budget", namespace=user_namespace("a")) == 1
+
+
+def _reopen_all() -> None:
+    """Close every cached namespace so the next call opens it afresh."""
+    for space in storage._spaces.values():
+        space.backend.close()
+    storage._spaces.clear()
+
+
+def test_inline_ledger_migrates_to_log_once(namespaces, monkeypatch):
+    alice = user_namespace("alice")
+    monkeypatch.setenv("WEFINANCE_LEDGER_FORMAT", "json")
+    save_to_storage(TRANSACTIONS_KEY, [_txn("a"), _txn("b")], namespace=alice)
+    _reopen_all()
+
+    monkeypatch.setenv("WEFINANCE_LEDGER_FORMAT", "log")
+    checks = []
+    original_exists = storage.TransactionLog.exists
+    monkeypatch.setattr(
+        storage.TransactionLog,
+        "exists",
+        lambda self: checks.append(1) or original_exists(self),
+    )
+    for _ in range(3):
+        ledger = load_from_storage(TRANSACTIONS_KEY, namespace=alice)
+        assert [entry["id"] for entry in ledger] == ["a", "b"]
+    storage.append_to_storage(TRANSACTIONS_KEY, [_txn("c")], namespace=alice)
+
+    assert len(checks) == 1
+    with storage.storage_backend(alice) as backend:
+        assert backend.load(TRANSACTIONS_KEY) == []
+    streamed = storage.iter_from_storage(TRANSACTIONS_KEY, namespace=alice)
+    assert [entry["id"] for entry in streamed] == ["a", "b", "c"]
+
+
+def test_switching_back_to_json_restores_logged_ledger(namespaces, monkeypatch):
+    alice = user_namespace("alice")
+    save_to_storage(TRANSACTIONS_KEY, [_txn("a")], namespace=alice)
+    storage.append_to_storage(TRANSACTIONS_KEY, [_txn("b")], namespace=alice)
+    log_dir = namespaces / "users" / "alice" / "ledger"
+    assert any(log_dir.iterdir())
+    _reopen_all()
+
+    monkeypatch.setenv("WEFINANCE_LEDGER_FORMAT", "json")
+    ids = [entry["id"] for entry in load_from_storage(TRANSACTIONS_KEY, namespace=alice)]
+    assert ids == ["a", "b"]
+    assert not any(log_dir.iterdir())
+    on_disk = json.loads((namespaces / "users" / "alice" / "data.json").read_text("utf-8"))
+    assert [entry["id"] for entry in on_disk[f"{STORAGE_PREFIX}{TRANSACTIONS_KEY}"]] == ["a", "b"]
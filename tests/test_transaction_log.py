@@ -0,0 +1,81 @@
+"""Tests for the segmented ledger log."""
+
+from __future__ import annotations
+
+import pytest
+
+from utils import transaction_log
+from utils.transaction_log import TransactionLog
+
+
+def _records(start: int, count: int) -> list:
+    return [{"id": f"t{i}", "amount": float(i)} for i in range(start, start + count)]
+
+
+def _ids(log: TransactionLog) -> list:
+    return [record["id"] for record in log.iter_records()]
+
+
+@pytest.fixture
+def small_segments(monkeypatch):
+    monkeypatch.setattr(transaction_log, "SEGMENT_MAX_BYTES", 200)
+
+
+def test_append_rotates_segments_and_keeps_order(tmp_path, small_segments):
+    log = TransactionLog(tmp_path)
+    for start in range(0, 30, 5):
+        log.append(_records(start, 5))
+
+    assert len(log._segments()) > 1
+    assert _ids(log) == [f"t{i}" for i in range(30)]
+
+
+def test_replace_resets_and_drops_old_segments(tmp_path, small_segments):
+    log = TransactionLog(tmp_path)
+    log.append(_records(0, 20))
+    assert log.replace(_records(100, 2)) == 2
+    log.append(_records(200, 1))
+
+    assert _ids(log) == ["t100", "t101", "t200"]
+    assert all(log._segment_number(path) > 1 for path in log._segments())
+
+
+def test_reader_keeps_its_snapshot_across_replace(tmp_path):
+    log = TransactionLog(tmp_path)
+    log.append(_records(0, 50))
+    old_segments = log._segments()
+
+    reader = log.iter_records()
+    first = [next(reader)["id"] for _ in range(10)]
+    log.append(_records(50, 5))  # 快照之后的追加不属于本次读取
+    log.replace(_records(1000, 1))
+    assert all(path.exists() for path in old_segments)
+
+    rest = [record["id"] for record in reader]
+    assert first + rest == [f"t{i}" for i in range(50)]
+    assert not any(path.exists() for path in old_segments)
+    assert _ids(log) == ["t1000"]
+
+
+def test_clear_during_read_hides_data_from_new_readers(tmp_path):
+    log = TransactionLog(tmp_path)
+    log.append(_records(0, 3))
+    reader = log.iter_records()
+    next(reader)
+    log.clear()
+
+    assert _ids(log) == []
+    assert len(list(reader)) == 2
+
+
+def test_crash_leftovers_are_ignored(tmp_path):
+    log = TransactionLog(tmp_path)
+    log.append(_records(0, 3))
+    log.replace(_records(10, 2))
+    # 模拟 replace 后未来得及删除的旧分段，以及追加时崩溃留下的半行
+    log._segment_path(1).write_text('{"op":"put","txn":{"id":"stale"}}\n', encoding="utf-8")
+    with log._active_segment().open("a", encoding="utf-8") as handle:
+        handle.write('{"op":"put","txn":{"id":"tor')
+
+    log.append(_records(20, 1))
+    assert _ids(log) == ["t10", "t11", "t20"]
@@ -0,0 +1,62 @@
+"""Tests for the vision model cascade."""
+
+from __future__ import annotations
+
+import json
+import time
+
+import pytest
+
+from services import vision_ocr_service
+from services.ocr_cache import OCRResultCache
+from services.vision_ocr_service import VisionOCRService
+from utils.error_handling import UserFacingError, check_deadline, remaining_time
+
+RESPONSE = json.dumps(
+    {
+        "transaction_count": 1,
+        "transactions": [
+            {"date": "2024-01-05", "merchant": "超市", "category": "餐饮", "amount": 12.5}
+        ],
+    },
+    ensure_ascii=False,
+)
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(vision_ocr_service, "VISION_STAGE_TIMEOUT", 0.2)
+    return VisionOCRService(
+        api_key="test-key",
+        cache=OCRResultCache(tmp_path, max_entries=0),
+        cascade=("cheap",),
+    )
+
+
+def test_each_cascade_stage_gets_its_own_budget(service, monkeypatch):
+    budgets = {}
+
+    def call_model(model, base64_image, mime_type):
+        budgets[model] = remaining_time()
+        if model == "cheap":
+            # 低价模型耗尽自己的时限
+            time.sleep(0.25)
+            check_deadline(model)
+        return RESPONSE
+
+    monkeypatch.setattr(service, "_call_model", call_model)
+    transactions = service.extract_transactions_from_image(b"image-1")
+
+    assert [txn.merchant for txn in transactions] == ["超市"]
+    assert budgets["gpt-4o"] == pytest.approx(0.2, abs=0.05)
+
+
+def test_final_stage_timeout_is_reported(service, monkeypatch):
+    def call_model(model, base64_image, mime_type):
+        time.sleep(0.25)
+        check_deadline(model)
+        return RESPONSE
+
+    monkeypatch.setattr(service, "_call_model", call_model)
+    with pytest.raises(UserFacingError, match="超时"):
+        service.extract_transactions_from_image(b"image-2")
@@ -2,10 +2,16 @@
 
 from __future__ import annotations
 
+import asyncio
+import contextvars
 import functools
+import inspect
 import logging
-import signal
-from typing import Any, Callable, TypeVar
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, TypeVar
 from typing import ParamSpec
 
 logger = logging.getLogger(__name__)
@@ -14,6 +20,81 @@ P = ParamSpec("P")
 R = TypeVar("R")
 
 
+# 未设置截止时间时单次模型请求的超时（秒）
+DEFAULT_REQUEST_TIMEOUT = 60.0
+
+# 当前上下文的绝对截止时间（time.monotonic）；线程池任务需通过 submit_in_context 继承
+_deadline: ContextVar[float | None] = ContextVar("wefinance_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when work starts after the surrounding deadline has passed."""
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[float | None]:
+    """
+    Bound the enclosed work to ``seconds``; nested deadlines only ever tighten.
+
+    The deadline lives in a context variable, so it is private to the current
+    thread or asyncio task and needs no signals. Code inside reads it through
+    :func:`remaining_time` / :func:`request_timeout`.
+    """
+    if seconds is None:
+        yield _deadline.get()
+        return
+    expires_at = time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None:
+        expires_at = min(expires_at, outer)
+    token = _deadline.set(expires_at)
+    try:
+        yield expires_at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> float | None:
+    """Seconds left before the innermost deadline, or None when unbounded."""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - time.monotonic()
+
+
+def check_deadline(operation: str = "operation") -> None:
+    """Raise `DeadlineExceeded` if the current deadline has already passed."""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"{operation} exceeded its deadline")
+
+
+def request_timeout(default: float = DEFAULT_REQUEST_TIMEOUT) -> float:
+    """
+    Timeout to pass to one outbound request (e.g. ``timeout=`` on OpenAI calls).
+
+    Returns the smaller of ``default`` and the time left on the current
+    deadline; raises `DeadlineExceeded` instead of starting a doomed request.
+    """
+    check_deadline("request")
+    remaining = remaining_time()
+    return default if remaining is None else min(default, remaining)
+
+
+def submit_in_context(
+    executor: Executor, fn: Callable[..., R], *args: Any, **kwargs: Any
+) -> "Future[R]":
+    """Submit ``fn`` so it runs with the caller's context (deadline included)."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    # openai.APITimeoutError 不是 TimeoutError 的子类，按类名识别
+    return isinstance(exc, (TimeoutError, asyncio.TimeoutError)) or (
+        exc.__class__.__name__ == "APITimeoutError"
+    )
+
+
 class UserFacingError(Exception):
     """Exception type that is safe to display directly to end users."""
 
@@ -37,69 +118,70 @@ def safe_call(
     error_message: str = "操作失败，请稍后重试",
 ) -> Callable[[Callable[P, R]], Callable[P, R]]:
     """
-    Decorator adding timeout protection and user-friendly error conversion.
+    Decorator adding a deadline and user-friendly error conversion.
+
+    The deadline is cooperative: outbound requests made inside take their
+    timeout from :func:`request_timeout`. Coroutine functions are additionally
+    cancelled when the deadline passes.
 
     Args:
-        timeout: Timeout window in seconds. None disables timeout enforcement.
+        timeout: Timeout window in seconds. None keeps any outer deadline only.
         fallback: Optional value to return when an error occurs.
         error_message: Default error message when conversion cannot classify.
     """
 
     def decorator(func: Callable[P, R]) -> Callable[P, R]:
-        @functools.wraps(func)
-        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
-            alarm_supported = False
-
-            def timeout_handler(signum: int, frame: Any) -> None:  # pragma: no cover
-                raise TimeoutError(
-                    f"Function {func.__name__} timed out after {timeout}s"
-                )
-
-            if timeout is not None:
-                try:
-                    signal.signal(signal.SIGALRM, timeout_handler)
-                    signal.alarm(timeout)
-                    alarm_supported = True
-                except (AttributeError, ValueError):
-                    # Windows 或非主线程不支持 SIGALRM
-                    logger.debug(
-                        "Timeout not supported for %s on this platform/context",
-                        func.__name__,
-                    )
-
-            try:
-                return func(*args, **kwargs)
-            except TimeoutError as exc:
+        def handle_failure(exc: Exception) -> R:
+            if _is_timeout(exc):
                 logger.error("Timeout in %s: %s", func.__name__, exc)
                 raise UserFacingError(
                     "操作超时，网络响应时间过长",
                     suggestion="请检查网络连接后重试，或选择手动输入",
                     original_error=exc,
                 ) from exc
-            except UserFacingError:
-                raise
-            except Exception as exc:  # pylint: disable=broad-except
-                user_error = _convert_to_user_facing_error(exc, error_message)
-                logger.error(
-                    "Error in %s: %s: %s",
+            if isinstance(exc, UserFacingError):
+                raise exc
+            user_error = _convert_to_user_facing_error(exc, error_message)
+            logger.error(
+                "Error in %s: %s: %s",
+                func.__name__,
+                exc.__class__.__name__,
+                exc,
+                exc_info=exc,
+            )
+            if fallback is not None:
+                logger.info(
+                    "Returning fallback value for %s after failure",
                     func.__name__,
-                    exc.__class__.__name__,
-                    exc,
-                    exc_info=True,
                 )
-                if fallback is not None:
-                    logger.info(
-                        "Returning fallback value for %s after failure",
-                        func.__name__,
-                    )
-                    return fallback  # type: ignore[return-value]
-                raise user_error from exc
-            finally:
-                if timeout is not None and alarm_supported:
-                    try:
-                        signal.alarm(0)
-                    except (AttributeError, ValueError):
-                        pass
+                return fallback  # type: ignore[return-value]
+            raise user_error from exc
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                try:
+                    with deadline(timeout):
+                        check_deadline(func.__name__)
+                        return await asyncio.wait_for(
+                            func(*args, **kwargs), timeout=remaining_time()
+                        )
+                except Exception as exc:  # pylint: disable=broad-except
+                    return handle_failure(exc)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            # 截止时间通过上下文传递给内部请求（见 request_timeout），
+            # 在任意线程中都生效，嵌套调用只会收紧而不会互相覆盖
+            try:
+                with deadline(timeout):
+                    check_deadline(func.__name__)
+                    return func(*args, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                return handle_failure(exc)
 
         return wrapper
 
@@ -0,0 +1,94 @@
+"""Columnar view of the transaction ledger shared by analytics and advisors."""
+
+from __future__ import annotations
+
+from typing import Any, Iterable, List, Sequence
+
+import pandas as pd
+
+from models.entities import Transaction, TransactionRecord
+
+LEDGER_COLUMNS = ("id", "date", "merchant", "category", "amount")
+
+
+class Ledger:
+    """
+    Immutable, date-sorted DataFrame of the core transaction fields.
+
+    ``category`` and ``merchant`` are categoricals, ``date`` is datetime64 and
+    ``amount`` is float64, so groupby/resample/z-score work stays vectorised.
+    Consumers receive shallow copies from :meth:`to_frame` and may add columns
+    freely without affecting the shared instance.
+    """
+
+    __slots__ = ("_frame",)
+
+    def __init__(self, frame: pd.DataFrame) -> None:
+        self._frame = frame
+
+    @classmethod
+    def from_records(
+        cls, records: Iterable[Transaction | TransactionRecord | dict]
+    ) -> "Ledger":
+        """Build a ledger from `Transaction` models, compact records or serialised dicts."""
+        ids: List[Any] = []
+        dates: List[Any] = []
+        merchants: List[Any] = []
+        categories: List[Any] = []
+        amounts: List[float] = []
+        for record in records:
+            if isinstance(record, (Transaction, TransactionRecord)):
+                ids.append(record.id)
+                dates.append(record.date)
+                merchants.append(record.merchant)
+                categories.append(record.category)
+                amounts.append(record.amount)
+            else:
+                ids.append(record.get("id"))
+                dates.append(record.get("date"))
+                merchants.append(record.get("merchant"))
+                categories.append(record.get("category"))
+                amounts.append(record.get("amount"))
+
+        frame = pd.DataFrame(
+            {
+                "id": pd.Series(ids, dtype=object),
+                "date": pd.to_datetime(pd.Series(dates, dtype=object)),
+                "merchant": pd.Categorical(merchants),
+                "category": pd.Categorical(categories),
+                "amount": pd.Series(amounts, dtype="float64"),
+            },
+            columns=list(LEDGER_COLUMNS),
+        )
+        frame.sort_values("date", inplace=True, kind="stable")
+        return cls(frame)
+
+    @property
+    def empty(self) -> bool:
+        return self._frame.empty
+
+    def __len__(self) -> int:
+        return len(self._frame)
+
+    def to_frame(self, columns: Sequence[str] | None = None) -> pd.DataFrame:
+        """Return a cheap copy of the ledger, optionally limited to ``columns``."""
+        frame = self._frame if columns is None else self._frame[list(columns)]
+        return frame.copy(deep=False)
+
+
+def as_ledger(
+    transactions: Ledger | Iterable[Transaction | TransactionRecord | dict],
+) -> Ledger:
+    """
+    Return ``transactions`` as a `Ledger`, building one only when needed.
+
+    Nothing is cached here: pages should pass the session ledger from
+    ``utils.session.get_ledger()``, which is cached per ledger version, so
+    several analytics helpers share one build.
+    """
+    if isinstance(transactions, Ledger):
+        return transactions
+    return Ledger.from_records(transactions)
+
+
+__all__ = ["LEDGER_COLUMNS", "Ledger", "as_ledger"]
@@ -5,18 +5,31 @@ from __future__ import annotations
 import hashlib
 import json
 import logging
+import os
+import uuid
 from copy import deepcopy
 from datetime import date
-from typing import Any, Dict, Iterable, List
+from typing import Any, Dict, Iterable, List, Tuple
 
 import streamlit as st
 
-from models.entities import Transaction
+from models.entities import Transaction, TransactionRecord
+from modules.anomaly_engine import IncrementalAnomalyEngine
 from utils.i18n import I18n
-from utils.storage import save_to_storage
+from utils.ledger import Ledger
+from utils.storage import (
+    append_to_storage,
+    load_from_storage,
+    save_to_storage,
+    user_namespace,
+)
 
 logger = logging.getLogger(__name__)
 
+# 以 get_ledger_key() 或会话数据为键的 st.cache_data 每个会话、每个账本版本
+# 各占一项，必须设上限与过期时间，否则旧结果会一直留在进程内存中
+LEDGER_CACHE_MAX_ENTRIES = 128
+LEDGER_CACHE_TTL = 1800
 
 DEFAULT_STATE: Dict[str, Any] = {
     "transactions": [],
@@ -33,6 +46,7 @@ DEFAULT_STATE: Dict[str, Any] = {
     "locale": "zh_CN",
     "chat_cache": {},
     "chat_cache_version": 0,
+    "ledger_version": 0,
     "monthly_budget": 5000.0,
     "data_restored": False,
     "selected_page": "home",  # 确保默认从首页开始
@@ -54,6 +68,35 @@ def init_session_state() -> None:
         st.session_state["i18n"] = I18n(st.session_state.get("locale", "zh_CN"))
 
 
+def resolve_user_namespace() -> str:
+    """
+    Identify whose data this session reads and writes.
+
+    Uses ``st.session_state["user_id"]`` when the app has set one, otherwise
+    the request header named by WEFINANCE_USER_HEADER (e.g. set by an auth
+    proxy), falling back to the shared default namespace. Real user IDs are
+    prefixed, so a user literally named "default" stays separate.
+    """
+    user_id = st.session_state.get("user_id")
+    header = os.getenv("WEFINANCE_USER_HEADER")
+    if not user_id and header:
+        try:
+            user_id = st.context.headers.get(header)
+        except Exception:  # pylint: disable=broad-except
+            user_id = None
+    user_id = str(user_id or "").strip()
+    namespace = user_namespace(user_id)
+    st.session_state["user_id"] = user_id
+    st.session_state["storage_namespace"] = namespace
+    return namespace
+
+
+def _storage_namespace() -> str:
+    """Namespace for this session's persistence, resolved once per session."""
+    namespace = st.session_state.get("storage_namespace")
+    return namespace if isinstance(namespace, str) and namespace else resolve_user_namespace()
+
+
 def reset_session_state(keys: List[str] | None = None) -> None:
     """Clear selected session keys, or all known keys when omitted."""
     target_keys = keys if keys is not None else list(DEFAULT_STATE.keys())
@@ -62,27 +105,10 @@ def reset_session_state(keys: List[str] | None = None) -> None:
             del st.session_state[key]
 
 
-def _normalize_transaction(entry: Transaction | dict) -> Transaction:
-    if isinstance(entry, Transaction):
-        return entry
-    return Transaction(**entry)
-
-
-def _serialize_transaction_entry(entry: Transaction | dict) -> Dict[str, Any]:
-    """Convert transaction input into a JSON-serialisable dict."""
-    if isinstance(entry, Transaction):
-        data = entry.model_dump(mode="json")
-    else:
-        data = dict(entry)
-        if isinstance(data.get("date"), date):
-            data["date"] = data["date"].isoformat()
-    return data
-
-
 def _persist_state(key: str, value: Any) -> None:
     """Persist a session value to storage while swallowing I/O errors."""
     try:
-        save_to_storage(key, value)
+        save_to_storage(key, value, namespace=_storage_namespace())
     except Exception as exc:  # pragma: no cover - defensive
         logger.warning("Failed to persist %s: %s", key, exc)
 
@@ -100,20 +126,156 @@ def _invalidate_chat_cache() -> None:
     )
 
 
-def get_transactions() -> List[Transaction]:
-    """Return transactions stored in session as `Transaction` models."""
-    return [
-        _normalize_transaction(entry)
+def get_transaction_records() -> Tuple[TransactionRecord, ...]:
+    """
+    Return the session ledger as compact `TransactionRecord` rows.
+
+    This is the canonical in-memory ledger; prefer it over
+    :func:`get_transactions` wherever pydantic models are not required.
+    Read-only: entries stored by other code are converted into the cache,
+    ``st.session_state["transactions"]`` itself is left as it is.
+    """
+    key = get_ledger_key()
+    cached = st.session_state.get("_records_cache")
+    if isinstance(cached, tuple) and cached[0] == key:
+        return cached[1]
+    records = tuple(
+        TransactionRecord.from_any(entry)
         for entry in st.session_state.get("transactions", [])
-    ]
+    )
+    st.session_state["_records_cache"] = (key, records)
+    return records
+
+
+def get_transactions() -> Tuple[Transaction, ...]:
+    """
+    Return the session ledger as `Transaction` models for API boundaries.
+
+    The tuple is built once per ledger version from the already-validated
+    records (no re-validation) and shared by every caller in the rerun, so
+    treat it and the models in it as read-only.
+    """
+    key = get_ledger_key()
+    cached = st.session_state.get("_transactions_cache")
+    if isinstance(cached, tuple) and cached[0] == key:
+        return cached[1]
+    models = tuple(record.to_model() for record in get_transaction_records())
+    st.session_state["_transactions_cache"] = (key, models)
+    return models
 
 
-def set_transactions(transactions: Iterable[Transaction | dict]) -> None:
+def _store_records(records: List[TransactionRecord]) -> None:
+    st.session_state["transactions"] = records
+    bump_ledger_version()
+    st.session_state["_records_cache"] = (get_ledger_key(), tuple(records))
+
+
+def hydrate_transactions(transactions: Iterable[Transaction | TransactionRecord]) -> None:
+    """Load already-validated transactions into session without persisting them."""
+    _store_records([TransactionRecord.from_any(txn) for txn in transactions])
+
+
+def get_ledger_version() -> int:
+    """Monotonic counter bumped whenever the transaction ledger is replaced or extended."""
+    return int(st.session_state.get("ledger_version", 0))
+
+
+def bump_ledger_version() -> int:
+    """Mark the ledger as changed; every ledger-derived cache keys off the new version."""
+    version = get_ledger_version() + 1
+    st.session_state["ledger_version"] = version
+    return version
+
+
+def get_ledger_key() -> str:
+    """
+    Cheap, process-unique key for the current ledger contents.
+
+    Combines a per-session random ID with the ledger version so that
+    process-wide caches such as ``st.cache_data`` never mix up two sessions.
+    """
+    uid = st.session_state.get("ledger_uid")
+    if not uid:
+        uid = uuid.uuid4().hex
+        st.session_state["ledger_uid"] = uid
+    return f"{uid}:{get_ledger_version()}"
+
+
+def get_ledger() -> Ledger:
+    """Return the columnar ledger for the session, rebuilt only when data changes."""
+    key = get_ledger_key()
+    cached = st.session_state.get("_ledger_cache")
+    if isinstance(cached, tuple) and cached[0] == key:
+        return cached[1]
+    ledger = Ledger.from_records(get_transaction_records())
+    st.session_state["_ledger_cache"] = (key, ledger)
+    return ledger
+
+
+def get_anomaly_engine() -> IncrementalAnomalyEngine:
+    """Return the incremental anomaly statistics, restoring them from storage once."""
+    engine = st.session_state.get("anomaly_engine")
+    if isinstance(engine, IncrementalAnomalyEngine):
+        return engine
+
+    records = get_transaction_records()
+    payload = load_from_storage("anomaly_engine", namespace=_storage_namespace())
+    engine = None
+    if isinstance(payload, dict):
+        try:
+            engine = IncrementalAnomalyEngine.from_dict(payload)
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.warning("Discarding unreadable anomaly engine state: %s", exc)
+    if engine is None or not engine.matches(records):
+        # 快照缺失或与账本不一致时，按账本重建一次
+        engine = IncrementalAnomalyEngine.from_records(records)
+        _persist_state("anomaly_engine", engine.to_dict())
+    st.session_state["anomaly_engine"] = engine
+    return engine
+
+
+def set_transactions(transactions: Iterable[Transaction | TransactionRecord | dict]) -> None:
     """Persist a new transaction list into session state."""
-    serialized = [_serialize_transaction_entry(txn) for txn in transactions]
-    st.session_state["transactions"] = serialized
-    _persist_state("transactions", serialized)
+    # 入口处校验一次，之后的读取都走紧凑记录
+    records = [TransactionRecord.from_any(txn) for txn in transactions]
+    engine = get_anomaly_engine()
+    previous = get_transaction_records()
+    _store_records(records)
+    _persist_state("transactions", [record.to_dict() for record in records])
+    _invalidate_chat_cache()
+    if engine.replace(previous, records):
+        _persist_state("anomaly_engine", engine.to_dict())
+
+
+def append_transactions(
+    transactions: Iterable[Transaction | TransactionRecord | dict],
+) -> None:
+    """
+    Append transactions to the ledger in O(k) for k new records.
+
+    The session list is extended in place and storage only receives the new
+    rows, so chunked imports can call this once per chunk.
+    """
+    engine = get_anomaly_engine()
+    added = [TransactionRecord.from_any(txn) for txn in transactions]
+    ledger = st.session_state.get("transactions")
+    if not isinstance(ledger, list):
+        ledger = list(ledger or [])
+    # 原地追加；记录元组缓存随版本号失效，下次读取时再重建
+    ledger.extend(added)
+    st.session_state["transactions"] = ledger
+    bump_ledger_version()
+    try:
+        append_to_storage(
+            "transactions",
+            [record.to_dict() for record in added],
+            namespace=_storage_namespace(),
+        )
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.warning("Failed to persist transactions: %s", exc)
     _invalidate_chat_cache()
+    if engine.add(added):
+        _persist_state("anomaly_engine", engine.to_dict())
 
 
 def get_trusted_merchants() -> List[str]:
@@ -282,19 +444,17 @@ def set_product_recommendations(items: Iterable[Dict[str, Any]]) -> None:
 
 def build_chat_cache_key(
     prompt: str,
-    transactions: Iterable[Transaction | dict],
+    ledger_key: str,
     budget: float,
     locale: str,
 ) -> str:
-    """基于提示词+账本+预算生成缓存键，避免跨数据复用。"""
+    """基于提示词+账本版本+预算生成缓存键，避免跨数据复用（与账本大小无关）。"""
 
-    entries = [_serialize_transaction_entry(txn) for txn in transactions]
-    entries.sort(key=lambda item: item.get("id", ""))
     payload = {
         "prompt": prompt.strip(),
         "budget": round(float(budget), 2),
         "locale": locale,
-        "transactions": entries,
+        "ledger": ledger_key,
     }
     raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
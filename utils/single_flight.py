@@ -0,0 +1,79 @@
+"""Single-flight deduplication of identical concurrent calls."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, TypeVar
+
+from utils.error_handling import DeadlineExceeded, remaining_time
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Stable key for a request built from JSON-serialisable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+
+    The first caller for a key executes ``fn``; callers arriving while it is
+    in flight wait for the same future and receive its result or exception.
+    Nothing is retained after the call completes (pair with a cache for that).
+    Results are shared, so callers must not mutate them in place.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], R]) -> R:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            logger.info("Joining in-flight request %s", key[:12])
+            try:
+                # 跟随者等待时同样遵守自己的截止时间
+                return future.result(timeout=remaining_time())
+            except TimeoutError:
+                if future.done():
+                    raise
+                raise DeadlineExceeded("waiting for in-flight request") from None
+
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+__all__ = ["SingleFlight", "request_fingerprint"]
@@ -0,0 +1,324 @@
+"""Deterministic parsers for fixed-layout payment and bank statement exports."""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# 表头之前的元数据行（账号、起止日期等）最多扫描这么多行
+HEADER_SCAN_ROWS = 60
+DEFAULT_CATEGORY = "其他"
+
+# 按顺序匹配，先命中者生效
+CATEGORY_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "餐饮": ("餐饮", "美食", "外卖", "饿了么", "美团", "咖啡", "奶茶", "饭", "餐厅", "食品"),
+    "交通": ("交通", "出行", "滴滴", "地铁", "公交", "打车", "加油", "停车", "高铁", "铁路", "机票", "航空"),
+    "医疗": ("医疗", "健康", "医院", "药"),
+    "教育": ("教育", "培训", "课程", "书店", "学费"),
+    "娱乐": ("娱乐", "休闲", "电影", "游戏", "视频", "音乐", "演出", "会员"),
+    "购物": ("购物", "百货", "超市", "服饰", "数码", "电器", "家居", "淘宝", "天猫", "京东", "拼多多"),
+}
+
+CURRENCY_ALIASES: Dict[str, str] = {
+    "人民币": "CNY",
+    "人民币元": "CNY",
+    "RMB": "CNY",
+    "美元": "USD",
+    "港币": "HKD",
+    "港元": "HKD",
+    "欧元": "EUR",
+    "日元": "JPY",
+    "英镑": "GBP",
+}
+
+_FULLWIDTH = str.maketrans({"（": "(", "）": ")", "：": ":", "﻿": None})
+
+
+def canonical_header(name: object) -> str:
+    """Normalise a header cell: drop BOM/whitespace/quotes, half-width brackets."""
+    return re.sub(r"[\s\"']", "", str(name).translate(_FULLWIDTH))
+
+
+def text_values(series: pd.Series) -> pd.Series:
+    """Stripped strings with missing values as ``""``."""
+    return series.astype(object).where(series.notna(), "").astype(str).str.strip()
+
+
+def parse_amounts(series: pd.Series) -> pd.Series:
+    """Coerce amounts to float, tolerating thousands separators and currency signs."""
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_numeric(series, errors="coerce")
+    cleaned = text_values(series).str.replace(r"[,\s¥￥$]", "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def _first_non_empty(frame: pd.DataFrame, columns: Sequence[str]) -> pd.Series:
+    result = pd.Series("", index=frame.index, dtype=object)
+    for column in columns:
+        if column in frame:
+            values = text_values(frame[column])
+            result = result.where(result.ne(""), values)
+    return result
+
+
+def infer_categories(*texts: pd.Series) -> pd.Series:
+    """Map free-text category/description columns onto the app's categories."""
+    combined = texts[0].astype(str)
+    for extra in texts[1:]:
+        combined = combined + " " + extra.astype(str)
+    result = pd.Series(DEFAULT_CATEGORY, index=combined.index, dtype=object)
+    unassigned = pd.Series(True, index=combined.index)
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        pattern = "|".join(re.escape(keyword) for keyword in keywords)
+        hit = unassigned & combined.str.contains(pattern, regex=True)
+        result[hit] = category
+        unassigned &= ~hit
+    return result
+
+
+class StatementFormat:
+    """
+    A fixed export layout: header fingerprint, column mapping and sign rules.
+
+    ``prepare`` turns a raw frame (columns already canonicalised) into the
+    importer's standard columns. Income, neutral and failed rows get a NaN
+    amount so the importer's positive-amount filter drops them.
+    """
+
+    __slots__ = (
+        "name",
+        "label",
+        "fingerprint",
+        "date",
+        "merchant",
+        "amount",
+        "expense_amount",
+        "negative_is_expense",
+        "direction",
+        "status",
+        "category",
+        "description",
+        "payment_method",
+        "default_payment_method",
+        "currency",
+        "transaction_id",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        label: str,
+        *,
+        fingerprint: Iterable[str],
+        date: str,
+        merchant: Sequence[str],
+        amount: Optional[str] = None,
+        expense_amount: Optional[str] = None,
+        negative_is_expense: bool = False,
+        direction: Optional[Tuple[str, Tuple[str, ...]]] = None,
+        status: Optional[Tuple[str, Tuple[str, ...]]] = None,
+        category: Optional[str] = None,
+        description: Optional[str] = None,
+        payment_method: Optional[str] = None,
+        default_payment_method: Optional[str] = None,
+        currency: Optional[str] = None,
+        transaction_id: Optional[str] = None,
+    ) -> None:
+        if (amount is None) == (expense_amount is None):
+            raise ValueError("Exactly one of amount / expense_amount is required")
+        self.name = name
+        self.label = label
+        self.fingerprint = frozenset(canonical_header(h) for h in fingerprint)
+        self.date = date
+        self.merchant = tuple(merchant)
+        self.amount = amount
+        self.expense_amount = expense_amount
+        self.negative_is_expense = negative_is_expense
+        self.direction = direction
+        self.status = status
+        self.category = category
+        self.description = description
+        self.payment_method = payment_method
+        self.default_payment_method = default_payment_method
+        self.currency = currency
+        self.transaction_id = transaction_id
+
+    def matches(self, header: Iterable[object]) -> bool:
+        return self.fingerprint.issubset(canonical_header(cell) for cell in header)
+
+    @staticmethod
+    def _column(frame: pd.DataFrame, name: Optional[str], default: pd.Series) -> pd.Series:
+        return text_values(frame[name]) if name and name in frame else default
+
+    def prepare(self, raw: pd.DataFrame) -> pd.DataFrame:
+        """Map one chunk of this layout onto the importer's standard columns."""
+        frame = raw.rename(columns=canonical_header)
+        empty = pd.Series("", index=frame.index, dtype=object)
+
+        if self.expense_amount is not None:
+            amount = frame[self.expense_amount]
+        else:
+            amount = frame[self.amount]
+        amount = parse_amounts(amount)
+        if self.negative_is_expense:
+            # 有符号金额：负数为支出，正数（收入）置空后被过滤
+            amount = (-amount).where(amount < 0)
+        keep = pd.Series(True, index=frame.index)
+        if self.direction is not None:
+            column, expense_values = self.direction
+            keep &= text_values(frame[column]).isin(expense_values)
+        if self.status is not None:
+            column, skip_keywords = self.status
+            pattern = "|".join(re.escape(keyword) for keyword in skip_keywords)
+            keep &= ~text_values(frame[column]).str.contains(pattern, regex=True)
+        amount = amount.where(keep)
+
+        merchant = _first_non_empty(frame, self.merchant)
+        description = self._column(frame, self.description, empty)
+        category_text = self._column(frame, self.category, empty)
+        payment = self._column(frame, self.payment_method, empty)
+        if self.default_payment_method:
+            payment = payment.where(payment.ne(""), self.default_payment_method)
+        currency = self._column(frame, self.currency, empty).replace(CURRENCY_ALIASES)
+
+        prepared = pd.DataFrame(
+            {
+                "date": frame[self.date],
+                "merchant": merchant,
+                "category": infer_categories(category_text, description, merchant),
+                "amount": amount,
+                "currency": currency,
+                "payment_method": payment,
+            },
+            index=frame.index,
+        )
+        if self.transaction_id and self.transaction_id in frame:
+            prepared["id"] = text_values(frame[self.transaction_id])
+        return prepared
+
+
+_FAILED_STATUS = ("关闭", "失败", "撤销", "全额退款")
+
+_FORMATS: List[StatementFormat] = [
+    StatementFormat(
+        "alipay",
+        "支付宝",
+        fingerprint=("交易时间", "交易分类", "交易对方", "收/支", "金额", "交易状态"),
+        date="交易时间",
+        merchant=("交易对方", "商品说明"),
+        amount="金额",
+        direction=("收/支", ("支出",)),
+        status=("交易状态", _FAILED_STATUS),
+        category="交易分类",
+        description="商品说明",
+        payment_method="收/付款方式",
+        default_payment_method="支付宝",
+        transaction_id="交易订单号",
+    ),
+    StatementFormat(
+        "alipay_legacy",
+        "支付宝（旧版）",
+        fingerprint=("交易号", "交易创建时间", "交易对方", "商品名称", "金额(元)", "收/支"),
+        date="交易创建时间",
+        merchant=("交易对方", "商品名称"),
+        amount="金额(元)",
+        direction=("收/支", ("支出",)),
+        status=("交易状态", _FAILED_STATUS),
+        description="商品名称",
+        default_payment_method="支付宝",
+        transaction_id="交易号",
+    ),
+    StatementFormat(
+        "wechat",
+        "微信支付",
+        fingerprint=("交易时间", "交易类型", "交易对方", "商品", "收/支", "金额(元)"),
+        date="交易时间",
+        merchant=("交易对方", "商品"),
+        amount="金额(元)",
+        direction=("收/支", ("支出",)),
+        status=("当前状态", _FAILED_STATUS),
+        category="交易类型",
+        description="商品",
+        payment_method="支付方式",
+        default_payment_method="微信支付",
+        transaction_id="交易单号",
+    ),
+    StatementFormat(
+        "icbc",
+        "工商银行",
+        fingerprint=("交易日期", "摘要", "发生额(支出)", "对方户名"),
+        date="交易日期",
+        merchant=("对方户名", "交易场所", "摘要"),
+        expense_amount="发生额(支出)",
+        description="摘要",
+        default_payment_method="工商银行",
+        currency="钱币",
+    ),
+    StatementFormat(
+        "bank_split",
+        "银行流水（收支分列）",
+        fingerprint=("交易日期", "收入", "支出"),
+        date="交易日期",
+        merchant=("对方户名", "交易备注", "摘要", "交易类型"),
+        expense_amount="支出",
+        description="交易备注",
+        currency="币种",
+    ),
+    StatementFormat(
+        "bank_signed",
+        "银行流水（有符号金额）",
+        fingerprint=("交易日期", "交易金额"),
+        date="交易日期",
+        merchant=("对方户名", "对方账户名称", "交易摘要", "摘要"),
+        amount="交易金额",
+        negative_is_expense=True,
+        description="摘要",
+        currency="币种",
+    ),
+]
+
+
+def register_format(statement_format: StatementFormat, *, first: bool = False) -> None:
+    """Add a layout; ``first=True`` lets a specific layout win over generic ones."""
+    if first:
+        _FORMATS.insert(0, statement_format)
+    else:
+        _FORMATS.append(statement_format)
+
+
+def registered_formats() -> Tuple[StatementFormat, ...]:
+    return tuple(_FORMATS)
+
+
+def detect_format(
+    rows: Iterable[Sequence[object]],
+) -> Tuple[Optional[StatementFormat], int]:
+    """
+    Find a known header among the leading rows, skipping metadata preambles.
+
+    Returns ``(format, header_row_index)`` or ``(None, 0)`` when nothing
+    matches, in which case callers fall back to the generic column mapping.
+    """
+    for index, row in enumerate(rows):
+        if index >= HEADER_SCAN_ROWS:
+            break
+        cells = [cell for cell in row if cell is not None and cell == cell]
+        for statement_format in _FORMATS:
+            if statement_format.matches(cells):
+                return statement_format, index
+    return None, 0
+
+
+__all__ = [
+    "CATEGORY_KEYWORDS",
+    "StatementFormat",
+    "canonical_header",
+    "detect_format",
+    "infer_categories",
+    "parse_amounts",
+    "register_format",
+    "registered_formats",
+    "text_values",
+]
@@ -1,16 +1,37 @@
-"""File-based persistence utilities for Streamlit session data."""
+"""Persistence utilities for Streamlit session data, namespaced per user."""
 
 from __future__ import annotations
 
+import atexit
+import hashlib
 import json
 import logging
 import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from utils.transaction_log import TransactionLog
 
 logger = logging.getLogger(__name__)
 
 STORAGE_PREFIX = "wefinance_"
+STORAGE_BACKENDS = ("file", "sqlite")
+LEDGER_FORMATS = ("json", "log")
+TRANSACTIONS_KEY = "transactions"
+DEFAULT_NAMESPACE = "default"
+# 真实用户的命名空间带前缀，用户ID恰为 "default" 时也不会落入匿名空间
+USER_NAMESPACE_PREFIX = "user:"
+# 进程内同时保留的命名空间后端数量，超出后淘汰最久未用者
+DEFAULT_MAX_NAMESPACES = 64
+_TABLE_MARKER = {"__table__": TRANSACTIONS_KEY}
+# 同一次 rerun 内的多次保存合并为一次写盘
+DEFAULT_FLUSH_DELAY = 0.5
 
 
 def _resolve_storage_file() -> Path:
@@ -45,6 +66,15 @@ class StorageBackend:
     """Abstract interface for storage engines."""
 
     def save(self, key: str, value: Any) -> bool:  # pragma: no cover - interface
+        """
+        Store ``value`` under ``key``; subsequent loads see it immediately.
+
+        True means the write was accepted. Buffering backends may return
+        before the value is on disk; it becomes durable on :meth:`flush` (also
+        run on close and at exit), and a failed flush keeps it buffered for
+        the next attempt. Saves of ``TRANSACTIONS_KEY`` are always durable
+        when True is returned.
+        """
         raise NotImplementedError
 
     def load(self, key: str, default: Any = None) -> Optional[Any]:  # pragma: no cover
@@ -53,94 +83,668 @@ class StorageBackend:
     def clear(self) -> bool:  # pragma: no cover - interface
         raise NotImplementedError
 
+    def flush(self) -> bool:
+        """Write out buffered changes; backends that write through need not override."""
+        return True
+
+    def close(self) -> None:
+        """Flush and release resources; the backend must not be used afterwards."""
+        self.flush()
+
+    def append(self, key: str, records: List[Any]) -> bool:
+        """Append items to a list value; backends may override to avoid a rewrite."""
+        current = self.load(key, []) or []
+        return self.save(key, list(current) + list(records))
+
+
+def _detached(value: Any) -> Any:
+    """
+    Copy the container levels callers typically modify.
+
+    Cached payloads are shared by every session, so lists and dicts (and the
+    records inside lists) are copied; deeper nesting is treated as read-only.
+    """
+    if isinstance(value, list):
+        return [dict(item) if isinstance(item, dict) else item for item in value]
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+def _resolve_flush_delay() -> float:
+    raw = os.getenv("WEFINANCE_STORAGE_FLUSH_DELAY")
+    if not raw:
+        return DEFAULT_FLUSH_DELAY
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        logger.warning("Invalid WEFINANCE_STORAGE_FLUSH_DELAY=%s, using default", raw)
+        return DEFAULT_FLUSH_DELAY
+
 
 class FileStorageBackend(StorageBackend):
-    """JSON file-backed storage implementation."""
+    """
+    JSON file-backed storage implementation.
 
-    def __init__(self, storage_file: Path = STORAGE_FILE):
+    Writes are buffered for ``flush_delay`` seconds so a burst of saves within
+    one rerun becomes a single rewrite, and each rewrite goes to a temp file
+    that atomically replaces the live one. ``flush_delay=0`` writes through;
+    the ledger key always does.
+    """
+
+    def __init__(
+        self,
+        storage_file: Path = STORAGE_FILE,
+        flush_delay: float | None = None,
+    ):
         self.storage_file = storage_file
         self.storage_file.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_delay = (
+            flush_delay if flush_delay is not None else _resolve_flush_delay()
+        )
+        self._lock = threading.RLock()
+        self._pending: Dict[str, Any] = {}
+        self._timer: threading.Timer | None = None
+        # 解析结果按文件 (mtime_ns, size) 缓存，所有会话共享；写入或外部修改后失效
+        self._cache: Dict[str, Any] | None = None
+        self._cache_stamp: tuple | None = None
+
+    def _file_stamp(self) -> tuple | None:
+        try:
+            stat = self.storage_file.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
 
     def _load_all(self) -> Dict[str, Any]:
-        """Load the entire storage payload."""
-        if not self.storage_file.exists():
-            return {}
-        try:
-            with self.storage_file.open("r", encoding="utf-8") as handle:
-                return json.load(handle)
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.warning("Failed to load storage file: %s", exc)
-            return {}
+        """Load the entire storage payload, reusing the parsed copy while unchanged."""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp is None:
+                return {}
+            if self._cache is not None and stamp == self._cache_stamp:
+                return self._cache
+            try:
+                with self.storage_file.open("r", encoding="utf-8") as handle:
+                    data = json.load(handle)
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.warning("Failed to load storage file: %s", exc)
+                return {}
+            self._cache, self._cache_stamp = data, stamp
+            return data
 
     def _save_all(self, data: Dict[str, Any]) -> bool:
-        """Persist the entire payload atomically."""
+        """Persist the entire payload atomically via temp file and rename."""
+        tmp_path = self.storage_file.with_name(
+            f".{self.storage_file.name}.{os.getpid()}.tmp"
+        )
         try:
-            with self.storage_file.open("w", encoding="utf-8") as handle:
+            with tmp_path.open("w", encoding="utf-8") as handle:
                 json.dump(data, handle, ensure_ascii=False, indent=2)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, self.storage_file)
+            with self._lock:
+                self._cache, self._cache_stamp = data, self._file_stamp()
             return True
         except Exception as exc:  # pragma: no cover - defensive
             logger.error("Failed to save storage file: %s", exc)
+            tmp_path.unlink(missing_ok=True)
             return False
 
     def save(self, key: str, value: Any) -> bool:
-        """Persist a single namespaced key."""
-        data = self._load_all()
-        data[f"{STORAGE_PREFIX}{key}"] = value
-        return self._save_all(data)
+        """Persist a single namespaced key (buffered unless flush_delay is 0)."""
+        with self._lock:
+            self._pending[f"{STORAGE_PREFIX}{key}"] = value
+            # 账本无法从其他数据重建，确认落盘后才返回
+            if self.flush_delay <= 0 or key == TRANSACTIONS_KEY:
+                return self.flush()
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return True
+
+    def flush(self) -> bool:
+        """Merge buffered keys into the file in a single atomic rewrite."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return True
+            data = dict(self._load_all())
+            data.update(self._pending)
+            if not self._save_all(data):
+                return False
+            self._pending.clear()
+            return True
+
+    def load(self, key: str, default: Any = None) -> Optional[Any]:
+        """Load a value by key, seeing buffered writes first."""
+        namespaced = f"{STORAGE_PREFIX}{key}"
+        with self._lock:
+            if namespaced in self._pending:
+                return _detached(self._pending[namespaced])
+            data = self._load_all()
+        if namespaced not in data:
+            return default
+        return _detached(data[namespaced])
+
+    def clear(self) -> bool:
+        """Drop buffered writes and delete the storage file."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+            self._cache = self._cache_stamp = None
+            try:
+                if self.storage_file.exists():
+                    self.storage_file.unlink()
+                return True
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.error("Failed to clear storage: %s", exc)
+                return False
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """
+    SQLite-backed storage: one row per key plus a normalised transactions table.
+
+    The database runs in WAL mode so readers never block the writer, and each
+    ``save`` touches only its own key. The ledger is stored one row per
+    transaction with indexes on date, category and merchant.
+    """
+
+    def __init__(self, db_file: Path | None = None):
+        self.db_file = db_file or STORAGE_FILE.with_suffix(".sqlite3")
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_file), check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS transactions (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT,
+                    date TEXT,
+                    category TEXT,
+                    merchant TEXT,
+                    amount REAL,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_transactions_date
+                    ON transactions(date);
+                CREATE INDEX IF NOT EXISTS idx_transactions_category
+                    ON transactions(category);
+                CREATE INDEX IF NOT EXISTS idx_transactions_merchant
+                    ON transactions(merchant);
+                """
+            )
+
+    def _rollback(self) -> None:
+        # BEGIN 本身失败（如数据库被锁）时没有进行中的事务，不能再 ROLLBACK 掩盖原错误
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    @staticmethod
+    def _transaction_row(entry: Dict[str, Any]) -> tuple:
+        return (
+            entry.get("id"),
+            str(entry.get("date")) if entry.get("date") is not None else None,
+            entry.get("category"),
+            entry.get("merchant"),
+            entry.get("amount"),
+            json.dumps(entry, ensure_ascii=False),
+        )
+
+    def save(self, key: str, value: Any) -> bool:
+        """Persist a single key; the ledger goes to the transactions table."""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                if key == TRANSACTIONS_KEY and isinstance(value, list):
+                    self._conn.execute("DELETE FROM transactions")
+                    self._conn.executemany(
+                        "INSERT INTO transactions "
+                        "(id, date, category, merchant, amount, payload) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (self._transaction_row(dict(entry)) for entry in value),
+                    )
+                    # kv 中只留标记，区分“空账本”与“从未保存”
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                        (f"{STORAGE_PREFIX}{key}", json.dumps(_TABLE_MARKER)),
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                        (f"{STORAGE_PREFIX}{key}", json.dumps(value, ensure_ascii=False)),
+                    )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception as exc:  # pylint: disable=broad-except
+                self._rollback()
+                logger.error("Failed to save %s to SQLite storage: %s", key, exc)
+                return False
 
     def load(self, key: str, default: Any = None) -> Optional[Any]:
         """Load a value by key."""
-        data = self._load_all()
-        return data.get(f"{STORAGE_PREFIX}{key}", default)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ?", (f"{STORAGE_PREFIX}{key}",)
+            ).fetchone()
+            if row is None:
+                return default
+            value = json.loads(row[0])
+            if value != _TABLE_MARKER:
+                return value
+            rows = self._conn.execute(
+                "SELECT payload FROM transactions ORDER BY seq"
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def append(self, key: str, records: List[Any]) -> bool:
+        """Insert only the new ledger rows instead of rewriting the table."""
+        if key != TRANSACTIONS_KEY:
+            return super().append(key, records)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ?", (f"{STORAGE_PREFIX}{key}",)
+            ).fetchone()
+            if row is not None and json.loads(row[0]) != _TABLE_MARKER:
+                # 旧数据仍以整列表保存在 kv 中，退回整体写入完成迁移
+                existing = json.loads(row[0]) or []
+            else:
+                existing = None
+        if existing is not None:
+            return self.save(key, list(existing) + list(records))
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany(
+                    "INSERT INTO transactions "
+                    "(id, date, category, merchant, amount, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self._transaction_row(dict(entry)) for entry in records),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+                    (f"{STORAGE_PREFIX}{key}", json.dumps(_TABLE_MARKER)),
+                )
+                self._conn.execute("COMMIT")
+                return True
+            except Exception as exc:  # pylint: disable=broad-except
+                self._rollback()
+                logger.error("Failed to append to SQLite storage: %s", exc)
+                return False
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def query_transactions(
+        self,
+        *,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        category: str | None = None,
+        merchant: str | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Return stored transactions matching the indexed filters."""
+        clauses: List[str] = []
+        params: List[Any] = []
+        if start_date:
+            clauses.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append("date <= ?")
+            params.append(end_date)
+        if category:
+            clauses.append("category = ?")
+            params.append(category)
+        if merchant:
+            clauses.append("merchant = ?")
+            params.append(merchant)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT payload FROM transactions{where} ORDER BY seq", params
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
 
     def clear(self) -> bool:
-        """Delete the storage file."""
+        """Delete every stored key and transaction."""
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.execute("DELETE FROM kv")
+                self._conn.execute("DELETE FROM transactions")
+                self._conn.execute("COMMIT")
+                return True
+            except Exception as exc:  # pylint: disable=broad-except
+                self._rollback()
+                logger.error("Failed to clear SQLite storage: %s", exc)
+                return False
+
+
+def _namespace_slug(namespace: str) -> str:
+    """Filesystem-safe directory name; a digest keeps distinct IDs distinct."""
+    slug = re.sub(r"[^A-Za-z0-9_.-]", "_", namespace)[:48].strip(".") or "user"
+    if slug != namespace:
+        digest = hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:10]
+        slug = f"{slug}-{digest}"
+    return slug
+
+
+def user_namespace(user_id: str | None) -> str:
+    """Storage namespace of a user ID; anonymous sessions share the default one."""
+    user_id = (user_id or "").strip()
+    return f"{USER_NAMESPACE_PREFIX}{user_id}" if user_id else DEFAULT_NAMESPACE
+
+
+def _namespace_dir(namespace: str) -> Path:
+    """The default namespace keeps the historical layout next to STORAGE_FILE."""
+    if namespace == DEFAULT_NAMESPACE:
+        return STORAGE_FILE.parent
+    slug = _namespace_slug(namespace.removeprefix(USER_NAMESPACE_PREFIX))
+    return STORAGE_FILE.parent / "users" / slug
+
+
+def _resolve_backend_name() -> str:
+    backend = os.getenv("WEFINANCE_STORAGE_BACKEND", "file").strip().lower()
+    if backend not in STORAGE_BACKENDS:
+        logger.warning("Unknown WEFINANCE_STORAGE_BACKEND=%s, using file", backend)
+        return "file"
+    return backend
+
+
+def _create_backend(namespace: str = DEFAULT_NAMESPACE) -> StorageBackend:
+    """Pick the storage engine from WEFINANCE_STORAGE_BACKEND (file by default)."""
+    backend = _resolve_backend_name()
+    is_default = namespace == DEFAULT_NAMESPACE
+    if backend == "sqlite":
+        env_path = os.getenv("WEFINANCE_STORAGE_DB")
+        if is_default:
+            db_file = Path(env_path).expanduser() if env_path else None
+        else:
+            db_file = _namespace_dir(namespace) / "data.sqlite3"
         try:
-            if self.storage_file.exists():
-                self.storage_file.unlink()
-            return True
-        except Exception as exc:  # pragma: no cover - defensive
-            logger.error("Failed to clear storage: %s", exc)
-            return False
+            return SQLiteStorageBackend(db_file)
+        except sqlite3.Error as exc:
+            logger.error("SQLite storage unavailable, using file storage: %s", exc)
+    if is_default:
+        return FileStorageBackend(STORAGE_FILE)
+    return FileStorageBackend(_namespace_dir(namespace) / STORAGE_FILE.name)
+
+
+def _ledger_log_dir(namespace: str) -> Path:
+    env_dir = os.getenv("WEFINANCE_LEDGER_DIR")
+    if namespace == DEFAULT_NAMESPACE and env_dir:
+        return Path(env_dir).expanduser()
+    return _namespace_dir(namespace) / "ledger"
+
+
+def _create_ledger_log(namespace: str = DEFAULT_NAMESPACE) -> TransactionLog | None:
+    """
+    Use the append-only ledger log unless WEFINANCE_LEDGER_FORMAT=json.
+
+    The log is the default with the file backend, whose inline JSON list
+    costs a full load and rewrite per append; SQLite already appends rows
+    individually, so it keeps the ledger in its own table by default.
+    """
+    default_format = "json" if _resolve_backend_name() == "sqlite" else "log"
+    raw_format = os.getenv("WEFINANCE_LEDGER_FORMAT")
+    ledger_format = (raw_format or default_format).strip().lower()
+    if ledger_format not in LEDGER_FORMATS:
+        logger.warning(
+            "Unknown WEFINANCE_LEDGER_FORMAT=%s, using %s", ledger_format, default_format
+        )
+        ledger_format = default_format
+    if ledger_format != "log":
+        return None
+    try:
+        return TransactionLog(_ledger_log_dir(namespace))
+    except OSError as exc:
+        logger.error("Ledger log unavailable, storing transactions inline: %s", exc)
+        return None
+
+
+def _resolve_max_namespaces() -> int:
+    raw = os.getenv("WEFINANCE_STORAGE_MAX_NAMESPACES")
+    if not raw:
+        return DEFAULT_MAX_NAMESPACES
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning("Invalid WEFINANCE_STORAGE_MAX_NAMESPACES=%s, using default", raw)
+        return DEFAULT_MAX_NAMESPACES
+    if value < 1:
+        logger.warning("Invalid WEFINANCE_STORAGE_MAX_NAMESPACES=%s, using default", raw)
+        return DEFAULT_MAX_NAMESPACES
+    return value
+
+
+def _migrate_inline_ledger(storage: StorageBackend, ledger_log: TransactionLog) -> None:
+    """首次启用日志格式时，把旧存储中的账本整体迁入日志并清空旧副本。"""
+    if ledger_log.exists():
+        return
+    inline = storage.load(TRANSACTIONS_KEY, []) or []
+    ledger_log.replace(inline)
+    if inline:
+        storage.save(TRANSACTIONS_KEY, [])
+
+
+def _restore_logged_ledger(storage: StorageBackend, directory: Path) -> None:
+    """改回 json 格式时，把日志中的账本写回存储后端，再删除日志。"""
+    if not directory.is_dir():
+        return
+    try:
+        ledger_log = TransactionLog(directory)
+        if not ledger_log.exists():
+            return
+        records = list(ledger_log.iter_records())
+        # 确认已写盘后才删除日志，中途失败下次打开时会重试
+        if storage.save(TRANSACTIONS_KEY, records) and storage.flush():
+            ledger_log.clear()
+            logger.info("Moved %d ledger records from %s back inline", len(records), directory)
+    except Exception as exc:  # pylint: disable=broad-except
+        logger.error("Failed to move ledger log %s back inline: %s", directory, exc)
+
+
+class _StorageSpace:
+    """A namespace's backend and ledger log plus the number of callers using them."""
+
+    __slots__ = ("backend", "ledger_log", "users")
+
+    def __init__(self, namespace: str) -> None:
+        self.backend = _create_backend(namespace)
+        self.ledger_log = _create_ledger_log(namespace)
+        self.users = 0
+        # 账本格式切换后的迁移只在命名空间首次打开时做一次
+        if self.ledger_log is not None:
+            try:
+                _migrate_inline_ledger(self.backend, self.ledger_log)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.error("Ledger log migration failed, storing inline: %s", exc)
+                self.ledger_log = None
+        else:
+            _restore_logged_ledger(self.backend, _ledger_log_dir(namespace))
+
+
+# 每个命名空间（用户/租户）一套后端，进程内所有会话共享，读缓存随之共享；
+# 按最近使用排序，超过上限时关闭最久未用且无人使用的命名空间（默认命名空间常驻）。
+# 正在使用的命名空间不会被淘汰，因此同一目录永远只有一套后端与日志实例
+_spaces: OrderedDict[str, _StorageSpace] = OrderedDict()
+_max_namespaces = _resolve_max_namespaces()
+_spaces_lock = threading.Lock()
+_current_namespace: ContextVar[str] = ContextVar(
+    "wefinance_storage_namespace", default=DEFAULT_NAMESPACE
+)
+
+
+def set_storage_namespace(namespace: str | None) -> None:
+    """Route subsequent storage calls in this context to ``namespace``."""
+    _current_namespace.set((namespace or "").strip() or DEFAULT_NAMESPACE)
+
+
+def get_storage_namespace() -> str:
+    return _current_namespace.get()
+
+
+def _evict_idle_spaces() -> None:
+    """Close least recently used idle namespaces beyond the limit; caller holds the lock."""
+    for namespace in list(_spaces):
+        if len(_spaces) <= _max_namespaces:
+            break
+        space = _spaces[namespace]
+        if namespace == DEFAULT_NAMESPACE or space.users:
+            continue
+        del _spaces[namespace]
+        # 在锁内关闭：写完缓冲数据之前，同一命名空间不会被重新打开
+        try:
+            space.backend.close()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.error("Failed to close evicted storage %s: %s", namespace, exc)
+
+
+@contextmanager
+def _using_space(namespace: str | None = None) -> Iterator[_StorageSpace]:
+    """Borrow a namespace's space, creating it once; it is not evicted while borrowed."""
+    namespace = namespace or _current_namespace.get()
+    with _spaces_lock:
+        space = _spaces.get(namespace)
+        if space is None:
+            space = _StorageSpace(namespace)
+            _spaces[namespace] = space
+        else:
+            _spaces.move_to_end(namespace)
+        space.users += 1
+        _evict_idle_spaces()
+    try:
+        yield space
+    finally:
+        with _spaces_lock:
+            space.users -= 1
+            _evict_idle_spaces()
 
 
-_storage = FileStorageBackend()
+@contextmanager
+def storage_backend(namespace: str | None = None) -> Iterator[StorageBackend]:
+    """Borrow the shared backend of ``namespace`` (current one by default)."""
+    with _using_space(namespace) as space:
+        yield space.backend
 
 
-def save_to_storage(key: str, value: Any) -> bool:
+def save_to_storage(key: str, value: Any, namespace: str | None = None) -> bool:
     """
     Save a value to persistent storage.
 
     Args:
         key: Logical key without prefix.
         value: JSON-serialisable payload.
+        namespace: User/tenant namespace; defaults to the current context's.
     """
     try:
-        return _storage.save(key, value)
+        with _using_space(namespace) as space:
+            storage, ledger_log = space.backend, space.ledger_log
+            if ledger_log is not None and key == TRANSACTIONS_KEY:
+                ledger_log.replace(value)
+                return True
+            return storage.save(key, value)
     except Exception as exc:  # pragma: no cover - defensive
         logger.warning("Failed to save %s to storage: %s", key, exc)
         return False
 
 
-def load_from_storage(key: str, default: Any = None) -> Optional[Any]:
+def append_to_storage(
+    key: str, records: Iterable[Any], namespace: str | None = None
+) -> bool:
+    """
+    Append items to a persisted list without rewriting what is already stored.
+
+    With the ledger log (the default for the file backend), appending
+    transactions only writes the new lines; the SQLite backend inserts only
+    the new rows. Only ``WEFINANCE_LEDGER_FORMAT=json`` with the file backend
+    falls back to loading and rewriting the whole list.
+    """
+    records = list(records)
+    try:
+        with _using_space(namespace) as space:
+            storage, ledger_log = space.backend, space.ledger_log
+            if ledger_log is not None and key == TRANSACTIONS_KEY:
+                ledger_log.append(records)
+                return True
+            return storage.append(key, records)
+    except Exception as exc:  # pragma: no cover - defensive
+        logger.warning("Failed to append %s to storage: %s", key, exc)
+        return False
+
+
+def iter_from_storage(key: str, namespace: str | None = None) -> Iterator[Any]:
+    """Stream a persisted list; the ledger log yields records without loading it whole."""
+    with _using_space(namespace) as space:
+        if space.ledger_log is not None and key == TRANSACTIONS_KEY:
+            yield from space.ledger_log.iter_records()
+            return
+    yield from load_from_storage(key, [], namespace=namespace) or []
+
+
+def load_from_storage(
+    key: str, default: Any = None, namespace: str | None = None
+) -> Optional[Any]:
     """
     Load a value from persistent storage.
 
     Args:
         key: Logical key without prefix.
         default: Value returned when the key is missing.
+        namespace: User/tenant namespace; defaults to the current context's.
     """
     try:
-        return _storage.load(key, default)
+        with _using_space(namespace) as space:
+            storage, ledger_log = space.backend, space.ledger_log
+            if ledger_log is not None and key == TRANSACTIONS_KEY:
+                return list(ledger_log.iter_records())
+            return storage.load(key, default)
     except Exception as exc:  # pragma: no cover - defensive
         logger.warning("Failed to load %s from storage: %s", key, exc)
         return default
 
 
-def clear_all_storage() -> bool:
-    """Clear every persisted item."""
+def clear_all_storage(namespace: str | None = None) -> bool:
+    """Clear every persisted item of the current (or given) namespace."""
     try:
-        return _storage.clear()
+        with _using_space(namespace) as space:
+            if space.ledger_log is not None:
+                space.ledger_log.clear()
+            return space.backend.clear()
     except Exception as exc:  # pragma: no cover - defensive
         logger.error("Failed to clear storage: %s", exc)
         return False
+
+
+def flush_storage() -> bool:
+    """Write out buffered changes of every namespace (also runs at interpreter exit)."""
+    with _spaces_lock:
+        backends = [space.backend for space in _spaces.values()]
+    ok = True
+    for backend in backends:
+        try:
+            ok = backend.flush() and ok
+        except Exception as exc:  # pragma: no cover - defensive
+            logger.error("Failed to flush storage: %s", exc)
+            ok = False
+    return ok
+
+
+atexit.register(flush_storage)
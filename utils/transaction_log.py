@@ -0,0 +1,189 @@
+"""Append-only, segmented JSON Lines log used to persist the transaction ledger."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".jsonl"
+# 单个分段超过该大小后滚动到新文件，控制单个文件的读写粒度
+SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+
+_PUT_PREFIX = '{"op":"put"'
+_RESET_PREFIX = '{"op":"reset"'
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+class TransactionLog:
+    """
+    Ledger stored as numbered JSON Lines segments.
+
+    Each line is a ``put`` (one transaction) or a ``reset`` (hides everything
+    before it). Appends only write the new lines; :meth:`replace` writes a
+    fresh segment that starts with ``reset`` and then drops the older
+    segments, so a crash part-way through never loses the previous state.
+    Removing transactions is done by replacing the ledger.
+
+    Readers stream a snapshot (segment list and sizes taken under the lock);
+    segments dropped while a reader is active are unlinked once it finishes.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._readers = 0
+        # 有读取者时被替换下来的分段，待最后一个读取者结束后再删除
+        self._retired: List[Path] = []
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+
+    @staticmethod
+    def _segment_number(path: Path) -> int:
+        return int(path.name[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)])
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+    def _active_segment(self) -> Path:
+        segments = self._segments()
+        if not segments:
+            return self._segment_path(1)
+        latest = segments[-1]
+        if latest.stat().st_size >= SEGMENT_MAX_BYTES:
+            return self._segment_path(self._segment_number(latest) + 1)
+        return latest
+
+    @staticmethod
+    def _ends_with_newline(path: Path) -> bool:
+        try:
+            with path.open("rb") as handle:
+                handle.seek(-1, os.SEEK_END)
+                return handle.read(1) == b"\n"
+        except (FileNotFoundError, OSError):
+            # 文件不存在或为空
+            return True
+
+    def _write_lines(self, path: Path, lines: Iterable[str], mode: str = "a") -> int:
+        written = 0
+        # 上次崩溃可能留下半行，先补换行，避免与新记录粘连
+        needs_newline = mode == "a" and not self._ends_with_newline(path)
+        with path.open(mode, encoding="utf-8") as handle:
+            if needs_newline:
+                handle.write("\n")
+            for line in lines:
+                handle.write(line)
+                handle.write("\n")
+                written += 1
+            handle.flush()
+            os.fsync(handle.fileno())
+        return written
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Append transactions; cost is proportional to the new records only."""
+        with self._lock:
+            lines = (_dumps({"op": "put", "txn": dict(record)}) for record in records)
+            return self._write_lines(self._active_segment(), lines)
+
+    def replace(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Atomically swap the whole ledger for ``records``."""
+        with self._lock:
+            old_segments = self._segments()
+            number = self._segment_number(old_segments[-1]) + 1 if old_segments else 1
+            target = self._segment_path(number)
+            tmp_path = target.with_suffix(".tmp")
+            lines = [_dumps({"op": "reset"})]
+            lines.extend(_dumps({"op": "put", "txn": dict(r)}) for r in records)
+            try:
+                written = self._write_lines(tmp_path, lines, mode="w") - 1
+                os.replace(tmp_path, target)
+            except Exception:
+                tmp_path.unlink(missing_ok=True)
+                raise
+            self._retire(old_segments)
+            return written
+
+    def _retire(self, segments: List[Path]) -> None:
+        """Unlink superseded segments now, or after the active readers finish."""
+        if self._readers:
+            self._retired.extend(segments)
+            return
+        for segment in segments:
+            segment.unlink(missing_ok=True)
+
+    @staticmethod
+    def _read_lines(segment: Path, limit: int) -> Iterator[str]:
+        """Lines of ``segment`` within its first ``limit`` bytes (the snapshot)."""
+        consumed = 0
+        with segment.open("rb") as handle:
+            for raw in handle:
+                consumed += len(raw)
+                if consumed > limit:
+                    # 快照之后追加的内容（或尚未写完的半行）不在本次读取范围内
+                    break
+                yield raw.decode("utf-8", errors="replace")
+
+    @classmethod
+    def _last_reset(cls, segments: List[Tuple[Path, int]]) -> int:
+        """Index of the newest segment starting with ``reset`` (-1 if none)."""
+        # reset 只会出现在 replace 写出的分段首行，无需扫描全文
+        for seg_idx in range(len(segments) - 1, -1, -1):
+            segment, limit = segments[seg_idx]
+            first = next(cls._read_lines(segment, limit), "")
+            if first.startswith(_RESET_PREFIX):
+                return seg_idx
+        return -1
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """Stream live transactions in append order without loading whole segments."""
+        with self._lock:
+            # 快照分段及其当前大小；读取期间替换或清空不会删除这些分段
+            segments = [(path, path.stat().st_size) for path in self._segments()]
+            # 崩溃可能留下 reset 之前的旧分段，从最新的 reset 开始读
+            segments = segments[max(self._last_reset(segments), 0) :]
+            self._readers += 1
+        try:
+            for segment, limit in segments:
+                for line in self._read_lines(segment, limit):
+                    if not line.startswith(_PUT_PREFIX):
+                        continue
+                    try:
+                        record = json.loads(line)["txn"]
+                    except (ValueError, KeyError) as exc:
+                        # 崩溃可能留下半行，跳过即可
+                        logger.warning(
+                            "Skipping corrupt ledger line in %s: %s", segment, exc
+                        )
+                        continue
+                    yield record
+        finally:
+            with self._lock:
+                self._readers -= 1
+                if not self._readers and self._retired:
+                    retired, self._retired = self._retired, []
+                    self._retire(retired)
+
+    def exists(self) -> bool:
+        return bool(self._segments())
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._readers:
+                # 旧分段要等读取者结束才能删除，先写入空的 reset 分段，新读取立即看到空账本
+                self.replace([])
+            else:
+                self._retire(self._segments())
+
+
+__all__ = ["TransactionLog"]
@@ -4,7 +4,9 @@ from __future__ import annotations
 
 import hashlib
 from datetime import date, datetime
-from typing import Any
+from typing import Any, List
+
+import pandas as pd
 
 
 def _normalize_date(value: Any) -> str:
@@ -41,4 +43,44 @@ def generate_transaction_id(
     return digest[:16]
 
 
-__all__ = ["generate_transaction_id"]
+def generate_transaction_ids(
+    *,
+    merchants: pd.Series,
+    dates: pd.Series,
+    amounts: pd.Series,
+    currencies: pd.Series,
+    source_hash: str | None = None,
+    sequences: pd.Series | None = None,
+) -> List[str]:
+    """
+    向量化版本的 `generate_transaction_id`，逐行结果与之完全一致。
+
+    ``dates`` 为 datetime64 列时按ISO日期哈希，为文本列时按原文哈希（与逐行
+    传入字符串时相同）；拼接键在列上完成，仅剩逐行的 sha256。
+    """
+
+    if merchants.empty:
+        # 空列上 map 会退化为 float 列，无法与文本拼接
+        return []
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        date_keys = dates.dt.strftime("%Y-%m-%d")
+    else:
+        date_keys = dates.astype(str)
+    payload = (
+        merchants.astype(str).str.strip().str.lower()
+        + "|"
+        + date_keys
+        + "|"
+        + amounts.astype(float).map("{:.2f}".format)
+        + "|"
+        + currencies.fillna("").astype(str).replace("", "CNY").str.strip().str.upper()
+    )
+    if source_hash:
+        payload = payload + "|" + source_hash
+    if sequences is not None:
+        payload = payload + "|" + sequences.astype(str)
+    sha256 = hashlib.sha256
+    return [sha256(raw.encode("utf-8")).hexdigest()[:16] for raw in payload]
+
+
+__all__ = ["generate_transaction_id", "generate_transaction_ids"]
@@ -8,11 +8,11 @@ from __future__ import annotations
 
 import inspect
 from functools import lru_cache
-from typing import Any, Callable, Dict, List
+from typing import Any, Callable, Dict, List, Sequence
 
 import streamlit as st
 
-from models.entities import Transaction
+from models.entities import Transaction, TransactionRecord
 from utils.session import get_i18n, get_monthly_budget
 from utils.design_system import (
     COLORS,
@@ -53,7 +53,7 @@ def _resolve_width_param(component: Callable[..., Any]) -> str | None:
     return None
 
 
-def render_financial_health_card(transactions: List[Transaction]) -> None:
+def render_financial_health_card(transactions: Sequence[Transaction | TransactionRecord]) -> None:
     """
     渲染财务健康卡片（顶部状态栏）- 新设计
 